@@ -0,0 +1,221 @@
+import asyncio
+import itertools
+import time
+from collections import deque
+from contextlib import asynccontextmanager
+from dataclasses import dataclass
+from typing import Callable, Deque, Dict, Optional
+
+from fastapi import HTTPException, status
+from starlette.concurrency import run_in_threadpool
+
+from auth.models import TokenData, UserRole
+from config import settings
+from monitoring.metrics import REGISTRY
+
+
+@dataclass(frozen=True)
+class ClassPolicy:
+    weight: float           # share of inference slots while several classes are queued
+    rate: float             # sustained requests/second per user
+    burst: float            # token-bucket depth per user
+    shed_after: Optional[float]  # shed new arrivals once queueing delay passes this many SLOs
+
+
+# Highest priority first. Admin exports and unauthenticated callers share the bulk tier.
+CLASS_POLICIES: Dict[str, ClassPolicy] = {
+    "doctor": ClassPolicy(weight=8, rate=20, burst=40, shed_after=None),
+    "patient": ClassPolicy(weight=3, rate=5, burst=20, shed_after=2.0),
+    "bulk": ClassPolicy(weight=1, rate=50, burst=100, shed_after=1.0),
+}
+ROLE_CLASSES = {UserRole.DOCTOR: "doctor", UserRole.PATIENT: "patient", UserRole.ADMIN: "bulk"}
+
+_QUEUE_DELAY = REGISTRY.histogram(
+    "admission_queue_delay_seconds", "Time inference requests waited for a slot", ("class",))
+_DECISIONS = REGISTRY.counter(
+    "admission_decisions_total", "Admission outcomes per priority class", ("class", "outcome"))
+_QUEUE_DEPTH = REGISTRY.gauge("admission_queue_depth", "Requests waiting for an inference slot", ("class",))
+
+
+def request_class(token: Optional[TokenData]) -> str:
+    return ROLE_CLASSES.get(token.role, "bulk") if token is not None else "bulk"
+
+
+class TokenBucket:
+    __slots__ = ("rate", "burst", "tokens", "updated")
+    
+    def __init__(self, rate: float, burst: float, now: float):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = now
+    
+    def take(self, now: float) -> float:
+        """0 if a token was taken, else seconds until one is available"""
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return 0.0
+        return (1 - self.tokens) / self.rate
+
+
+class _Waiter:
+    __slots__ = ("tag", "seq", "enqueued", "future")
+    
+    def __init__(self, tag: float, seq: int, enqueued: float, future: asyncio.Future):
+        self.tag = tag
+        self.seq = seq
+        self.enqueued = enqueued
+        self.future = future
+
+
+class AdmissionController:
+    """Per-worker admission control for inference work, by the caller's role
+    
+    At most `concurrency` requests run inference at once; the rest wait in
+    one FIFO per priority class. Slots are handed out by weighted fair
+    queueing (start-time tags advanced by 1/weight), so under contention
+    doctors get 8 slots for every 3 patient and 1 bulk slot, and no class
+    starves. Each user (or client address, when anonymous) has a token
+    bucket sized by class. When the oldest queued request has waited past
+    `slo` seconds, new bulk arrivals are rejected, then patient arrivals at
+    twice the SLO; doctor traffic is only bounded by `max_queue`.
+    
+    Single event loop only: state is touched from coroutines, never threads.
+    """
+    
+    def __init__(self, concurrency: int, slo: float, max_queue: int,
+                 policies: Dict[str, ClassPolicy] = CLASS_POLICIES, clock: Callable[[], float] = time.monotonic):
+        self.concurrency = concurrency
+        self.slo = slo
+        self.max_queue = max_queue
+        self.policies = policies
+        self.clock = clock
+        self.active = 0
+        self._queues: Dict[str, Deque[_Waiter]] = {name: deque() for name in policies}
+        self._last_tag = {name: 0.0 for name in policies}
+        self._virtual_time = 0.0
+        self._seq = itertools.count()
+        self._buckets: Dict[str, TokenBucket] = {}
+        self._delay = {name: _QUEUE_DELAY.labels(name) for name in policies}
+        self._outcomes = {
+            (name, outcome): _DECISIONS.labels(name, outcome)
+            for name in policies for outcome in ("admitted", "rate_limited", "shed", "queue_full")
+        }
+    
+    def queue_delay(self) -> float:
+        """Age of the oldest queued request; 0 when nothing waits"""
+        heads = [queue[0].enqueued for queue in self._queues.values() if queue]
+        return self.clock() - min(heads) if heads else 0.0
+    
+    def _reject(self, name: str, outcome: str, code: int, detail: str, retry_after: float):
+        self._outcomes[name, outcome].inc()
+        raise HTTPException(status_code=code, detail=detail,
+                            headers={"Retry-After": str(max(1, round(retry_after)))})
+    
+    def _check_rate(self, name: str, caller: str, now: float):
+        bucket = self._buckets.get(caller)
+        if bucket is None:
+            if len(self._buckets) >= 10_000:
+                # Full buckets belong to idle callers and are equivalent to fresh ones
+                for key in [k for k, b in self._buckets.items()
+                            if b.tokens + (now - b.updated) * b.rate >= b.burst]:
+                    del self._buckets[key]
+            policy = self.policies[name]
+            bucket = self._buckets[caller] = TokenBucket(policy.rate, policy.burst, now)
+        wait = bucket.take(now)
+        if wait:
+            self._reject(name, "rate_limited", status.HTTP_429_TOO_MANY_REQUESTS, "Rate limit exceeded", wait)
+    
+    async def acquire(self, token: Optional[TokenData], client: Optional[str] = None) -> str:
+        """Wait for an inference slot; raises 429 (rate) or 503 (shed / queue full)"""
+        name = request_class(token)
+        now = self.clock()
+        self._check_rate(name, token.user_id if token is not None else f"addr:{client}", now)
+        
+        queued = any(self._queues.values())
+        if self.active < self.concurrency and not queued:
+            self.active += 1
+            self._outcomes[name, "admitted"].inc()
+            self._delay[name].observe(0.0)
+            return name
+        
+        policy = self.policies[name]
+        delay = self.queue_delay()
+        if policy.shed_after is not None and delay > policy.shed_after * self.slo:
+            self._reject(name, "shed", status.HTTP_503_SERVICE_UNAVAILABLE, "Overloaded, try again later", delay)
+        queue = self._queues[name]
+        if len(queue) >= self.max_queue:
+            self._reject(name, "queue_full", status.HTTP_503_SERVICE_UNAVAILABLE, "Overloaded, try again later",
+                         delay)
+        
+        start = max(self._virtual_time, self._last_tag[name])
+        self._last_tag[name] = start + 1 / policy.weight
+        waiter = _Waiter(start, next(self._seq), now, asyncio.get_running_loop().create_future())
+        queue.append(waiter)
+        try:
+            await waiter.future
+        except asyncio.CancelledError:
+            if waiter.future.done() and not waiter.future.cancelled():
+                # Granted and cancelled in the same tick: pass the slot on
+                self.release()
+            elif waiter in queue:
+                # Otherwise release() may already have popped (and skipped) it
+                queue.remove(waiter)
+            raise
+        self._outcomes[name, "admitted"].inc()
+        self._delay[name].observe(self.clock() - waiter.enqueued)
+        return name
+    
+    def release(self):
+        """Hand the slot to the queued request with the smallest tag, or free it"""
+        while True:
+            best = None
+            for queue in self._queues.values():
+                if queue and (best is None or (queue[0].tag, queue[0].seq) < (best[0].tag, best[0].seq)):
+                    best = queue
+            if best is None:
+                self.active -= 1
+                return
+            waiter = best.popleft()
+            # Cancelled while queued, and its handler hasn't run yet to dequeue itself
+            if waiter.future.done():
+                continue
+            self._virtual_time = waiter.tag
+            waiter.future.set_result(None)
+            return
+    
+    @asynccontextmanager
+    async def slot(self, token: Optional[TokenData], client: Optional[str] = None):
+        name = await self.acquire(token, client)
+        try:
+            yield name
+        finally:
+            self.release()
+    
+    async def run(self, token: Optional[TokenData], client: Optional[str], fn, *args, **kwargs):
+        """Run blocking inference in the threadpool once admitted"""
+        async with self.slot(token, client):
+            return await run_in_threadpool(fn, *args, **kwargs)
+    
+    def stats(self) -> Dict:
+        return {
+            "active": self.active,
+            "concurrency": self.concurrency,
+            "queue_delay_seconds": self.queue_delay(),
+            "queued": {name: len(queue) for name, queue in self._queues.items()},
+            "slo_seconds": self.slo,
+        }
+
+
+admission = AdmissionController(settings.ADMISSION_CONCURRENCY, settings.ADMISSION_SLO_SECONDS,
+                                settings.ADMISSION_MAX_QUEUE)
+
+
+def _collect_queue_depth():
+    for name, depth in admission.stats()["queued"].items():
+        _QUEUE_DEPTH.labels(name).set(depth)
+
+
+REGISTRY.add_collector(_collect_queue_depth)
@@ -1,5 +1,5 @@
 from enum import Enum
-from pydantic import BaseModel
+from pydantic import BaseModel, ConfigDict
 from typing import Optional
 from datetime import datetime
 
@@ -16,10 +16,14 @@ class User(BaseModel):
     is_active: bool = True
 
 class TokenData(BaseModel):
+    # Frozen so verified instances can be shared across requests by the token cache
+    model_config = ConfigDict(frozen=True)
+    
     user_id: str
     email: str
     role: UserRole
     exp: float
+    jti: Optional[str] = None
 
 class LoginRequest(BaseModel):
     email: str
@@ -0,0 +1,47 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+
+import bcrypt
+
+from config import settings
+
+# bcrypt releases the GIL while hashing, so a small dedicated pool keeps a burst
+# of logins from blocking the event loop or exhausting the shared threadpool
+# that sync endpoints run on.
+_hash_executor = ThreadPoolExecutor(
+    max_workers=settings.PASSWORD_HASH_WORKERS,
+    thread_name_prefix="password-hash",
+)
+
+# bcrypt only consumes the first 72 bytes of a password
+_BCRYPT_MAX_BYTES = 72
+
+
+def _encode(password: str) -> bytes:
+    return password.encode("utf-8")[:_BCRYPT_MAX_BYTES]
+
+
+def hash_password_sync(password: str) -> str:
+    """Hash a password with a per-password salt (blocking)"""
+    salt = bcrypt.gensalt(rounds=settings.BCRYPT_ROUNDS)
+    return bcrypt.hashpw(_encode(password), salt).decode("ascii")
+
+
+def verify_password_sync(password: str, password_hash: str) -> bool:
+    """Constant-time check of a password against a bcrypt hash (blocking)"""
+    try:
+        return bcrypt.checkpw(_encode(password), password_hash.encode("ascii"))
+    except ValueError:
+        return False
+
+
+async def hash_password(password: str) -> str:
+    """Hash a password on the hashing pool without blocking the event loop"""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_hash_executor, hash_password_sync, password)
+
+
+async def verify_password(password: str, password_hash: str) -> bool:
+    """Verify a password on the hashing pool without blocking the event loop"""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_hash_executor, verify_password_sync, password, password_hash)
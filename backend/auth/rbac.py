@@ -1,13 +1,12 @@
 from enum import Enum
-from typing import List
+from typing import Dict, FrozenSet, Optional
 from fastapi import HTTPException, status, Depends
-from fastapi.security import HTTPBearer, HTTPAuthCredentials
-import jwt
-from config import settings
-from datetime import datetime, timedelta
+from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from auth.models import UserRole, TokenData
+from auth.tokens import TokenError, TokenExpiredError, TokenRevokedError, token_service
 
 security = HTTPBearer()
+optional_security = HTTPBearer(auto_error=False)
 
 class Permission(str, Enum):
     # Patient permissions
@@ -29,67 +28,67 @@ class Permission(str, Enum):
     VIEW_ANALYTICS = "view_analytics"
 
 # Role-Permission Mapping
-ROLE_PERMISSIONS = {
-    UserRole.PATIENT: [
+ROLE_PERMISSIONS: Dict[UserRole, FrozenSet[Permission]] = {
+    UserRole.PATIENT: frozenset({
         Permission.VIEW_OWN_RECORDS,
         Permission.EDIT_OWN_RECORDS,
         Permission.VIEW_OWN_PREDICTIONS,
         Permission.UPLOAD_SCANS,
-    ],
-    UserRole.DOCTOR: [
+    }),
+    UserRole.DOCTOR: frozenset({
         Permission.VIEW_ASSIGNED_PATIENTS,
         Permission.VIEW_PREDICTIONS,
         Permission.GENERATE_REPORTS,
         Permission.PRESCRIBE,
-    ],
-    UserRole.ADMIN: [p for p in Permission],
+    }),
+    UserRole.ADMIN: frozenset(Permission),
 }
 
-def create_access_token(user_id: str, email: str, role: UserRole, expires_delta: timedelta = None):
-    if expires_delta is None:
-        expires_delta = timedelta(minutes=settings.ACCESS_TOKEN_EXPIRE_MINUTES)
-    
-    expire = datetime.utcnow() + expires_delta
-    token_data = TokenData(user_id=user_id, email=email, role=role, exp=expire.timestamp())
-    
-    encoded_jwt = jwt.encode(
-        token_data.dict(),
-        settings.SECRET_KEY,
-        algorithm=settings.ALGORITHM
-    )
-    return encoded_jwt
+# One bit per permission; each role's grants folded into a single int so a
+# permission check is one dict lookup and an AND
+PERMISSION_BITS: Dict[Permission, int] = {p: 1 << i for i, p in enumerate(Permission)}
+ROLE_PERMISSION_MASKS: Dict[UserRole, int] = {
+    role: sum(PERMISSION_BITS[p] for p in permissions)
+    for role, permissions in ROLE_PERMISSIONS.items()
+}
+
+def has_permission(role: UserRole, permission: Permission) -> bool:
+    return bool(ROLE_PERMISSION_MASKS.get(role, 0) & PERMISSION_BITS[permission])
 
-async def verify_token(credentials: HTTPAuthCredentials = Depends(security)) -> TokenData:
+def decode_token(token: str) -> TokenData:
+    """Verify an access token, mapping token errors to 401s"""
     try:
-        payload = jwt.decode(
-            credentials.credentials,
-            settings.SECRET_KEY,
-            algorithms=[settings.ALGORITHM]
-        )
-        user_id = payload.get("user_id")
-        email = payload.get("email")
-        role = payload.get("role")
-        
-        if not all([user_id, email, role]):
-            raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid token")
-        
-        return TokenData(user_id=user_id, email=email, role=UserRole(role), exp=payload.get("exp"))
-    except jwt.ExpiredSignatureError:
+        return token_service.verify(token)
+    except TokenExpiredError:
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Token expired")
-    except jwt.InvalidTokenError:
+    except TokenRevokedError:
+        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Token revoked")
+    except TokenError:
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid token")
 
+async def verify_token(credentials: HTTPAuthorizationCredentials = Depends(security)) -> TokenData:
+    return decode_token(credentials.credentials)
+
+async def optional_token(
+    credentials: Optional[HTTPAuthorizationCredentials] = Depends(optional_security),
+) -> Optional[TokenData]:
+    """Token data if a bearer token was sent (still 401 if it is invalid), else None"""
+    return decode_token(credentials.credentials) if credentials is not None else None
+
 def require_role(*allowed_roles: UserRole):
+    allowed = frozenset(allowed_roles)
+    
     async def role_checker(token: TokenData = Depends(verify_token)) -> TokenData:
-        if token.role not in allowed_roles:
+        if token.role not in allowed:
             raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Insufficient permissions")
         return token
     return role_checker
 
 def require_permission(permission: Permission):
+    bit = PERMISSION_BITS[permission]
+    
     async def permission_checker(token: TokenData = Depends(verify_token)) -> TokenData:
-        role_permissions = ROLE_PERMISSIONS.get(token.role, [])
-        if permission not in role_permissions:
+        if not ROLE_PERMISSION_MASKS.get(token.role, 0) & bit:
             raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail=f"Missing permission: {permission}")
         return token
     return permission_checker
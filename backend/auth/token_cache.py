@@ -0,0 +1,59 @@
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+from typing import Optional, Tuple
+
+from auth.models import TokenData
+
+
+class VerifiedTokenCache:
+    """Bounded LRU of already-verified JWTs, keyed by a digest of the raw token"""
+    
+    def __init__(self, maxsize: int = 4096):
+        self.maxsize = maxsize
+        self._entries: "OrderedDict[bytes, Tuple[float, TokenData]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+    
+    @staticmethod
+    def _key(token: str) -> bytes:
+        return hashlib.blake2b(token.encode(), digest_size=16).digest()
+    
+    def get(self, token: str) -> Optional[TokenData]:
+        """Return cached token data, or None if absent or past its `exp`"""
+        key = self._key(token)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            if entry[0] <= time.time():
+                del self._entries[key]
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+    
+    def put(self, token: str, token_data: TokenData):
+        """Remember a verified token until its expiry"""
+        key = self._key(token)
+        with self._lock:
+            self._entries[key] = (token_data.exp, token_data)
+            self._entries.move_to_end(key)
+            if len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+    
+    def discard(self, token: str):
+        """Drop a token so the next request re-verifies it"""
+        with self._lock:
+            self._entries.pop(self._key(token), None)
+    
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+    
+    def __len__(self) -> int:
+        return len(self._entries)
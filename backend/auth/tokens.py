@@ -0,0 +1,345 @@
+import fcntl
+import hashlib
+import heapq
+import logging
+import os
+import tempfile
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from typing import Dict, List, Optional, Tuple
+
+import jwt
+from jwt.algorithms import get_default_algorithms
+
+from auth.models import TokenData, UserRole
+from auth.token_cache import VerifiedTokenCache
+from config import settings
+
+logger = logging.getLogger(__name__)
+
+ACCESS = "access"
+REFRESH = "refresh"
+# Rewrite the revocation log once it holds this many lines, over half of them expired
+COMPACT_MIN_LINES = 4096
+
+
+class TokenError(Exception):
+    """Token could not be verified"""
+
+
+class TokenExpiredError(TokenError):
+    pass
+
+
+class TokenRevokedError(TokenError):
+    pass
+
+
+class RevocationList:
+    """Revoked token ids held as 128-bit ints, synced from an append-only file
+    
+    Every worker appends the tokens it revokes to the shared log and tails it
+    at most once per `sync_interval`, so a revocation issued on one worker
+    reaches the others within that interval without a lookup per request.
+    Once mostly expired, the log is rewritten with only its live entries and
+    renamed into place; appends and rewrites exclude each other through an
+    flock on `<path>.lock`, and readers notice the new file by its inode and
+    re-read it from the start.
+    """
+    
+    def __init__(self, path: Optional[str] = None, sync_interval: float = 5.0):
+        self.path = path
+        self.sync_interval = sync_interval
+        self._revoked: set = set()
+        self._expiry_heap: List[Tuple[float, int]] = []
+        self._inode: Optional[int] = None
+        self._offset = 0
+        self._lines = 0
+        self._last_sync = 0.0
+        self._lock = threading.Lock()
+    
+    @staticmethod
+    def _as_int(jti: str) -> int:
+        try:
+            return int(jti, 16)
+        except ValueError:
+            # Ids minted elsewhere need not be hex; fold them to 128 bits
+            return int.from_bytes(hashlib.blake2b(jti.encode(), digest_size=16).digest(), "big")
+    
+    def __contains__(self, jti: str) -> bool:
+        return self._as_int(jti) in self._revoked
+    
+    def __len__(self) -> int:
+        return len(self._revoked)
+    
+    def _add(self, key: int, exp: float):
+        if key not in self._revoked:
+            self._revoked.add(key)
+            heapq.heappush(self._expiry_heap, (exp, key))
+    
+    def _prune(self, now: float):
+        # Once a token has expired, signature checks reject it anyway
+        heap = self._expiry_heap
+        while heap and heap[0][0] <= now:
+            _, key = heapq.heappop(heap)
+            self._revoked.discard(key)
+    
+    @contextmanager
+    def _file_lock(self, exclusive: bool):
+        """Cross-process lock on the log; a separate file, so it outlives the log's rename"""
+        with open(f"{self.path}.lock", "a") as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH)
+            yield
+    
+    def _append(self, key: int, exp: float):
+        with open(self.path, "a") as f:
+            f.write(f"{key:032x} {exp:.0f}\n")
+    
+    def _read_new(self):
+        """Apply lines added to the log since the last read (caller holds _lock)"""
+        try:
+            f = open(self.path)
+        except FileNotFoundError:
+            return
+        with f:
+            info = os.fstat(f.fileno())
+            if info.st_ino != self._inode or info.st_size < self._offset:
+                # Rewritten by some worker's compaction: start over on the new file
+                self._inode, self._offset, self._lines = info.st_ino, 0, 0
+            f.seek(self._offset)
+            for line in f:
+                if not line.endswith("\n"):
+                    break  # partial write; pick it up next sync
+                self._offset += len(line)
+                self._lines += 1
+                jti, exp = line.split()
+                self._add(int(jti, 16), float(exp))
+    
+    def _compaction_due(self) -> bool:
+        return self._lines >= COMPACT_MIN_LINES and self._lines > 2 * len(self._revoked)
+    
+    def _compact(self, now: float):
+        """Atomically replace the log with its unexpired entries (caller holds _lock)"""
+        with self._file_lock(exclusive=True):
+            # Another worker may have compacted first, or appended since our last read
+            self._read_new()
+            self._prune(now)
+            if not self._compaction_due():
+                return
+            live = sorted(self._expiry_heap)
+            tmp = None
+            try:
+                fd, tmp = tempfile.mkstemp(prefix=".revoked-", dir=os.path.dirname(os.path.abspath(self.path)))
+                with os.fdopen(fd, "w") as f:
+                    f.writelines(f"{key:032x} {exp:.0f}\n" for exp, key in live)
+                    size = f.tell()
+                os.replace(tmp, self.path)
+            except OSError:
+                logger.warning("Failed to compact the token revocation log %s", self.path, exc_info=True)
+                if tmp is not None and os.path.exists(tmp):
+                    os.unlink(tmp)
+                return
+            self._inode, self._offset, self._lines = os.stat(self.path).st_ino, size, len(live)
+    
+    def revoke(self, jti: str, exp: float):
+        key = self._as_int(jti)
+        with self._lock:
+            self._add(key, exp)
+            if self.path:
+                with self._file_lock(exclusive=False):
+                    self._append(key, exp)
+    
+    def claim(self, jti: str, exp: float) -> bool:
+        """Revoke `jti` unless it already is, as one step across every worker sharing the log
+        
+        For single-use tokens: of several redemptions racing on any workers,
+        exactly one gets True.
+        """
+        key = self._as_int(jti)
+        with self._lock:
+            if not self.path:
+                if key in self._revoked:
+                    return False
+                self._add(key, exp)
+                return True
+            with self._file_lock(exclusive=True):
+                self._read_new()
+                if key in self._revoked:
+                    return False
+                self._add(key, exp)
+                self._append(key, exp)
+            return True
+    
+    def sync(self, force: bool = False):
+        """Pull revocations written by other workers since the last sync"""
+        now = time.time()
+        if not force and now - self._last_sync < self.sync_interval:
+            return
+        with self._lock:
+            self._last_sync = now
+            if self.path:
+                self._read_new()
+            self._prune(now)
+            if self.path and self._compaction_due():
+                self._compact(now)
+
+
+class TokenService:
+    """Issues and verifies access/refresh JWTs with keys parsed once at startup
+    
+    HMAC algorithms sign and verify with `secret_key`. Asymmetric algorithms
+    (RS*/PS*/ES*/EdDSA) sign with `private_key` and verify with `public_key`;
+    a service built with only the public key can verify but not issue, which
+    is how edge workers run without holding the signing secret.
+    """
+    
+    def __init__(
+        self,
+        algorithm: str = "HS256",
+        secret_key: Optional[str] = None,
+        private_key: Optional[str] = None,
+        public_key: Optional[str] = None,
+        access_ttl: float = 30 * 60,
+        refresh_ttl: float = 7 * 24 * 3600,
+        cache_size: int = 4096,
+        revocation_list: Optional[RevocationList] = None,
+    ):
+        self.algorithm = algorithm
+        self.access_ttl = access_ttl
+        self.refresh_ttl = refresh_ttl
+        self.cache = VerifiedTokenCache(maxsize=cache_size)
+        self.revoked = revocation_list if revocation_list is not None else RevocationList()
+        
+        algo = get_default_algorithms()[algorithm]
+        if algorithm.startswith("HS"):
+            if not secret_key:
+                raise ValueError(f"{algorithm} requires a secret key")
+            self._signing_key = self._verifying_key = algo.prepare_key(secret_key)
+        else:
+            if not public_key:
+                raise ValueError(f"{algorithm} requires a public key")
+            self._signing_key = algo.prepare_key(private_key) if private_key else None
+            self._verifying_key = algo.prepare_key(public_key)
+        self._algorithms = [algorithm]
+        self._decode_options = {"require": ["exp"]}
+    
+    @property
+    def can_issue(self) -> bool:
+        return self._signing_key is not None
+    
+    def _issue(self, user_id: str, email: str, role: UserRole, token_type: str,
+               ttl: float) -> Tuple[str, Dict]:
+        if self._signing_key is None:
+            raise TokenError("Token service is configured for verification only")
+        now = int(time.time())
+        claims = {
+            "user_id": user_id,
+            "email": email,
+            "role": UserRole(role).value,
+            "type": token_type,
+            "jti": uuid.uuid4().hex,
+            "iat": now,
+            "exp": now + int(ttl),
+        }
+        return jwt.encode(claims, self._signing_key, algorithm=self.algorithm), claims
+    
+    def create_access_token(self, user_id: str, email: str, role: UserRole,
+                            ttl: Optional[float] = None) -> str:
+        return self._issue(user_id, email, role, ACCESS, ttl or self.access_ttl)[0]
+    
+    def create_refresh_token(self, user_id: str, email: str, role: UserRole) -> str:
+        return self._issue(user_id, email, role, REFRESH, self.refresh_ttl)[0]
+    
+    def _decode(self, token: str) -> Dict:
+        try:
+            return jwt.decode(token, self._verifying_key, algorithms=self._algorithms,
+                              options=self._decode_options)
+        except jwt.ExpiredSignatureError:
+            raise TokenExpiredError("Token expired")
+        except jwt.InvalidTokenError:
+            raise TokenError("Invalid token")
+    
+    def _to_token_data(self, payload: Dict) -> TokenData:
+        user_id = payload.get("user_id")
+        email = payload.get("email")
+        role = payload.get("role")
+        if not all([user_id, email, role]):
+            raise TokenError("Invalid token")
+        try:
+            return TokenData(user_id=user_id, email=email, role=UserRole(role),
+                             exp=payload["exp"], jti=payload.get("jti"))
+        except ValueError:
+            raise TokenError("Invalid token")
+    
+    def verify(self, token: str, token_type: str = ACCESS) -> TokenData:
+        """Verify a token, answering repeat presentations from the cache"""
+        self.revoked.sync()
+        if token_type == ACCESS:
+            cached = self.cache.get(token)
+            if cached is not None:
+                if cached.jti and cached.jti in self.revoked:
+                    self.cache.discard(token)
+                    raise TokenRevokedError("Token revoked")
+                return cached
+        
+        payload = self._decode(token)
+        # Tokens minted before the type claim existed were all access tokens
+        if payload.get("type", ACCESS) != token_type:
+            raise TokenError("Invalid token type")
+        token_data = self._to_token_data(payload)
+        if token_data.jti and token_data.jti in self.revoked:
+            raise TokenRevokedError("Token revoked")
+        
+        if token_type == ACCESS:
+            self.cache.put(token, token_data)
+        return token_data
+    
+    def refresh(self, refresh_token: str) -> Tuple[str, str]:
+        """Exchange a refresh token for a new access/refresh pair (rotating it)
+        
+        verify() checks a revocation list up to `sync_interval` old; the claim
+        re-reads the shared log under its lock, so a refresh token redeemed on
+        two workers at once still yields only one new pair.
+        """
+        token_data = self.verify(refresh_token, REFRESH)
+        if token_data.jti and not self.revoked.claim(token_data.jti, token_data.exp):
+            raise TokenRevokedError("Token revoked")
+        return (
+            self.create_access_token(token_data.user_id, token_data.email, token_data.role),
+            self.create_refresh_token(token_data.user_id, token_data.email, token_data.role),
+        )
+    
+    def revoke(self, token: str):
+        """Revoke a token of either type; invalid or expired tokens are ignored"""
+        try:
+            payload = jwt.decode(token, self._verifying_key, algorithms=self._algorithms,
+                                 options={"verify_exp": False})
+        except jwt.InvalidTokenError:
+            return
+        if payload.get("jti") and payload.get("exp"):
+            self.revoked.revoke(payload["jti"], payload["exp"])
+        self.cache.discard(token)
+
+
+def _read_key(path: Optional[str]) -> Optional[str]:
+    if not path:
+        return None
+    with open(path) as f:
+        return f.read()
+
+
+token_service = TokenService(
+    algorithm=settings.ALGORITHM,
+    secret_key=settings.SECRET_KEY if settings.ALGORITHM.startswith("HS") else None,
+    private_key=_read_key(settings.JWT_PRIVATE_KEY_PATH),
+    public_key=_read_key(settings.JWT_PUBLIC_KEY_PATH),
+    access_ttl=settings.ACCESS_TOKEN_EXPIRE_MINUTES * 60,
+    refresh_ttl=settings.REFRESH_TOKEN_EXPIRE_DAYS * 24 * 3600,
+    cache_size=settings.TOKEN_CACHE_SIZE,
+    revocation_list=RevocationList(
+        path=settings.TOKEN_REVOCATION_PATH,
+        sync_interval=settings.TOKEN_REVOCATION_SYNC_SECONDS,
+    ),
+)
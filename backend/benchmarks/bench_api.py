@@ -0,0 +1,153 @@
+"""
+API benchmarks: /api/v1/predictions/diagnose through an in-process ASGI
+client and under concurrent HTTP load against a uvicorn subprocess, plus
+PDF report render time.
+
+Run from the backend directory:
+    python -m benchmarks.bench_api [--connections 16 --duration 10] [--output api.json]
+"""
+
+import argparse
+import asyncio
+import os
+import subprocess
+import sys
+import time
+
+import httpx
+
+from benchmarks.fixtures import SEED, synthetic_features, trained_predictor
+from benchmarks.harness import measure, measure_async, summarize, write_report
+from config import settings
+
+BACKEND_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+DIAGNOSE_PATH = f"{settings.API_V1_STR}/predictions/diagnose"
+FEATURES = ["age", "temperature", "cough_severity", "fatigue", "body_ache", "aqi", "humidity", "temperature_env"]
+
+
+def _payloads(n: int):
+    return [dict(zip(FEATURES, map(float, row))) for row in synthetic_features(n, seed=SEED + 3)]
+
+
+async def _bench_asgi(iterations: int) -> dict:
+    from ml.registry import live_model
+    import main
+    
+    live_model.set(trained_predictor())
+    payloads = _payloads(64)
+    counter = iter(range(10 ** 9))
+    transport = httpx.ASGITransport(app=main.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        async def call():
+            response = await client.post(DIAGNOSE_PATH, json=payloads[next(counter) % len(payloads)])
+            response.raise_for_status()
+        return await measure_async(call, iterations)
+
+
+def _bench_pdf(iterations: int) -> dict:
+    from routers.reports import ReportRequest, generate_pdf_report
+    
+    request = ReportRequest(
+        patient_name="Benchmark Patient",
+        patient_id="bench-001",
+        disease_prediction="Flu",
+        confidence=0.82,
+        environmental_data={"aqi": 142, "humidity": 71, "temperature": 31},
+        recommendations=["Rest", "Hydrate", "Follow up in 48 hours"],
+    )
+    loop = asyncio.new_event_loop()
+    try:
+        return measure(lambda: loop.run_until_complete(generate_pdf_report(request)), iterations)
+    finally:
+        loop.close()
+
+
+async def _load(url: str, connections: int, duration: float) -> dict:
+    """Closed-loop load: `connections` clients each sending back-to-back requests"""
+    payloads = _payloads(256)
+    samples, errors = [], 0
+    deadline = time.perf_counter() + duration
+    limits = httpx.Limits(max_connections=connections, max_keepalive_connections=connections)
+    
+    async with httpx.AsyncClient(base_url=url, limits=limits, timeout=30) as client:
+        async def worker(offset: int):
+            nonlocal errors
+            i = offset
+            while time.perf_counter() < deadline:
+                start = time.perf_counter_ns()
+                try:
+                    response = await client.post(DIAGNOSE_PATH, json=payloads[i % len(payloads)])
+                    response.raise_for_status()
+                    samples.append(time.perf_counter_ns() - start)
+                except httpx.HTTPError:
+                    errors += 1
+                i += connections
+        
+        start = time.perf_counter()
+        await asyncio.gather(*(worker(c) for c in range(connections)))
+        elapsed = time.perf_counter() - start
+    
+    stats = summarize(samples) if samples else {}
+    # Per-call throughput is meaningless with concurrent clients; report the aggregate instead
+    stats.pop("throughput_per_s", None)
+    stats.update({
+        "connections": connections,
+        "duration_s": elapsed,
+        "requests_per_s": len(samples) / elapsed,
+        "errors": errors,
+    })
+    return stats
+
+
+def _bench_http(connections: int, duration: float, port: int) -> dict:
+    predictor = trained_predictor()
+    # An empty registry makes the server fall back to MODEL_PATH
+    env = dict(os.environ, MODEL_PATH=predictor.model_path,
+               MODEL_REGISTRY_DIR=os.path.join(predictor.model_path, "registry"))
+    server = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app", "--port", str(port), "--log-level", "warning"],
+        cwd=BACKEND_DIR, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+    url = f"http://127.0.0.1:{port}"
+    try:
+        for _ in range(300):
+            try:
+                if httpx.get(f"{url}/health", timeout=1).status_code == 200:
+                    break
+            except httpx.HTTPError:
+                pass
+            time.sleep(0.1)
+        else:
+            raise RuntimeError("uvicorn did not become healthy")
+        return asyncio.run(_load(url, connections, duration))
+    finally:
+        server.terminate()
+        server.wait(timeout=10)
+
+
+def run(iterations: int = 300, connections: int = 16, duration: float = 10.0,
+        port: int = 8765, http: bool = True) -> dict:
+    results = {
+        "diagnose_asgi": asyncio.run(_bench_asgi(iterations)),
+        "pdf_report_render": _bench_pdf(iterations),
+    }
+    if http:
+        results["diagnose_http_load"] = _bench_http(connections, duration, port)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--iterations", type=int, default=300)
+    parser.add_argument("--connections", type=int, default=16)
+    parser.add_argument("--duration", type=float, default=10.0)
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--no-http", action="store_true", help="skip the uvicorn load test")
+    parser.add_argument("--output")
+    args = parser.parse_args()
+    results = run(args.iterations, args.connections, args.duration, args.port, not args.no_http)
+    write_report("api", results, args.output)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,109 @@
+"""
+Authenticated request overhead benchmark.
+
+Run from the backend directory:
+    python -m benchmarks.bench_auth [--output auth.json]
+"""
+
+import argparse
+import asyncio
+import time
+
+from fastapi import Depends, FastAPI
+import httpx
+
+from auth.models import TokenData, UserRole
+from auth.passwords import hash_password_sync, verify_password
+from auth.rbac import Permission, ROLE_PERMISSIONS, decode_token, has_permission, require_permission
+from auth.tokens import token_service
+from benchmarks.harness import measure, measure_async, summarize, write_report
+
+
+def _build_app() -> FastAPI:
+    app = FastAPI()
+    
+    @app.get("/open")
+    async def open_route():
+        return {"ok": True}
+    
+    @app.get("/protected")
+    async def protected_route(token: TokenData = Depends(require_permission(Permission.VIEW_PREDICTIONS))):
+        return {"ok": True}
+    
+    return app
+
+
+async def _request_overhead(token: str, iterations: int) -> dict:
+    transport = httpx.ASGITransport(app=_build_app())
+    headers = {"Authorization": f"Bearer {token}"}
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        open_stats = await measure_async(lambda: client.get("/open"), iterations)
+        protected_stats = await measure_async(lambda: client.get("/protected", headers=headers), iterations)
+    return {
+        "unauthenticated_request": open_stats,
+        "authenticated_request": protected_stats,
+        "auth_overhead_p50_ms": protected_stats["p50_ms"] - open_stats["p50_ms"],
+    }
+
+
+async def _login_burst(password_hash: str, concurrency: int) -> dict:
+    """Verify `concurrency` passwords at once while sampling event-loop lag"""
+    lags = []
+    done = asyncio.Event()
+    
+    async def ticker():
+        while not done.is_set():
+            start = time.perf_counter_ns()
+            await asyncio.sleep(0.001)
+            lags.append(time.perf_counter_ns() - start - 1_000_000)
+    
+    tick = asyncio.create_task(ticker())
+    start = time.perf_counter()
+    await asyncio.gather(*(verify_password("password", password_hash) for _ in range(concurrency)))
+    elapsed = time.perf_counter() - start
+    done.set()
+    await tick
+    return {
+        "concurrent_logins": concurrency,
+        "wall_s": elapsed,
+        "logins_per_s": concurrency / elapsed,
+        "event_loop_lag": summarize([max(lag, 0) for lag in lags]),
+    }
+
+
+def run(iterations: int = 2000, logins: int = 32) -> dict:
+    token = token_service.create_access_token("bench-user", "bench@example.com", UserRole.DOCTOR)
+    
+    def uncached():
+        token_service.cache.discard(token)
+        decode_token(token)
+    
+    # The pre-bitmask representation: a list scanned with `in`
+    legacy_permissions = {role: list(perms) for role, perms in ROLE_PERMISSIONS.items()}
+    
+    results = {
+        "verify_token_uncached": measure(uncached, iterations),
+        "verify_token_cached": measure(lambda: decode_token(token), iterations),
+        "permission_check_bitmask": measure(
+            lambda: has_permission(UserRole.DOCTOR, Permission.PRESCRIBE), iterations),
+        "permission_check_list_scan": measure(
+            lambda: Permission.PRESCRIBE in legacy_permissions[UserRole.DOCTOR], iterations),
+    }
+    results.update(asyncio.run(_request_overhead(token, iterations)))
+    
+    password_hash = hash_password_sync("password")
+    results["login_burst"] = asyncio.run(_login_burst(password_hash, logins))
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--iterations", type=int, default=2000)
+    parser.add_argument("--logins", type=int, default=32)
+    parser.add_argument("--output")
+    args = parser.parse_args()
+    write_report("auth", run(args.iterations, args.logins), args.output)
+
+
+if __name__ == "__main__":
+    main()
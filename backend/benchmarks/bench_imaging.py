@@ -0,0 +1,82 @@
+"""
+Imaging benchmarks: MedicalImagePreprocessor + AbnormalityDetector
+images/sec, per stage and end to end, and batched embedding throughput
+of scripts/ml_feature_extraction.py.
+
+Run from the backend directory:
+    python -m benchmarks.bench_imaging [--output imaging.json]
+"""
+
+import argparse
+import os
+import tempfile
+
+import torch
+
+from benchmarks.fixtures import SEED, image_bytes, import_script
+from benchmarks.harness import measure, write_report
+from dl.cnn_models import AbnormalityDetector
+from dl.image_preprocessing import MedicalImagePreprocessor
+
+
+def _bench_extractor(n_images: int, image_size: int, batch_size: int) -> dict:
+    module = import_script("ml_feature_extraction")
+    extractor = module.MedicalCNNFeatureExtractor(pretrained=False, batch_size=batch_size, num_workers=1)
+    with tempfile.TemporaryDirectory() as tmp:
+        paths = []
+        for i in range(n_images):
+            path = os.path.join(tmp, f"scan_{i}.png")
+            with open(path, "wb") as f:
+                f.write(image_bytes(image_size, seed=SEED + i))
+            paths.append(path)
+        extractor.extract_batch(paths[:batch_size])  # load weights, warm up
+        extractor.extract_batch(paths)
+    run = extractor.last_run
+    return {"feature_extract_densenet121": {
+        "images": run["images"],
+        "batch_size": run["batch_size"],
+        "mean_ms": 1000 * run["seconds"] / run["images"],
+        "throughput_per_s": run["images_per_sec"],
+    }}
+
+
+def run(iterations: int = 30, image_size: int = 1024, batch_size: int = 8, extractor_images: int = 32) -> dict:
+    torch.manual_seed(SEED)
+    preprocessor = MedicalImagePreprocessor()
+    # Latency does not depend on the weights, so skip the ImageNet download
+    detector = AbnormalityDetector(pretrained=False)
+    raw = image_bytes(image_size)
+    tensor = preprocessor.preprocess_from_bytes(raw)
+    batch = tensor.repeat(batch_size, 1, 1, 1)
+    
+    def forward_batch():
+        with torch.no_grad():
+            detector.model(batch.to(detector.device))
+    
+    results = {
+        "torch_threads": torch.get_num_threads(),
+        "preprocess_from_bytes": measure(lambda: preprocessor.preprocess_from_bytes(raw), iterations, warmup=3),
+        "analyze_scan": measure(lambda: detector.analyze_scan(tensor), iterations, warmup=3),
+        "preprocess_and_analyze": measure(
+            lambda: detector.analyze_scan(preprocessor.preprocess_from_bytes(raw)), iterations, warmup=3),
+        f"forward_batch_{batch_size}": measure(
+            forward_batch, max(iterations // batch_size, 3), warmup=1, items_per_call=batch_size),
+    }
+    if extractor_images:
+        results.update(_bench_extractor(extractor_images, image_size, batch_size))
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--iterations", type=int, default=30)
+    parser.add_argument("--image-size", type=int, default=1024)
+    parser.add_argument("--batch-size", type=int, default=8)
+    parser.add_argument("--extractor-images", type=int, default=32, help="0 skips the embedding benchmark")
+    parser.add_argument("--output")
+    args = parser.parse_args()
+    write_report("imaging", run(args.iterations, args.image_size, args.batch_size, args.extractor_images), args.output)
+
+
+if __name__ == "__main__":
+    main()
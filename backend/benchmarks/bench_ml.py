@@ -0,0 +1,124 @@
+"""
+Tabular model benchmarks: SymptomDiseasePredictor.predict, the rule-based
+HealthPredictionNN, similarity-matrix build time vs. number of images and
+similar-case kNN queries (tree index vs. brute force) vs. number of cases.
+
+Run from the backend directory:
+    python -m benchmarks.bench_ml [--output ml.json]
+"""
+
+import argparse
+import contextlib
+import io
+import json
+import os
+import tempfile
+
+import numpy as np
+
+from benchmarks.fixtures import SEED, import_script, synthetic_features, trained_predictor
+from benchmarks.harness import measure, write_report
+
+
+def _bench_predictor(iterations: int, batch_size: int) -> dict:
+    predictor = trained_predictor()
+    single = synthetic_features(1, seed=SEED + 1)
+    batch = synthetic_features(batch_size, seed=SEED + 2)
+    
+    def rowwise():
+        for row in batch:
+            predictor.predict(row.reshape(1, -1))
+    
+    return {
+        "predict_single": measure(lambda: predictor.predict(single), iterations),
+        f"predict_rowwise_batch_{batch_size}": measure(
+            rowwise, max(iterations // batch_size, 5), warmup=1, items_per_call=batch_size),
+        f"predict_proba_batch_{batch_size}": measure(
+            lambda: predictor.predict_proba(batch), max(iterations // 10, 5), items_per_call=batch_size),
+    }
+
+
+def _bench_health_nn(iterations: int) -> dict:
+    engine = import_script("ml_engine").HealthPredictionNN()
+    patient = {
+        "symptoms": ["cough", "fever", "sore throat"],
+        "risk_factors": ["stress", "poor sleep"],
+        "age": 35,
+        "bmi": 24,
+        "environmental": {"aqi": 180, "temperature": 8},
+    }
+    return {"health_nn_predict": measure(lambda: engine.predict(patient), iterations)}
+
+
+def _bench_similarity(sizes, repeats: int) -> dict:
+    extractor = import_script("ml_feature_extraction").MedicalCNNFeatureExtractor()
+    rng = np.random.default_rng(SEED)
+    results = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        for n in sizes:
+            csv_path = os.path.join(tmp, f"embeddings_{n}.csv")
+            with open(csv_path, "w") as f:
+                f.write("image_name,embedding\n")
+                for i in range(n):
+                    embedding = json.dumps(rng.standard_normal((1, 1024)).astype(np.float32).tolist())
+                    f.write(f'img_{i}.png,"{embedding}"\n')
+            matrix_path = os.path.join(tmp, f"similarity_{n}.npz")
+            # The script reports progress on stdout, which carries the JSON report
+            with contextlib.redirect_stdout(io.StringIO()):
+                results[f"similarity_matrix_n{n}"] = measure(
+                    lambda: extractor.generate_similarity_matrix(csv_path, matrix_path),
+                    repeats, warmup=0)
+    return results
+
+
+def _bench_similar_cases(sizes, iterations: int) -> dict:
+    from ml.similar_cases import SimilarCaseIndex
+    
+    diseases = np.array([f"disease_{i}" for i in range(8)], dtype=object)
+    query = synthetic_features(1, seed=SEED + 3)[0]
+    filters = {
+        "unfiltered": {},
+        "age_band": {"age_bands": [int(query[0] // 10)]},
+        "disease": {"diseases": ["disease_3"]},
+        "age_band_disease": {"age_bands": [int(query[0] // 10)], "diseases": ["disease_3"]},
+    }
+    results = {}
+    for n in sizes:
+        X = synthetic_features(n, seed=SEED + 4)
+        outcomes = diseases[np.random.default_rng(SEED).integers(0, len(diseases), n)]
+        index = SimilarCaseIndex(X.mean(axis=0), X.std(axis=0))
+        results[f"similar_cases_build_n{n}"] = measure(
+            lambda: index.build(np.arange(n).astype(str), X, outcomes), 1, warmup=0)
+        for name, kwargs in filters.items():
+            results[f"similar_cases_{name}_tree_n{n}"] = measure(
+                lambda: index.query(query, 10, **kwargs), iterations)
+            results[f"similar_cases_{name}_brute_n{n}"] = measure(
+                lambda: index.brute_force(query, 10, **kwargs), max(iterations // 50, 3), warmup=1)
+    return results
+
+
+def run(iterations: int = 500, batch_size: int = 64, similarity_sizes=(25, 50, 100),
+        similar_case_sizes=(10_000, 1_000_000)) -> dict:
+    np.random.seed(SEED)
+    results = {}
+    results.update(_bench_predictor(iterations, batch_size))
+    results.update(_bench_health_nn(iterations))
+    results.update(_bench_similarity(similarity_sizes, repeats=3))
+    results.update(_bench_similar_cases(similar_case_sizes, iterations))
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--iterations", type=int, default=500)
+    parser.add_argument("--batch-size", type=int, default=64)
+    parser.add_argument("--similarity-sizes", type=int, nargs="+", default=[25, 50, 100])
+    parser.add_argument("--similar-case-sizes", type=int, nargs="+", default=[10_000, 1_000_000])
+    parser.add_argument("--output")
+    args = parser.parse_args()
+    write_report("ml", run(args.iterations, args.batch_size, args.similarity_sizes, args.similar_case_sizes),
+                 args.output)
+
+
+if __name__ == "__main__":
+    main()
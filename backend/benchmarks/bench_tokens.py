@@ -0,0 +1,90 @@
+"""
+Token service throughput: tokens issued and verified per second for the
+configured HMAC key and for freshly generated asymmetric keys.
+
+Run from the backend directory:
+    python -m benchmarks.bench_tokens [--output tokens.json]
+"""
+
+import argparse
+
+from cryptography.hazmat.primitives import serialization
+from cryptography.hazmat.primitives.asymmetric import ec, rsa
+
+from auth.models import UserRole
+from auth.tokens import RevocationList, TokenService
+from benchmarks.harness import measure, write_report
+
+
+def _pem_pair(private_key):
+    private_pem = private_key.private_bytes(
+        serialization.Encoding.PEM,
+        serialization.PrivateFormat.PKCS8,
+        serialization.NoEncryption(),
+    ).decode()
+    public_pem = private_key.public_key().public_bytes(
+        serialization.Encoding.PEM,
+        serialization.PublicFormat.SubjectPublicKeyInfo,
+    ).decode()
+    return private_pem, public_pem
+
+
+def _services():
+    rsa_private, rsa_public = _pem_pair(rsa.generate_private_key(public_exponent=65537, key_size=2048))
+    ec_private, ec_public = _pem_pair(ec.generate_private_key(ec.SECP256R1()))
+    return {
+        "HS256": TokenService("HS256", secret_key="bench-secret-key-with-enough-length"),
+        "RS256": TokenService("RS256", private_key=rsa_private, public_key=rsa_public),
+        "ES256": TokenService("ES256", private_key=ec_private, public_key=ec_public),
+    }
+
+
+def _bench_service(service: TokenService, iterations: int) -> dict:
+    token = service.create_access_token("bench-user", "bench@example.com", UserRole.DOCTOR)
+    
+    def verify_uncached():
+        service.cache.discard(token)
+        service.verify(token)
+    
+    return {
+        "issue": measure(
+            lambda: service.create_access_token("bench-user", "bench@example.com", UserRole.DOCTOR),
+            iterations),
+        "verify_uncached": measure(verify_uncached, iterations),
+        "verify_cached": measure(lambda: service.verify(token), iterations),
+    }
+
+
+def _bench_revocation(size: int, iterations: int) -> dict:
+    revoked = RevocationList()
+    service = TokenService("HS256", secret_key="bench-secret-key-with-enough-length",
+                           revocation_list=revoked)
+    tokens = [service.create_access_token(f"user-{i}", "bench@example.com", UserRole.PATIENT)
+              for i in range(size)]
+    for token in tokens:
+        service.revoke(token)
+    live = service.create_access_token("live", "bench@example.com", UserRole.PATIENT)
+    service.verify(live)
+    return {
+        "revoked_tokens": len(revoked),
+        "verify_cached_with_revocations": measure(lambda: service.verify(live), iterations),
+    }
+
+
+def run(iterations: int = 2000, revoked: int = 10000) -> dict:
+    results = {name: _bench_service(service, iterations) for name, service in _services().items()}
+    results["revocation"] = _bench_revocation(revoked, iterations)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--iterations", type=int, default=2000)
+    parser.add_argument("--revoked", type=int, default=10000)
+    parser.add_argument("--output")
+    args = parser.parse_args()
+    write_report("tokens", run(args.iterations, args.revoked), args.output)
+
+
+if __name__ == "__main__":
+    main()
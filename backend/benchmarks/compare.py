@@ -0,0 +1,74 @@
+"""
+Diff two benchmark reports and fail on regressions.
+
+    python -m benchmarks.compare baseline.json current.json [--tolerance 0.15]
+
+Latency metrics (`*_ms` percentiles and mean) regress when they grow by more
+than the tolerance; throughput metrics (`*_per_s`) regress when they shrink
+by more than it. Exits 1 if anything regressed.
+"""
+
+import argparse
+import json
+import sys
+from typing import Dict, List
+
+LATENCY_KEYS = ("mean_ms", "p50_ms", "p90_ms", "p95_ms", "p99_ms")
+
+
+def flatten(results: Dict, prefix: str = "") -> Dict[str, float]:
+    flat = {}
+    for key, value in results.items():
+        path = f"{prefix}{key}"
+        if isinstance(value, dict):
+            flat.update(flatten(value, f"{path}."))
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            flat[path] = float(value)
+    return flat
+
+
+def _results(report: Dict) -> Dict:
+    # A combined run nests one report per suite
+    if "suites" in report:
+        return {name: suite["results"] for name, suite in report["suites"].items()}
+    return report["results"]
+
+
+def compare(baseline: Dict, current: Dict, tolerance: float = 0.15) -> List[Dict]:
+    """Return one row per comparable metric, flagged if it regressed"""
+    old, new = flatten(_results(baseline)), flatten(_results(current))
+    rows = []
+    for path in sorted(old.keys() & new.keys()):
+        metric = path.rsplit(".", 1)[-1]
+        if metric in LATENCY_KEYS:
+            regressed = new[path] > old[path] * (1 + tolerance)
+        elif metric.endswith("_per_s"):
+            regressed = new[path] < old[path] * (1 - tolerance)
+        else:
+            continue
+        change = (new[path] - old[path]) / old[path] if old[path] else 0.0
+        rows.append({"metric": path, "baseline": old[path], "current": new[path],
+                     "change": change, "regressed": regressed})
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("baseline")
+    parser.add_argument("current")
+    parser.add_argument("--tolerance", type=float, default=0.15)
+    args = parser.parse_args()
+    
+    with open(args.baseline) as f:
+        baseline = json.load(f)
+    with open(args.current) as f:
+        current = json.load(f)
+    
+    rows = compare(baseline, current, args.tolerance)
+    regressions = [row for row in rows if row["regressed"]]
+    print(json.dumps({"compared": len(rows), "regressions": regressions}, indent=2))
+    sys.exit(1 if regressions else 0)
+
+
+if __name__ == "__main__":
+    main()
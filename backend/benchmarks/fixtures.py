@@ -0,0 +1,51 @@
+import io
+import os
+import sys
+import tempfile
+
+import numpy as np
+
+from ml.models import SymptomDiseasePredictor
+
+SEED = 42
+SCRIPTS_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "..", "scripts"))
+
+_trained = {}
+
+
+def synthetic_features(n_rows: int, seed: int = SEED) -> np.ndarray:
+    """Rows shaped like PredictionRequest features"""
+    rng = np.random.default_rng(seed)
+    X = rng.random((n_rows, 8)) * 100
+    X[:, 1] = 36 + rng.standard_normal(n_rows) * 2  # temperature
+    X[:, 2] = rng.random(n_rows) * 10  # cough severity
+    X[:, 5] = rng.random(n_rows) * 200  # AQI
+    return X
+
+
+def trained_predictor(n_rows: int = 2000) -> SymptomDiseasePredictor:
+    """Train (once per process) a predictor on synthetic data in a temp model dir"""
+    if n_rows not in _trained:
+        X = synthetic_features(n_rows)
+        y = np.random.default_rng(SEED).integers(0, 8, n_rows)
+        predictor = SymptomDiseasePredictor(model_path=tempfile.mkdtemp(prefix="bench-models-"))
+        predictor.train(X, y)
+        _trained[n_rows] = predictor
+    return _trained[n_rows]
+
+
+def image_bytes(size: int = 512, seed: int = SEED) -> bytes:
+    """A random grayscale scan encoded as PNG"""
+    from PIL import Image
+    
+    pixels = np.random.default_rng(seed).integers(0, 256, (size, size), dtype=np.uint8)
+    buffer = io.BytesIO()
+    Image.fromarray(pixels, mode="L").save(buffer, format="PNG")
+    return buffer.getvalue()
+
+
+def import_script(name: str):
+    """Import a module from the repo-level scripts/ directory"""
+    if SCRIPTS_DIR not in sys.path:
+        sys.path.insert(0, SCRIPTS_DIR)
+    return __import__(name)
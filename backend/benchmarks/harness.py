@@ -0,0 +1,76 @@
+import json
+import os
+import platform
+import sys
+import time
+from typing import Awaitable, Callable, Dict, List, Optional
+
+import numpy as np
+
+PERCENTILES = (50, 90, 95, 99)
+
+
+def summarize(samples_ns: List[int], items_per_call: int = 1) -> Dict:
+    """Reduce raw per-call timings to latency percentiles and throughput"""
+    samples = np.asarray(samples_ns, dtype=np.float64) / 1e6  # ms
+    total_s = samples.sum() / 1e3
+    stats = {
+        "iterations": int(samples.size),
+        "mean_ms": float(samples.mean()),
+        "min_ms": float(samples.min()),
+        "max_ms": float(samples.max()),
+        "throughput_per_s": float(samples.size * items_per_call / total_s) if total_s else float("inf"),
+    }
+    for p, value in zip(PERCENTILES, np.percentile(samples, PERCENTILES)):
+        stats[f"p{p}_ms"] = float(value)
+    return stats
+
+
+def measure(fn: Callable[[], object], iterations: int = 1000, warmup: int = 50,
+            items_per_call: int = 1) -> Dict:
+    """Time a zero-argument callable"""
+    for _ in range(warmup):
+        fn()
+    samples = []
+    clock = time.perf_counter_ns
+    for _ in range(iterations):
+        start = clock()
+        fn()
+        samples.append(clock() - start)
+    return summarize(samples, items_per_call)
+
+
+async def measure_async(fn: Callable[[], Awaitable[object]], iterations: int = 1000,
+                        warmup: int = 50, items_per_call: int = 1) -> Dict:
+    """Time a zero-argument coroutine function"""
+    for _ in range(warmup):
+        await fn()
+    samples = []
+    clock = time.perf_counter_ns
+    for _ in range(iterations):
+        start = clock()
+        await fn()
+        samples.append(clock() - start)
+    return summarize(samples, items_per_call)
+
+
+def environment() -> Dict:
+    return {
+        "python": sys.version.split()[0],
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "numpy": np.__version__,
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+    }
+
+
+def write_report(suite: str, results: Dict, output: Optional[str] = None) -> Dict:
+    """Emit results as JSON to a file or stdout"""
+    report = {"suite": suite, "environment": environment(), "results": results}
+    text = json.dumps(report, indent=2)
+    if output:
+        with open(output, "w") as f:
+            f.write(text)
+    else:
+        print(text)
+    return report
@@ -0,0 +1,68 @@
+"""
+Run the backend benchmark suite and write one JSON report.
+
+Run from the backend directory:
+    python -m benchmarks.run --output bench.json
+    python -m benchmarks.run --suites ml api --quick --baseline bench.json
+
+With --baseline, the new report is compared against a previous one and the
+process exits 1 if any latency or throughput metric regressed by more than
+--tolerance.
+"""
+
+import argparse
+import importlib
+import json
+import sys
+
+from benchmarks.compare import compare
+from benchmarks.harness import environment
+
+SUITES = ("auth", "tokens", "ml", "api", "imaging")
+
+# Smaller iteration counts for CI smoke runs; the numbers are noisier
+QUICK = {
+    "auth": {"iterations": 300, "logins": 8},
+    "tokens": {"iterations": 300, "revoked": 1000},
+    "ml": {"iterations": 100, "similarity_sizes": (10, 25), "similar_case_sizes": (10_000, 100_000)},
+    "api": {"iterations": 50, "duration": 3.0},
+    "imaging": {"iterations": 5, "batch_size": 2, "extractor_images": 4},
+}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--suites", nargs="+", choices=SUITES, default=list(SUITES))
+    parser.add_argument("--quick", action="store_true")
+    parser.add_argument("--output")
+    parser.add_argument("--baseline")
+    parser.add_argument("--tolerance", type=float, default=0.15)
+    args = parser.parse_args()
+    
+    report = {"environment": environment(), "suites": {}}
+    for name in args.suites:
+        module = importlib.import_module(f"benchmarks.bench_{name}")
+        kwargs = QUICK[name] if args.quick else {}
+        print(f"running {name}...", file=sys.stderr)
+        report["suites"][name] = {"results": module.run(**kwargs)}
+    
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(text)
+    else:
+        print(text)
+    
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        regressions = [row for row in compare(baseline, report, args.tolerance) if row["regressed"]]
+        for row in regressions:
+            print(f"REGRESSION {row['metric']}: {row['baseline']:.4g} -> {row['current']:.4g} "
+                  f"({row['change']:+.1%})", file=sys.stderr)
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
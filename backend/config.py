@@ -13,15 +13,72 @@ class Settings(BaseSettings):
     
     # JWT
     SECRET_KEY: str = os.getenv("SECRET_KEY", "your-secret-key-change-in-production")
-    ALGORITHM: str = "HS256"
+    ALGORITHM: str = os.getenv("JWT_ALGORITHM", "HS256")
+    # PEM files for RS*/ES*/EdDSA; workers given only the public key verify but cannot issue
+    JWT_PRIVATE_KEY_PATH: Optional[str] = os.getenv("JWT_PRIVATE_KEY_PATH")
+    JWT_PUBLIC_KEY_PATH: Optional[str] = os.getenv("JWT_PUBLIC_KEY_PATH")
     ACCESS_TOKEN_EXPIRE_MINUTES: int = 30
+    REFRESH_TOKEN_EXPIRE_DAYS: int = 7
+    TOKEN_CACHE_SIZE: int = 4096
+    TOKEN_REVOCATION_PATH: Optional[str] = os.getenv("TOKEN_REVOCATION_PATH")
+    TOKEN_REVOCATION_SYNC_SECONDS: float = 5.0
+    
+    # Password hashing
+    BCRYPT_ROUNDS: int = 12
+    PASSWORD_HASH_WORKERS: int = 4
+    
+    # Runtime data (uploads, caches, published models) is kept outside the source tree
+    DATA_DIR: str = os.getenv("DATA_DIR", os.path.join(os.path.expanduser("~"), ".local", "share", "healthcare-ai"))
     
     # File Upload
-    UPLOAD_DIR: str = "uploads"
+    UPLOAD_DIR: str = os.path.join(DATA_DIR, "uploads")
     MAX_FILE_SIZE: int = 50 * 1024 * 1024  # 50MB
+    # Fine-tuned AbnormalityDetector state dict; unset uses ImageNet-initialized weights
+    SCAN_MODEL_PATH: Optional[str] = None
+    # server.py pre-fork mode; 0 = one worker per core, cores / workers threads each
+    SERVER_WORKERS: int = 0
+    WORKER_THREADS: int = 0
+    # Inference admission control per worker (auth.admission)
+    ADMISSION_CONCURRENCY: int = 4
+    ADMISSION_SLO_SECONDS: float = 0.25
+    ADMISSION_MAX_QUEUE: int = 256
+    # Comma-separated replica sockets from `python -m ml.inference_server`; empty = models in-process
+    INFERENCE_SOCKETS: str = ""
+    # Live vitals WebSocket streams (routers.vitals), per worker
+    VITALS_MAX_STREAMS: int = 10000
+    VITALS_HALF_LIFE_SECONDS: float = 30.0
+    VITALS_IDLE_SECONDS: float = 120.0
+    # Viewer tile pyramids, built per level on first request
+    TILE_DIR: str = os.path.join(DATA_DIR, "cache", "tiles")
+    TILE_SIZE: int = 256
+    TILE_FORMAT: str = "jpeg"
+    TILE_QUALITY: int = 85
+    
+    # Preprocessed scan tensors (dl.tensor_cache): in-memory LRU over memory-mapped files
+    TENSOR_CACHE_BYTES: int = 256 * 1024 * 1024
+    TENSOR_CACHE_DIR: str = os.path.join(DATA_DIR, "cache", "tensors")  # empty disables the disk tier
+    TENSOR_CACHE_DISK_BYTES: int = 4 * 1024 * 1024 * 1024
     
     # ML Models
     MODEL_PATH: str = "models/"
+    # Versioned artifacts (ml.registry); MODEL_PATH is the fallback when nothing is promoted
+    MODEL_REGISTRY_DIR: str = os.path.join(DATA_DIR, "models", "registry")
+    MODEL_POLL_SECONDS: float = 5.0
+    # Similar-case kNN index (python -m ml.similar_cases); missing = start empty
+    SIMILAR_CASES_PATH: str = "models/similar_cases.npz"
+    # Latest environmental_data reading per location (ml.environment): "database" or a CSV path
+    ENVIRONMENT_SOURCE: str = "database"
+    ENVIRONMENT_TTL_SECONDS: float = 3 * 3600
+    ENVIRONMENT_REFRESH_SECONDS: float = 300.0
+    # Shadow scoring of a candidate version (ml.shadow); overflow is dropped, never waited on
+    SHADOW_MAX_QUEUE: int = 1024
+    SHADOW_BATCH_SIZE: int = 64
+    # Requests per drift window (ml.drift); scores cover the last one to two windows
+    DRIFT_WINDOW: int = 5000
+    # Core budget for ml.orchestrator (parallel training + hyperparameter search)
+    TRAINING_CORES: int = os.cpu_count() or 1
+    SEARCH_CANDIDATES: int = 27
+    SEARCH_CV_FOLDS: int = 3
     ENABLE_GPU: bool = os.getenv("ENABLE_GPU", "False") == "True"
     
     # AWS/Storage
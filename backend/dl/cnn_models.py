@@ -1,8 +1,17 @@
 import torch
 import torch.nn as nn
 import torchvision.models as models
-from typing import Tuple
+from typing import Optional, Tuple
 import numpy as np
+from dl.image_preprocessing import MedicalImagePreprocessor
+from dl.tensor_cache import tensor_cache
+from ml.rules import Ladder
+from monitoring.metrics import stage, timed
+
+_FORWARD = stage("analyze_scan", "forward")
+_ROI = stage("analyze_scan", "roi")
+# Abnormality probability to the severity label in scan results
+SEVERITY_LEVELS = Ladder([(">", 0.8, "Critical"), (">", 0.6, "High"), (">", 0.4, "Moderate")], default="Low")
 
 class MedicalImageCNN(nn.Module):
     """ResNet-50 based CNN for medical image analysis"""
@@ -46,9 +55,12 @@ class MedicalImageCNN(nn.Module):
 class AbnormalityDetector:
     """Detect abnormalities in medical scans"""
     
-    def __init__(self, model_path: str = None):
+    def __init__(self, model_path: str = None, pretrained: bool = True,
+                 preprocessor: Optional[MedicalImagePreprocessor] = None):
+        self.preprocessor = preprocessor or MedicalImagePreprocessor(cache=tensor_cache)
         self.device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
-        self.model = MedicalImageCNN(num_classes=2)
+        # A saved state dict replaces every weight, so skip fetching ImageNet ones
+        self.model = MedicalImageCNN(num_classes=2, pretrained=pretrained and not model_path)
         
         if model_path:
             self.model.load_state_dict(torch.load(model_path))
@@ -56,9 +68,17 @@ class AbnormalityDetector:
         self.model.to(self.device)
         self.model.eval()
     
-    def analyze_scan(self, image_tensor: torch.Tensor) -> dict:
-        """Analyze medical scan and detect abnormalities"""
-        with torch.no_grad():
+    def analyze_bytes(self, image_bytes: bytes, digest: Optional[str] = None, return_heatmap: bool = False) -> dict:
+        """Analyze an encoded scan, reusing its cached preprocessed tensor"""
+        return self.analyze_scan(self.preprocessor.preprocess_from_bytes(image_bytes, digest), return_heatmap)
+    
+    def analyze_scan(self, image_tensor: torch.Tensor, return_heatmap: bool = False) -> dict:
+        """Analyze medical scan and detect abnormalities
+        
+        With `return_heatmap`, the result also holds the activation map the
+        ROI boxes are measured on (`heatmap`, feature-grid cells, as ndarray).
+        """
+        with timed(_FORWARD), torch.no_grad():
             image_tensor = image_tensor.to(self.device)
             logits, features = self.model(image_tensor)
             probs = torch.softmax(logits, dim=1)
@@ -66,20 +86,29 @@ class AbnormalityDetector:
         abnormality_prob = probs[0, 1].item()
         
         # Generate regions of interest
-        roi_regions = self._generate_roi(features)
+        with timed(_ROI):
+            roi_heatmap = self._activation_map(features)
+            roi_regions = self._generate_roi(features, roi_heatmap)
         
-        return {
+        result = {
             "abnormality_detected": abnormality_prob > 0.5,
             "confidence": float(abnormality_prob),
             "regions_of_interest": roi_regions,
             "severity": self._classify_severity(abnormality_prob)
         }
+        if return_heatmap:
+            result["heatmap"] = roi_heatmap
+        return result
+    
+    def _activation_map(self, features: torch.Tensor) -> np.ndarray:
+        return torch.mean(features, dim=1)[0].cpu().numpy()
     
-    def _generate_roi(self, features: torch.Tensor) -> list:
+    def _generate_roi(self, features: torch.Tensor, roi_heatmap: Optional[np.ndarray] = None) -> list:
         """Generate regions of interest from features"""
         # Simulate ROI detection
         batch_size, channels, height, width = features.shape
-        roi_heatmap = torch.mean(features, dim=1)[0].cpu().numpy()
+        if roi_heatmap is None:
+            roi_heatmap = self._activation_map(features)
         
         # Find high-activation regions
         threshold = np.percentile(roi_heatmap, 75)
@@ -101,11 +130,4 @@ class AbnormalityDetector:
     
     def _classify_severity(self, probability: float) -> str:
         """Classify abnormality severity"""
-        if probability > 0.8:
-            return "Critical"
-        elif probability > 0.6:
-            return "High"
-        elif probability > 0.4:
-            return "Moderate"
-        else:
-            return "Low"
+        return SEVERITY_LEVELS.level(probability)
@@ -3,13 +3,19 @@ import numpy as np
 from PIL import Image
 import torch
 from torchvision import transforms
-from typing import Tuple
+from typing import Optional, Tuple
+from dl.tensor_cache import TensorCache, content_digest
+from monitoring.metrics import stage, timed
+
+_DECODE = stage("analyze_scan", "decode")
+_PREPROCESS = stage("analyze_scan", "preprocess")
 
 class MedicalImagePreprocessor:
     """Preprocess medical images for CNN analysis"""
     
-    def __init__(self, target_size: Tuple[int, int] = (224, 224)):
+    def __init__(self, target_size: Tuple[int, int] = (224, 224), cache: Optional[TensorCache] = None):
         self.target_size = target_size
+        self.cache = cache
         self.transform = transforms.Compose([
             transforms.Resize(target_size),
             transforms.ToTensor(),
@@ -25,11 +31,28 @@ class MedicalImagePreprocessor:
         tensor = self.transform(img)
         return tensor.unsqueeze(0)  # Add batch dimension
     
-    def preprocess_from_bytes(self, image_bytes: bytes) -> torch.Tensor:
-        """Preprocess image from bytes"""
+    def preprocess_from_bytes(self, image_bytes: bytes, digest: Optional[str] = None) -> torch.Tensor:
+        """Preprocess image from bytes (or a seekable buffer such as an mmap, decoded without copying)
+        
+        With a cache, the result is shared between callers and must not be
+        modified in place. Pass `digest` (SHA-256 hex) if it is already known
+        to skip re-hashing the bytes.
+        """
+        if self.cache is None:
+            return self._preprocess_bytes(image_bytes)
+        key = TensorCache.key(digest or content_digest(image_bytes), self.target_size)
+        return self.cache.get_or_compute(key, lambda: self._preprocess_bytes(image_bytes))
+    
+    def _preprocess_bytes(self, image_bytes: bytes) -> torch.Tensor:
         import io
-        img = Image.open(io.BytesIO(image_bytes)).convert('RGB')
-        tensor = self.transform(img)
+        with timed(_DECODE):
+            if hasattr(image_bytes, "read"):
+                image_bytes.seek(0)
+                img = Image.open(image_bytes).convert('RGB')
+            else:
+                img = Image.open(io.BytesIO(image_bytes)).convert('RGB')
+        with timed(_PREPROCESS):
+            tensor = self.transform(img)
         return tensor.unsqueeze(0)
     
     def enhance_contrast(self, image_array: np.ndarray) -> np.ndarray:
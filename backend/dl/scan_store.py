@@ -0,0 +1,157 @@
+import hashlib
+import mmap
+import os
+import re
+import tempfile
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+from dataclasses import dataclass
+from typing import AsyncIterator, BinaryIO, Iterator, List, Set
+
+from starlette.concurrency import run_in_threadpool
+
+from config import settings
+
+DIGEST_PATTERN = re.compile(r"^[0-9a-f]{64}$")
+# Request chunks are gathered up to this size, then hashed and written off the event loop
+WRITE_BATCH_BYTES = 1024 * 1024
+
+
+class ScanTooLargeError(Exception):
+    pass
+
+
+class ScanNotFoundError(Exception):
+    pass
+
+
+@dataclass(frozen=True)
+class StoredScan:
+    digest: str
+    size: int
+    deduplicated: bool  # the same owner had already uploaded these bytes
+
+
+class ScanStore:
+    """Content-addressed scan files under `root/objects/ab/cd/<sha256>`
+    
+    Uploads stream to a temp file on the same filesystem while being hashed,
+    then are renamed into place, so a file at a digest path is always
+    complete and identical uploads are stored once. Memory per upload is
+    a few request chunks regardless of file size.
+    
+    Each digest also records who uploaded it (`root/owners/ab/cd/<sha256>`,
+    one user id per line, appended), since identical bytes from different
+    users share one file.
+    """
+    
+    def __init__(self, root: str, granted_cache_size: int = 4096):
+        self.root = root
+        self.tmp_dir = os.path.join(root, "tmp")
+        os.makedirs(self.tmp_dir, exist_ok=True)
+        # (digest, owner) pairs already confirmed; owners are never removed, so hits stay valid
+        self._granted: "OrderedDict[tuple, None]" = OrderedDict()
+        self._granted_cache_size = granted_cache_size
+        self._granted_lock = threading.Lock()
+    
+    def path(self, digest: str) -> str:
+        if not DIGEST_PATTERN.match(digest):
+            raise ScanNotFoundError(digest)
+        return os.path.join(self.root, "objects", digest[:2], digest[2:4], digest)
+    
+    def _owners_path(self, digest: str) -> str:
+        if not DIGEST_PATTERN.match(digest):
+            raise ScanNotFoundError(digest)
+        return os.path.join(self.root, "owners", digest[:2], digest[2:4], digest)
+    
+    def exists(self, digest: str) -> bool:
+        return os.path.exists(self.path(digest))
+    
+    def owners(self, digest: str) -> Set[str]:
+        try:
+            with open(self._owners_path(digest)) as f:
+                return {line.rstrip("\n") for line in f if line.endswith("\n")}
+        except FileNotFoundError:
+            return set()
+    
+    def add_owner(self, digest: str, owner: str):
+        path = self._owners_path(digest)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # One short O_APPEND write per line, so concurrent uploaders don't interleave
+        with open(path, "a") as f:
+            f.write(f"{owner}\n")
+    
+    def is_owner(self, digest: str, owner: str) -> bool:
+        key = (digest, owner)
+        with self._granted_lock:
+            if key in self._granted:
+                self._granted.move_to_end(key)
+                return True
+        if owner not in self.owners(digest):
+            return False
+        with self._granted_lock:
+            self._granted[key] = None
+            if len(self._granted) > self._granted_cache_size:
+                self._granted.popitem(last=False)
+        return True
+    
+    @staticmethod
+    def _write(f: BinaryIO, digest, chunks: List[bytes]):
+        for chunk in chunks:
+            digest.update(chunk)
+            f.write(chunk)
+    
+    async def save_stream(self, chunks: AsyncIterator[bytes], max_size: int, owner: str) -> StoredScan:
+        """Write an async byte stream as `owner`'s scan, failing as soon as it passes `max_size`"""
+        digest = hashlib.sha256()
+        size = 0
+        fd, tmp = tempfile.mkstemp(dir=self.tmp_dir)
+        try:
+            with os.fdopen(fd, "wb") as f:
+                pending: List[bytes] = []
+                pending_size = 0
+                async for chunk in chunks:
+                    size += len(chunk)
+                    if size > max_size:
+                        raise ScanTooLargeError(f"Scan exceeds {max_size} bytes")
+                    pending.append(chunk)
+                    pending_size += len(chunk)
+                    if pending_size >= WRITE_BATCH_BYTES:
+                        await run_in_threadpool(self._write, f, digest, pending)
+                        pending, pending_size = [], 0
+                if pending:
+                    await run_in_threadpool(self._write, f, digest, pending)
+            if not size:
+                raise ValueError("Empty upload")
+            hexdigest = digest.hexdigest()
+            path = self.path(hexdigest)
+            if os.path.exists(path):
+                os.remove(tmp)
+                # Only tell a caller about bytes they uploaded themselves, not someone else's
+                if owner in self.owners(hexdigest):
+                    return StoredScan(hexdigest, size, deduplicated=True)
+                self.add_owner(hexdigest, owner)
+                return StoredScan(hexdigest, size, deduplicated=False)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            os.chmod(tmp, 0o440)
+            os.replace(tmp, path)
+            self.add_owner(hexdigest, owner)
+            return StoredScan(hexdigest, size, deduplicated=False)
+        except BaseException:
+            if os.path.exists(tmp):
+                os.remove(tmp)
+            raise
+    
+    @contextmanager
+    def open_mmap(self, digest: str) -> Iterator[mmap.mmap]:
+        """Read-only memory map of a stored scan; pages load on demand"""
+        try:
+            f = open(self.path(digest), "rb")
+        except FileNotFoundError:
+            raise ScanNotFoundError(digest)
+        with f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as view:
+            yield view
+
+
+scan_store = ScanStore(settings.UPLOAD_DIR)
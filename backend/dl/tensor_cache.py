@@ -0,0 +1,190 @@
+import hashlib
+import logging
+import os
+import tempfile
+import threading
+from collections import OrderedDict
+from typing import Callable, Optional, Tuple
+
+import numpy as np
+import torch
+
+from config import settings
+from monitoring.metrics import REGISTRY
+
+logger = logging.getLogger(__name__)
+
+_LOOKUPS = REGISTRY.counter(
+    "tensor_cache_lookups_total", "Preprocessed-tensor cache lookups by outcome", ("result",))
+_MEMORY_HIT = _LOOKUPS.labels("memory_hit")
+_DISK_HIT = _LOOKUPS.labels("disk_hit")
+_MISS = _LOOKUPS.labels("miss")
+_CACHE_BYTES = REGISTRY.gauge("tensor_cache_bytes", "Bytes held by the preprocessed-tensor cache", ("tier",))
+
+
+def content_digest(data: bytes) -> str:
+    return hashlib.sha256(data).hexdigest()
+
+
+class TensorCache:
+    """Preprocessed scan tensors keyed by content hash and preprocessing settings
+    
+    A byte-capped in-memory LRU sits in front of `.npy` files on local disk.
+    Disk entries are opened memory-mapped (copy-on-write), so a re-analysis
+    after eviction or in another process costs page faults rather than a
+    decode and resize. Cached tensors are shared: callers must not modify
+    them in place.
+    """
+    
+    def __init__(self, max_bytes: int, disk_dir: Optional[str] = None, max_disk_bytes: int = 0):
+        self.max_bytes = max_bytes
+        self.disk_dir = disk_dir or None
+        self.max_disk_bytes = max_disk_bytes
+        self._entries: "OrderedDict[str, torch.Tensor]" = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self._disk_bytes = 0
+        if self.disk_dir:
+            os.makedirs(self.disk_dir, exist_ok=True)
+            self._disk_bytes = sum(entry.stat().st_size for entry in os.scandir(self.disk_dir)
+                                   if entry.name.endswith(".npy"))
+    
+    def __getstate__(self):
+        # DataLoader workers get the disk tier only; their memory tiers start empty
+        state = self.__dict__.copy()
+        state.update(_entries=OrderedDict(), _bytes=0, _lock=None)
+        return state
+    
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._lock = threading.Lock()
+    
+    @staticmethod
+    def key(digest: str, target_size: Tuple[int, int]) -> str:
+        return f"{digest}-{target_size[0]}x{target_size[1]}"
+    
+    def get_or_compute(self, key: str, compute: Callable[[], torch.Tensor]) -> torch.Tensor:
+        with self._lock:
+            tensor = self._entries.get(key)
+            if tensor is not None:
+                self._entries.move_to_end(key)
+        if tensor is not None:
+            _MEMORY_HIT.inc()
+            return tensor
+        
+        tensor = self._load_from_disk(key)
+        if tensor is not None:
+            _DISK_HIT.inc()
+        else:
+            _MISS.inc()
+            tensor = compute()
+            self._write_to_disk(key, tensor)
+        self._remember(key, tensor)
+        return tensor
+    
+    def _remember(self, key: str, tensor: torch.Tensor):
+        size = tensor.numel() * tensor.element_size()
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            previous = self._entries.pop(key, None)
+            if previous is not None:
+                self._bytes -= previous.numel() * previous.element_size()
+            self._entries[key] = tensor
+            self._bytes += size
+            while self._bytes > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self._bytes -= evicted.numel() * evicted.element_size()
+    
+    def _path(self, key: str) -> str:
+        return os.path.join(self.disk_dir, f"{key}.npy")
+    
+    def _load_from_disk(self, key: str) -> Optional[torch.Tensor]:
+        if not self.disk_dir:
+            return None
+        try:
+            array = np.load(self._path(key), mmap_mode="c")
+        except (FileNotFoundError, ValueError):
+            return None
+        return torch.from_numpy(array)
+    
+    def _write_to_disk(self, key: str, tensor: torch.Tensor):
+        if not self.disk_dir:
+            return
+        array = tensor.detach().cpu().numpy()
+        if array.nbytes > self.max_disk_bytes:
+            return
+        path = self._path(key)
+        tmp = None
+        try:
+            fd, tmp = tempfile.mkstemp(prefix=".tmp-", suffix=".npy", dir=self.disk_dir)
+            with os.fdopen(fd, "wb") as f:
+                np.save(f, array)
+            size = os.path.getsize(tmp)
+            try:
+                # Another worker may have written the same key meanwhile: it is replaced, not added
+                replaced = os.path.getsize(path)
+            except FileNotFoundError:
+                replaced = 0
+            # Rename is atomic, so concurrent readers (other workers) never see a partial file
+            os.replace(tmp, path)
+        except OSError:
+            # Disk full or unwritable: the tensor is still served, just not kept on disk
+            logger.warning("Failed to write %s to the tensor cache", key, exc_info=True)
+            if tmp is not None:
+                try:
+                    os.unlink(tmp)
+                except FileNotFoundError:
+                    pass
+            return
+        with self._lock:
+            self._disk_bytes += size - replaced
+            over = self._disk_bytes > self.max_disk_bytes
+        if over:
+            self._trim_disk()
+    
+    def _trim_disk(self):
+        """Delete least recently used files (by access, else modification time) down to 90% of the cap"""
+        entries = sorted(
+            (entry for entry in os.scandir(self.disk_dir) if entry.name.endswith(".npy")),
+            key=lambda entry: max(entry.stat().st_atime, entry.stat().st_mtime),
+        )
+        total = sum(entry.stat().st_size for entry in entries)
+        for entry in entries:
+            if total <= self.max_disk_bytes * 0.9:
+                break
+            try:
+                size = entry.stat().st_size
+                os.remove(entry.path)
+                total -= size
+            except FileNotFoundError:
+                continue
+        with self._lock:
+            self._disk_bytes = total
+    
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "memory_entries": len(self._entries),
+                "memory_bytes": self._bytes,
+                "max_bytes": self.max_bytes,
+                "disk_bytes": self._disk_bytes,
+                "max_disk_bytes": self.max_disk_bytes,
+            }
+    
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+
+tensor_cache = TensorCache(settings.TENSOR_CACHE_BYTES, settings.TENSOR_CACHE_DIR, settings.TENSOR_CACHE_DISK_BYTES)
+
+
+def _collect_cache_bytes():
+    stats = tensor_cache.stats()
+    _CACHE_BYTES.labels("memory").set(stats["memory_bytes"])
+    _CACHE_BYTES.labels("disk").set(stats["disk_bytes"])
+
+
+REGISTRY.add_collector(_collect_cache_bytes)
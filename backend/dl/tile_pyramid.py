@@ -0,0 +1,248 @@
+import io
+import json
+import math
+import os
+import tempfile
+import threading
+from typing import Dict, List
+
+import numpy as np
+from PIL import Image, ImageDraw
+
+from config import settings
+from dl.scan_store import ScanStore, scan_store
+from monitoring.metrics import REGISTRY, stage, timed
+
+_BUILD_LEVEL = stage("scan_tiles", "build_level")
+_OVERLAY = stage("scan_tiles", "overlay")
+_TILE_REQUESTS = REGISTRY.counter(
+    "scan_tile_requests_total", "Scan tile reads by whether the level had to be built", ("result",))
+_TILE_HIT = _TILE_REQUESTS.labels("hit")
+_TILE_BUILT = _TILE_REQUESTS.labels("built")
+
+MEDIA_TYPES = {"jpeg": "image/jpeg", "png": "image/png", "webp": "image/webp"}
+# Red with alpha ramping up with activation, so low-activation areas stay see-through
+HEATMAP_MAX_ALPHA = 160
+
+
+class TileNotFoundError(Exception):
+    pass
+
+
+class TilePyramid:
+    """DeepZoom-style tile pyramid per stored scan, built one level at a time
+    
+    Level `max_level` is full resolution and each level below halves both
+    sides (rounding up) down to 1x1 at level 0. A level is cut into
+    `tile_size` tiles and written under `root/<sha256>/<level>/<col>_<row>.<ext>`
+    the first time any of its tiles is requested, so a viewer that never
+    zooms in never pays for the full-resolution level. Tiles are immutable
+    for a given scan digest, so clients may cache them indefinitely.
+    """
+    
+    def __init__(self, root: str, store: ScanStore, tile_size: int = 256,
+                 tile_format: str = "jpeg", quality: int = 85, lock_stripes: int = 64):
+        if tile_format not in MEDIA_TYPES:
+            raise ValueError(f"Unsupported tile format: {tile_format}")
+        self.root = root
+        self.store = store
+        self.tile_size = tile_size
+        self.tile_format = tile_format
+        self.quality = quality
+        self.media_type = MEDIA_TYPES[tile_format]
+        # A fixed pool of level-build locks shared by hash, so memory doesn't grow with scans viewed
+        self._locks = [threading.Lock() for _ in range(lock_stripes)]
+    
+    def _dir(self, digest: str) -> str:
+        self.store.path(digest)  # validates the digest before it becomes a path
+        return os.path.join(self.root, digest)
+    
+    def _tile_path(self, digest: str, level: int, col: int, row: int) -> str:
+        return os.path.join(self._dir(digest), str(level), f"{col}_{row}.{self.tile_format}")
+    
+    def _lock(self, digest: str, level: int) -> threading.Lock:
+        return self._locks[hash((digest, level)) % len(self._locks)]
+    
+    def info(self, digest: str) -> Dict:
+        """Image size and level layout; reads only the image header the first time"""
+        path = os.path.join(self._dir(digest), "info.json")
+        try:
+            with open(path) as f:
+                return json.load(f)
+        except FileNotFoundError:
+            pass
+        with self.store.open_mmap(digest) as view:
+            width, height = Image.open(view).size
+        max_level = math.ceil(math.log2(max(width, height, 1)))
+        info = {
+            "width": width,
+            "height": height,
+            "tile_size": self.tile_size,
+            "format": self.tile_format,
+            "max_level": max_level,
+            "levels": [self._level_grid(width, height, max_level - level) for level in range(max_level + 1)],
+        }
+        _write_atomic(path, json.dumps(info).encode())
+        return info
+    
+    def _level_grid(self, width: int, height: int, shrink: int) -> Dict:
+        w, h = math.ceil(width / 2 ** shrink), math.ceil(height / 2 ** shrink)
+        return {"width": w, "height": h,
+                "cols": math.ceil(w / self.tile_size), "rows": math.ceil(h / self.tile_size)}
+    
+    def tile(self, digest: str, level: int, col: int, row: int) -> bytes:
+        """Encoded tile bytes, building its level first if needed"""
+        grid = self._grid(digest, level, col, row)
+        path = self._tile_path(digest, level, col, row)
+        try:
+            with open(path, "rb") as f:
+                data = f.read()
+            _TILE_HIT.inc()
+            return data
+        except FileNotFoundError:
+            pass
+        with self._lock(digest, level):
+            # Another request may have built the level while this one waited
+            if not os.path.exists(path):
+                self._build_level(digest, level, grid)
+        _TILE_BUILT.inc()
+        with open(path, "rb") as f:
+            return f.read()
+    
+    def _grid(self, digest: str, level: int, col: int, row: int) -> Dict:
+        info = self.info(digest)
+        if not 0 <= level <= info["max_level"]:
+            raise TileNotFoundError(f"No level {level}")
+        grid = info["levels"][level]
+        if not (0 <= col < grid["cols"] and 0 <= row < grid["rows"]):
+            raise TileNotFoundError(f"No tile {col}_{row} at level {level}")
+        return grid
+    
+    def _build_level(self, digest: str, level: int, grid: Dict):
+        with timed(_BUILD_LEVEL):
+            image = self._level_image(digest, self.info(digest)["max_level"] - level)
+            level_dir = os.path.dirname(self._tile_path(digest, level, 0, 0))
+            os.makedirs(level_dir, exist_ok=True)
+            size = self.tile_size
+            for row in range(grid["rows"]):
+                for col in range(grid["cols"]):
+                    tile = image.crop((col * size, row * size,
+                                       min((col + 1) * size, image.width), min((row + 1) * size, image.height)))
+                    _write_atomic(self._tile_path(digest, level, col, row), self._encode(tile))
+    
+    def _level_image(self, digest: str, shrink: int) -> Image.Image:
+        info = self.info(digest)
+        factor = 2 ** shrink
+        target = (math.ceil(info["width"] / factor), math.ceil(info["height"] / factor))
+        with self.store.open_mmap(digest) as view:
+            image = Image.open(view)
+            # JPEG sources decode straight at 1/2, 1/4 or 1/8 scale; a no-op for other formats
+            if image.mode in ("L", "RGB"):
+                image.draft(image.mode, target)
+            image.load()
+        image = _display_mode(image)
+        if image.size == target:
+            return image
+        if image.size == (info["width"], info["height"]):
+            return image.reduce(factor)
+        return image.resize(target, Image.BOX)
+    
+    def _encode(self, tile: Image.Image) -> bytes:
+        buffer = io.BytesIO()
+        if self.tile_format == "png":
+            tile.save(buffer, "PNG", optimize=False)
+        else:
+            tile.save(buffer, self.tile_format.upper(), quality=self.quality)
+        return buffer.getvalue()
+    
+    def save_overlay(self, digest: str, heatmap: np.ndarray, regions: List[Dict]):
+        """Store a scan's activation map and ROI boxes (feature-grid cells) for overlay tiles"""
+        heatmap = np.asarray(heatmap, dtype=np.float64)
+        low, high = heatmap.min(), heatmap.max()
+        overlay = {
+            "heatmap": ((heatmap - low) / (high - low + 1e-8)).tolist(),
+            # Cell indices to [0, 1] image fractions; a box covers its last cell
+            "regions": [{
+                "x_min": region["x_min"] / heatmap.shape[1],
+                "y_min": region["y_min"] / heatmap.shape[0],
+                "x_max": (region["x_max"] + 1) / heatmap.shape[1],
+                "y_max": (region["y_max"] + 1) / heatmap.shape[0],
+            } for region in regions],
+        }
+        _write_atomic(os.path.join(self._dir(digest), "overlay.json"), json.dumps(overlay).encode())
+    
+    def overlay_version(self, digest: str) -> str:
+        """Changes whenever the scan is re-analyzed; overlay tiles are only valid per version"""
+        try:
+            return str(os.stat(os.path.join(self._dir(digest), "overlay.json")).st_mtime_ns)
+        except FileNotFoundError:
+            raise TileNotFoundError("Scan has not been analyzed")
+    
+    def overlay_tile(self, digest: str, level: int, col: int, row: int) -> bytes:
+        """Transparent PNG of the heatmap and ROI outlines over exactly one tile"""
+        grid = self._grid(digest, level, col, row)
+        try:
+            with open(os.path.join(self._dir(digest), "overlay.json")) as f:
+                overlay = json.load(f)
+        except FileNotFoundError:
+            raise TileNotFoundError("Scan has not been analyzed")
+        with timed(_OVERLAY):
+            size = self.tile_size
+            x0, y0 = col * size, row * size
+            width, height = min(size, grid["width"] - x0), min(size, grid["height"] - y0)
+            # Sample the coarse map only at this tile's pixel centres, as image fractions
+            xs = (x0 + np.arange(width) + 0.5) / grid["width"]
+            ys = (y0 + np.arange(height) + 0.5) / grid["height"]
+            activation = _bilinear(np.asarray(overlay["heatmap"]), ys, xs)
+            rgba = np.zeros((height, width, 4), dtype=np.uint8)
+            rgba[..., 0] = 255
+            rgba[..., 3] = (activation * HEATMAP_MAX_ALPHA).astype(np.uint8)
+            image = Image.fromarray(rgba, "RGBA")
+            
+            draw = ImageDraw.Draw(image)
+            line = max(1, width // 128)
+            for region in overlay["regions"]:
+                # Box in this tile's pixel coordinates; PIL clips what falls outside
+                box = (region["x_min"] * grid["width"] - x0, region["y_min"] * grid["height"] - y0,
+                       region["x_max"] * grid["width"] - x0 - 1, region["y_max"] * grid["height"] - y0 - 1)
+                if box[2] < 0 or box[3] < 0 or box[0] >= width or box[1] >= height:
+                    continue
+                draw.rectangle(box, outline=(255, 255, 0, 255), width=line)
+            buffer = io.BytesIO()
+            image.save(buffer, "PNG")
+        return buffer.getvalue()
+
+
+def _display_mode(image: Image.Image) -> Image.Image:
+    """8-bit L or RGB for tiling; 16-bit and float radiographs are rescaled to full range"""
+    if image.mode in ("L", "RGB"):
+        return image
+    if image.mode in ("I", "I;16", "I;16B", "I;16L", "F"):
+        array = np.asarray(image, dtype=np.float64)
+        low, high = array.min(), array.max()
+        return Image.fromarray(((array - low) / (high - low + 1e-5) * 255).astype(np.uint8), "L")
+    return image.convert("RGB")
+
+
+def _bilinear(grid: np.ndarray, ys: np.ndarray, xs: np.ndarray) -> np.ndarray:
+    """Values of `grid` (cell-centred over [0, 1]^2) at fractional positions"""
+    gy = np.clip(ys * grid.shape[0] - 0.5, 0, grid.shape[0] - 1)
+    gx = np.clip(xs * grid.shape[1] - 0.5, 0, grid.shape[1] - 1)
+    y0, x0 = np.floor(gy).astype(int), np.floor(gx).astype(int)
+    y1, x1 = np.minimum(y0 + 1, grid.shape[0] - 1), np.minimum(x0 + 1, grid.shape[1] - 1)
+    wy, wx = (gy - y0)[:, None], (gx - x0)[None, :]
+    top = grid[np.ix_(y0, x0)] * (1 - wx) + grid[np.ix_(y0, x1)] * wx
+    bottom = grid[np.ix_(y1, x0)] * (1 - wx) + grid[np.ix_(y1, x1)] * wx
+    return top * (1 - wy) + bottom * wy
+
+
+def _write_atomic(path: str, data: bytes):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    fd, tmp = tempfile.mkstemp(prefix=".tmp-", dir=os.path.dirname(path))
+    with os.fdopen(fd, "wb") as f:
+        f.write(data)
+    os.replace(tmp, path)
+
+
+tile_pyramid = TilePyramid(settings.TILE_DIR, scan_store, settings.TILE_SIZE, settings.TILE_FORMAT,
+                           settings.TILE_QUALITY)
@@ -71,13 +71,18 @@ class GradCAMExplainer:
                 return module
         raise ValueError(f"Layer {layer_name} not found")
     
-    def generate_heatmap(self, image: np.ndarray, class_idx: int = None) -> np.ndarray:
-        """Generate Grad-CAM heatmap"""
+    def generate_heatmap(self, image, class_idx: int = None) -> np.ndarray:
+        """Generate Grad-CAM heatmap for a (C, H, W) array or tensor"""
         import torch
         
         # Forward pass
-        image_tensor = torch.tensor(image, dtype=torch.float32).unsqueeze(0)
+        if isinstance(image, torch.Tensor):
+            image_tensor = image.to(torch.float32).unsqueeze(0)
+        else:
+            image_tensor = torch.tensor(image, dtype=torch.float32).unsqueeze(0)
         output = self.model(image_tensor)
+        if isinstance(output, tuple):  # MedicalImageCNN returns (logits, features)
+            output = output[0]
         
         if class_idx is None:
             class_idx = torch.argmax(output).item()
@@ -96,4 +101,9 @@ class GradCAMExplainer:
         heatmap = torch.relu(heatmap)
         heatmap = heatmap / (torch.max(heatmap) + 1e-10)
         
-        return heatmap.cpu().numpy()
+        return heatmap.detach().cpu().numpy()
+    
+    def generate_heatmap_from_bytes(self, image_bytes: bytes, preprocessor, class_idx: int = None,
+                                    digest: str = None) -> np.ndarray:
+        """Grad-CAM for an encoded scan, sharing the preprocessor's tensor cache"""
+        return self.generate_heatmap(preprocessor.preprocess_from_bytes(image_bytes, digest)[0], class_idx)
@@ -1,8 +1,10 @@
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, PlainTextResponse
 from config import settings
-from routers import auth, predictions, reports, admin
+from routers import auth, predictions, reports, admin, scans, vitals
+from monitoring.metrics import REGISTRY
+from monitoring.middleware import LatencyMiddleware
 import logging
 
 # Setup logging
@@ -25,10 +27,15 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Outermost, so recorded latency includes CORS handling
+app.add_middleware(LatencyMiddleware)
+
 # Include routers
 app.include_router(auth.router, prefix=f"{settings.API_V1_STR}/auth", tags=["Authentication"])
 app.include_router(predictions.router, prefix=f"{settings.API_V1_STR}/predictions", tags=["Predictions"])
 app.include_router(reports.router, prefix=f"{settings.API_V1_STR}/reports", tags=["Reports"])
+app.include_router(scans.router, prefix=f"{settings.API_V1_STR}/scans", tags=["Scans"])
+app.include_router(vitals.router, prefix=f"{settings.API_V1_STR}/vitals", tags=["Vitals"])
 app.include_router(admin.router, prefix=f"{settings.API_V1_STR}/admin", tags=["Admin"])
 
 @app.get("/")
@@ -43,6 +50,11 @@ async def root():
 async def health_check():
     return {"status": "healthy"}
 
+@app.get("/metrics", include_in_schema=False)
+async def metrics():
+    """Prometheus scrape endpoint"""
+    return PlainTextResponse(REGISTRY.render(), media_type="text/plain; version=0.0.4")
+
 if __name__ == "__main__":
     import uvicorn
     uvicorn.run(app, host="0.0.0.0", port=8000)
@@ -0,0 +1,187 @@
+import argparse
+import json
+import os
+import resource
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, Iterator, Optional, Sequence
+
+import numpy as np
+import pandas as pd
+
+from ml.models import SEVERITY_LEVELS, SymptomDiseasePredictor, top_margin
+from ml.streaming import FEATURE_COLUMNS
+
+# Set once per pool worker by _init_worker
+_predictor: Optional[SymptomDiseasePredictor] = None
+
+
+def _init_worker(model_path: str, version: Optional[str]):
+    global _predictor
+    # One process per core already; nested BLAS/OpenMP threads would only oversubscribe
+    from threadpoolctl import threadpool_limits
+    threadpool_limits(limits=1)
+    if version:
+        from ml.registry import registry
+        _predictor = registry.load(version)
+    else:
+        _predictor = SymptomDiseasePredictor(model_path=model_path)
+        _predictor.load()
+    for _, model in _predictor.members():
+        if hasattr(model, "n_jobs"):
+            model.set_params(n_jobs=1)
+
+
+def score_batch(predictor: SymptomDiseasePredictor, X: np.ndarray) -> Dict[str, np.ndarray]:
+    """Top disease, confidence and severity for every row, same rules as predict()
+    
+    Honours the predictor's cascade threshold: logistic regression scores the
+    whole batch and only rows under the margin go through the other members.
+    A distilled student scores every row alone.
+    """
+    X_scaled = predictor.scaler.transform(X)
+    if predictor.student is not None:
+        return _summarize(predictor, predictor.student.predict_proba(X_scaled), np.zeros(len(X), dtype=bool))
+    proba = predictor.lr_model.predict_proba(X_scaled)
+    if predictor.cascade_threshold is None:
+        escalate = np.ones(len(X), dtype=bool)
+    else:
+        escalate = top_margin(proba) < predictor.cascade_threshold
+    if escalate.any():
+        rows = X_scaled[escalate]
+        members = [model.predict_proba(rows) for _, model in predictor.members()[1:]]
+        proba[escalate] = (proba[escalate] + sum(members)) / 4
+    return _summarize(predictor, proba, escalate)
+
+
+def _summarize(predictor: SymptomDiseasePredictor, proba: np.ndarray, escalate: np.ndarray) -> Dict[str, np.ndarray]:
+    top = proba.argmax(axis=1)
+    confidence = proba[np.arange(len(top)), top]
+    return {
+        "predicted_disease": np.asarray(predictor.diseases, dtype=object)[top],
+        "confidence": confidence,
+        "severity": SEVERITY_LEVELS.classify(confidence),
+        "escalated": escalate,
+    }
+
+
+def _score_chunk(X: np.ndarray) -> Dict[str, np.ndarray]:
+    return score_batch(_predictor, X)
+
+
+def read_chunks(path: str, columns: Sequence[str], chunk_size: int) -> Iterator[pd.DataFrame]:
+    if path.endswith(".parquet"):
+        import pyarrow.parquet as pq
+        for batch in pq.ParquetFile(path).iter_batches(batch_size=chunk_size, columns=list(columns)):
+            yield batch.to_pandas()
+    else:
+        yield from pd.read_csv(path, usecols=list(columns), chunksize=chunk_size)
+
+
+class ChunkWriter:
+    """Appends scored chunks to Parquet (one row group each) or a COPY-ready CSV"""
+    
+    def __init__(self, path: str):
+        self.path = path
+        self.parquet = path.endswith(".parquet")
+        self._writer = None
+        self._header = True
+    
+    def write(self, frame: pd.DataFrame):
+        if self.parquet:
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+            table = pa.Table.from_pandas(frame, preserve_index=False)
+            if self._writer is None:
+                self._writer = pq.ParquetWriter(self.path, table.schema)
+            self._writer.write_table(table)
+        else:
+            # `COPY table FROM ... WITH (FORMAT csv, HEADER true)`
+            frame.to_csv(self.path, mode="w" if self._header else "a", header=self._header, index=False)
+            self._header = False
+    
+    def close(self):
+        if self._writer is not None:
+            self._writer.close()
+
+
+def bulk_score(input_path: str, output_path: str, model_path: str = "models/", version: Optional[str] = None,
+               chunk_size: int = 50_000, workers: Optional[int] = None,
+               id_columns: Sequence[str] = (), feature_columns: Sequence[str] = FEATURE_COLUMNS) -> Dict:
+    """Score a file of any size with at most `2 * workers` chunks in memory
+    
+    The parent reads chunks and sends only the feature matrix to the pool;
+    id columns stay behind and are rejoined with the scores, which are
+    written in input order as each chunk completes.
+    """
+    workers = workers or os.cpu_count() or 1
+    feature_columns = list(feature_columns)
+    columns = list(id_columns) + feature_columns
+    writer = ChunkWriter(output_path)
+    pending: deque = deque()
+    rows = escalated = chunks = 0
+    
+    def drain_one():
+        nonlocal rows, escalated
+        ids, future = pending.popleft()
+        scores = future.result()
+        frame = ids.assign(**{name: values for name, values in scores.items() if name != "escalated"})
+        writer.write(frame)
+        rows += len(frame)
+        escalated += int(scores["escalated"].sum())
+    
+    start = time.perf_counter()
+    try:
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                                 initargs=(model_path, version)) as pool:
+            for chunk in read_chunks(input_path, columns, chunk_size):
+                X = chunk[feature_columns].to_numpy(dtype=np.float64)
+                ids = chunk[list(id_columns)].reset_index(drop=True)
+                pending.append((ids, pool.submit(_score_chunk, X)))
+                chunks += 1
+                # Backpressure: stop reading ahead once the pool has a full queue
+                if len(pending) >= 2 * workers:
+                    drain_one()
+            while pending:
+                drain_one()
+    finally:
+        writer.close()
+    seconds = time.perf_counter() - start
+    
+    # ru_maxrss is KiB on Linux; children = the (exited) pool workers, largest one
+    scale = 1024 if os.uname().sysname == "Linux" else 1024 * 1024
+    return {
+        "rows": rows,
+        "chunks": chunks,
+        "workers": workers,
+        "seconds": seconds,
+        "rows_per_second": rows / seconds if seconds else None,
+        "escalated_fraction": escalated / rows if rows else None,
+        "peak_rss_mb": {
+            "parent": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / scale,
+            "largest_worker": resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss / scale,
+        },
+        "output": output_path,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Score a CSV/Parquet patient file with the symptom ensemble")
+    parser.add_argument("--input", required=True, help=".csv or .parquet")
+    parser.add_argument("--output", required=True, help=".parquet, or .csv ready for COPY")
+    model_group = parser.add_mutually_exclusive_group()
+    model_group.add_argument("--model-path", default="models/")
+    model_group.add_argument("--version", help="registry version instead of --model-path")
+    parser.add_argument("--chunk-size", type=int, default=50_000)
+    parser.add_argument("--workers", type=int, help="scoring processes (default: all cores)")
+    parser.add_argument("--id-columns", nargs="*", default=[], help="columns copied through to the output")
+    args = parser.parse_args()
+    
+    report = bulk_score(args.input, args.output, args.model_path, args.version, args.chunk_size,
+                        args.workers, args.id_columns)
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,109 @@
+import argparse
+import json
+import time
+from typing import Dict, Optional
+
+import numpy as np
+
+from ml.models import SymptomDiseasePredictor, top_margin
+
+
+def tune_cascade_threshold(predictor: SymptomDiseasePredictor, X_val: np.ndarray, y_val: np.ndarray,
+                           max_accuracy_loss: float = 0.005) -> Dict:
+    """Lowest logistic-regression margin threshold whose accuracy stays within
+    `max_accuracy_loss` of the full ensemble on held-out data
+    
+    Exiting early is monotone in the threshold: lowering it only adds the
+    next-highest-margin rows to the early-exit set. Sorting rows by margin and
+    taking prefix sums of per-row correctness gives cascade accuracy for every
+    candidate threshold in one pass.
+    """
+    classes = predictor.lr_model.classes_
+    member_proba = predictor.predict_member_proba(X_val)
+    lr_proba = member_proba["logistic_regression"]
+    ensemble_proba = sum(member_proba.values()) / len(member_proba)
+    lr_pred = classes[lr_proba.argmax(axis=1)]
+    full_pred = classes[ensemble_proba.argmax(axis=1)]
+    
+    margin = top_margin(lr_proba)
+    order = np.argsort(-margin, kind="stable")
+    sorted_margin = margin[order]
+    lr_correct = (lr_pred == y_val)[order]
+    full_correct = (full_pred == y_val)[order]
+    n = len(y_val)
+    
+    # correct[k]: rows right when the k highest-margin rows exit early
+    correct = (np.concatenate(([0], np.cumsum(lr_correct)))
+               + full_correct.sum() - np.concatenate(([0], np.cumsum(full_correct))))
+    accuracy = correct / n
+    full_accuracy = full_correct.mean()
+    
+    # A threshold can only separate rows with different margins
+    boundary = np.ones(n + 1, dtype=bool)
+    boundary[1:n] = sorted_margin[:-1] > sorted_margin[1:]
+    feasible = boundary & (full_accuracy - accuracy <= max_accuracy_loss)
+    k = int(np.flatnonzero(feasible).max())
+    
+    threshold: Optional[float] = float(sorted_margin[k - 1]) if k else None
+    exits = margin >= threshold if threshold is not None else np.zeros(n, dtype=bool)
+    cascade_pred = np.where(exits, lr_pred, full_pred)
+    return {
+        "threshold": threshold,
+        "max_accuracy_loss": max_accuracy_loss,
+        "validation_rows": n,
+        "early_exit_fraction": float(exits.mean()),
+        "accuracy_full": float(full_accuracy),
+        "accuracy_cascade": float((cascade_pred == y_val).mean()),
+        "agreement_with_full": float((cascade_pred == full_pred).mean()),
+    }
+
+
+def single_row_latency_ms(predictor: SymptomDiseasePredictor, X: np.ndarray) -> Dict:
+    """predict() latency percentiles, one row at a time"""
+    samples = np.empty(len(X))
+    for i in range(len(X)):
+        start = time.perf_counter()
+        predictor.predict(X[i:i + 1])
+        samples[i] = (time.perf_counter() - start) * 1000
+    p50, p95, p99 = np.percentile(samples, [50, 95, 99])
+    return {"mean": float(samples.mean()), "p50": float(p50), "p95": float(p95), "p99": float(p99)}
+
+
+def measure_cascade_latency(predictor: SymptomDiseasePredictor, X: np.ndarray) -> Dict:
+    """Single-row predict() latency with the cascade off and with the tuned threshold"""
+    threshold = predictor.cascade_threshold
+    try:
+        predictor.cascade_threshold = None
+        full = single_row_latency_ms(predictor, X)
+    finally:
+        predictor.cascade_threshold = threshold
+    return {"full": full, "cascade": single_row_latency_ms(predictor, X)}
+
+
+def main():
+    from ml.training import generate_synthetic_training_data
+    
+    parser = argparse.ArgumentParser(description="Tune the confidence-gated cascade threshold for saved models")
+    parser.add_argument("--model-path", default="models/")
+    parser.add_argument("--samples", type=int, default=5000, help="synthetic validation rows")
+    parser.add_argument("--max-accuracy-loss", type=float, default=0.005)
+    parser.add_argument("--latency-rows", type=int, default=300)
+    parser.add_argument("--dry-run", action="store_true", help="report without saving the threshold")
+    args = parser.parse_args()
+    
+    predictor = SymptomDiseasePredictor(model_path=args.model_path)
+    predictor.load()
+    if predictor.student is not None:
+        parser.error(f"{args.model_path} holds a distilled student; the cascade needs the full ensemble")
+    # Different seed from training so the threshold is tuned on unseen rows
+    X_val, y_val = generate_synthetic_training_data(args.samples, seed=7)
+    report = tune_cascade_threshold(predictor, X_val, y_val, args.max_accuracy_loss)
+    predictor.cascade_threshold = report["threshold"]
+    report["latency_ms"] = measure_cascade_latency(predictor, X_val[:args.latency_rows])
+    if not args.dry_run:
+        predictor.save()
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
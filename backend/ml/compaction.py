@@ -0,0 +1,371 @@
+import argparse
+import json
+import multiprocessing
+import os
+import shutil
+import tempfile
+import time
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+from sklearn.tree import DecisionTreeRegressor
+
+from ml.cascade import single_row_latency_ms
+from ml.models import SymptomDiseasePredictor
+
+
+class _Tree:
+    """One decision tree as plain arrays, thresholds already in `x <= t` float32 form"""
+    __slots__ = ("left", "right", "feature", "threshold", "value", "output")
+    
+    def __init__(self, left, right, feature, threshold, value, output: int = 0):
+        self.left, self.right, self.feature = left, right, feature
+        self.threshold, self.value, self.output = threshold, value, output
+
+
+def _float32_at_most(threshold: np.ndarray) -> np.ndarray:
+    """Largest float32 t32 with t32 <= threshold, so `x <= threshold` == `x <= t32` for float32 x"""
+    rounded = threshold.astype(np.float32)
+    return np.where(rounded > threshold, np.nextafter(rounded, np.float32(-np.inf)), rounded)
+
+
+def _sklearn_tree(estimator, normalize: bool) -> _Tree:
+    tree = estimator.tree_
+    value = tree.value.reshape(tree.node_count, -1).astype(np.float64)
+    if normalize:
+        value = value / np.maximum(value.sum(axis=1, keepdims=True), 1e-12)
+    return _Tree(tree.children_left, tree.children_right, tree.feature,
+                 _float32_at_most(tree.threshold), value)
+
+
+def _xgboost_trees(model) -> Tuple[List[_Tree], np.ndarray, str]:
+    """Trees, per-class base margin and objective from an XGBClassifier's JSON dump"""
+    learner = json.loads(model.get_booster().save_raw("json"))["learner"]
+    gbtree = learner["gradient_booster"]["model"]
+    base = np.atleast_1d(np.asarray(json.loads(learner["learner_model_param"]["base_score"]), dtype=np.float64))
+    trees = []
+    for raw, output in zip(gbtree["trees"], gbtree["tree_info"]):
+        conditions = np.asarray(raw["split_conditions"], dtype=np.float32)
+        # XGBoost sends x < c left; for float32 x that is x <= the float32 just below c
+        trees.append(_Tree(np.asarray(raw["left_children"]), np.asarray(raw["right_children"]),
+                           np.asarray(raw["split_indices"]), np.nextafter(conditions, np.float32(-np.inf)),
+                           conditions.astype(np.float64)[:, None], output))
+    return trees, base, learner["objective"]["name"]
+
+
+def _smallest_int(limit: int, signed: bool = True) -> np.dtype:
+    for dtype in ((np.int8, np.int16, np.int32) if signed else (np.uint8, np.uint16, np.uint32)):
+        if limit <= np.iinfo(dtype).max:
+            return np.dtype(dtype)
+    return np.dtype(np.int64)
+
+
+class CompactForest:
+    """Tree ensemble flattened into a few small-dtype arrays, scored a whole batch at once
+    
+    Internal nodes of every tree share `feature`/`threshold`/`left`/`right`;
+    a child reference below zero is leaf `-ref - 1`. Node and leaf indices
+    use the narrowest integer type that fits, thresholds are float32 (what
+    sklearn and XGBoost compare in anyway) and leaves of a forest of pure
+    trees store just the class index. `kind` says how leaves combine:
+    "mean" of per-tree class distributions (random forest, distilled
+    student) or "softmax"/"sigmoid" of per-class margin sums (XGBoost).
+    Drop-in for `predict_proba` in SymptomDiseasePredictor.
+    """
+    
+    def __init__(self, trees: Sequence[_Tree], classes: np.ndarray, kind: str = "mean",
+                 base_margin: Optional[np.ndarray] = None, max_depth: Optional[int] = None,
+                 value_dtype=np.float32):
+        self.classes_ = np.asarray(classes)
+        self.kind = kind
+        self.n_outputs = len(self.classes_) if kind != "sigmoid" else 1
+        self.base_margin = None if base_margin is None else np.asarray(base_margin, dtype=np.float64)
+        self._pack(trees, max_depth, value_dtype)
+    
+    def _pack(self, trees: Sequence[_Tree], max_depth: Optional[int], value_dtype):
+        feature, threshold, left, right, leaves, roots = [], [], [], [], [], []
+        
+        for tree in trees:
+            pending = []
+            
+            def ref(node: int, depth: int) -> int:
+                if tree.left[node] < 0 or (max_depth is not None and depth >= max_depth):
+                    # Cut below max_depth: an internal node's value is its subtree's class mix
+                    leaves.append(tree.value[node])
+                    return -len(leaves)
+                feature.append(tree.feature[node])
+                threshold.append(tree.threshold[node])
+                left.append(0)
+                right.append(0)
+                pending.append((len(feature) - 1, node, depth))
+                return len(feature) - 1
+            
+            roots.append(ref(0, 0))
+            while pending:
+                index, node, depth = pending.pop()
+                left[index] = ref(tree.left[node], depth + 1)
+                right[index] = ref(tree.right[node], depth + 1)
+        
+        index_dtype = _smallest_int(max(len(feature), len(leaves)))
+        self.feature = np.asarray(feature, dtype=_smallest_int(max(feature, default=0), signed=False))
+        self.threshold = np.asarray(threshold, dtype=np.float32)
+        self.left = np.asarray(left, dtype=index_dtype)
+        self.right = np.asarray(right, dtype=index_dtype)
+        self.roots = np.asarray(roots, dtype=index_dtype)
+        self.tree_output = np.asarray([tree.output for tree in trees], dtype=np.uint8)
+        values = np.vstack(leaves) if leaves else np.empty((0, self.n_outputs))
+        if self.kind == "mean" and len(values) and np.all(values.max(axis=1) == 1.0):
+            # Every leaf is pure (fully grown forest): one byte per leaf instead of a distribution
+            self.leaf_class = values.argmax(axis=1).astype(np.uint8)
+            self.values = None
+        else:
+            self.leaf_class = None
+            self.values = values.astype(value_dtype)
+    
+    @property
+    def n_trees(self) -> int:
+        return len(self.roots)
+    
+    @property
+    def nbytes(self) -> int:
+        arrays = (self.feature, self.threshold, self.left, self.right, self.roots, self.tree_output,
+                  self.leaf_class, self.values)
+        return sum(array.nbytes for array in arrays if array is not None)
+    
+    def _leaves(self, X: np.ndarray) -> np.ndarray:
+        """Leaf index reached in every tree for every row, shape (rows, trees)"""
+        n_rows = len(X)
+        nodes = np.tile(self.roots.astype(np.int64), n_rows)
+        rows = np.repeat(np.arange(n_rows), self.n_trees)
+        active = np.flatnonzero(nodes >= 0)
+        # One step per tree level, every (row, tree) pair still at an internal node at once
+        while len(active):
+            index = nodes[active]
+            go_left = X[rows[active], self.feature[index]] <= self.threshold[index]
+            nodes[active] = np.where(go_left, self.left[index], self.right[index])
+            active = active[nodes[active] >= 0]
+        return (-nodes - 1).reshape(n_rows, self.n_trees)
+    
+    def predict_proba(self, X: np.ndarray) -> np.ndarray:
+        X = np.asarray(X, dtype=np.float32)
+        leaves = self._leaves(X)
+        n_rows = len(X)
+        if self.kind == "mean":
+            if self.leaf_class is not None:
+                votes = self.leaf_class[leaves] + np.arange(n_rows)[:, None] * len(self.classes_)
+                counts = np.bincount(votes.ravel(), minlength=n_rows * len(self.classes_))
+                return counts.reshape(n_rows, -1) / self.n_trees
+            return self.values[leaves].astype(np.float64).mean(axis=1)
+        
+        columns = self.tree_output[None, :] + np.arange(n_rows)[:, None] * self.n_outputs
+        margin = np.bincount(columns.ravel(), weights=self.values[leaves, 0].astype(np.float64).ravel(),
+                             minlength=n_rows * self.n_outputs).reshape(n_rows, self.n_outputs)
+        if self.base_margin is not None:
+            margin += self.base_margin
+        if self.kind == "sigmoid":
+            positive = 1 / (1 + np.exp(-margin[:, 0]))
+            return np.column_stack([1 - positive, positive])
+        margin -= margin.max(axis=1, keepdims=True)
+        proba = np.exp(margin)
+        return proba / proba.sum(axis=1, keepdims=True)
+    
+    def predict(self, X: np.ndarray) -> np.ndarray:
+        return self.classes_[self.predict_proba(X).argmax(axis=1)]
+
+
+def compact_random_forest(model, n_trees: Optional[int] = None, max_depth: Optional[int] = None,
+                          value_dtype=np.float32) -> CompactForest:
+    """A RandomForestClassifier as a CompactForest, optionally with fewer or shallower trees
+    
+    Forest trees are exchangeable, so keeping the first `n_trees` is an
+    unbiased subsample. Cutting at `max_depth` turns each node at that depth
+    into a leaf holding its training class mix.
+    """
+    estimators = model.estimators_[:n_trees] if n_trees else model.estimators_
+    return CompactForest([_sklearn_tree(tree, normalize=True) for tree in estimators], model.classes_,
+                         "mean", max_depth=max_depth, value_dtype=value_dtype)
+
+
+def compact_xgboost(model, n_rounds: Optional[int] = None, value_dtype=np.float32) -> CompactForest:
+    """An XGBClassifier as a CompactForest, optionally keeping only the first `n_rounds` boosting rounds"""
+    trees, base, objective = _xgboost_trees(model)
+    if objective not in ("multi:softprob", "multi:softmax", "binary:logistic"):
+        raise ValueError(f"Unsupported XGBoost objective {objective!r}")
+    if n_rounds:
+        per_round = len(trees) // model.get_booster().num_boosted_rounds()
+        trees = trees[:n_rounds * per_round]
+    if objective == "binary:logistic":
+        # Stored as a probability; the margin is its logit
+        return CompactForest(trees, model.classes_, "sigmoid", np.log(base / (1 - base)),
+                             value_dtype=value_dtype)
+    return CompactForest(trees, model.classes_, "softmax", base, value_dtype=value_dtype)
+
+
+def distill(predictor: SymptomDiseasePredictor, X: np.ndarray, max_depth: int,
+            min_samples_leaf: int = 5) -> CompactForest:
+    """One regression tree fit to the ensemble's class probabilities on transfer rows `X`"""
+    X_scaled = predictor.scaler.transform(X)
+    teacher = predictor.predict_proba(X)
+    student = DecisionTreeRegressor(max_depth=max_depth, min_samples_leaf=min_samples_leaf, random_state=0)
+    student.fit(X_scaled, teacher)
+    return CompactForest([_sklearn_tree(student, normalize=False)], predictor.classes, "mean")
+
+
+def _variant(predictor: SymptomDiseasePredictor, model_path: str, rf=None, xgb=None,
+             student=None) -> SymptomDiseasePredictor:
+    variant = SymptomDiseasePredictor(model_path=model_path)
+    variant.scaler = predictor.scaler
+    variant.lr_model, variant.mlp_model = predictor.lr_model, predictor.mlp_model
+    variant.rf_model = rf if rf is not None else predictor.rf_model
+    variant.xgb_model = xgb if xgb is not None else predictor.xgb_model
+    variant.student = student
+    # Logistic regression is untouched, so its tuned early-exit margin still applies
+    variant.cascade_threshold = None if student is not None else predictor.cascade_threshold
+    variant.drift_reference = predictor.drift_reference
+    variant.save()
+    return variant
+
+
+def _load_footprint(model_path: str) -> Dict:
+    """Load time and private memory added by loading `model_path` (in a fresh process)"""
+    import gc
+    from monitoring.profiling import process_memory
+    gc.collect()
+    before = process_memory(os.getpid())
+    start = time.perf_counter()
+    predictor = SymptomDiseasePredictor(model_path=model_path)
+    predictor.load()
+    seconds = time.perf_counter() - start
+    gc.collect()
+    after = process_memory(os.getpid())
+    memory = after["uss"] - before["uss"] if before and after else None
+    return {"load_seconds": seconds, "memory_bytes": memory}
+
+
+def _artifact_bytes(model_path: str) -> int:
+    return sum(os.path.getsize(os.path.join(model_path, name)) for name in os.listdir(model_path)
+               if name.endswith(".pkl"))
+
+
+def evaluate_variant(variant: SymptomDiseasePredictor, reference: np.ndarray, X: np.ndarray, y: np.ndarray,
+                     latency_rows: int, pool) -> Dict:
+    """Size, load cost, latency and accuracy of one candidate artifact"""
+    proba = variant.predict_proba(X)
+    predicted = variant.classes[proba.argmax(axis=1)]
+    start = time.perf_counter()
+    variant.predict_proba(X)
+    batch_seconds = time.perf_counter() - start
+    report = {
+        "artifact_bytes": _artifact_bytes(variant.model_path),
+        **pool.apply(_load_footprint, (variant.model_path,)),
+        "latency_ms": single_row_latency_ms(variant, X[:latency_rows]),
+        "batch_rows_per_second": len(X) / batch_seconds,
+        "accuracy": float((predicted == y).mean()),
+        "agreement_with_original": float((proba.argmax(axis=1) == reference.argmax(axis=1)).mean()),
+        "max_probability_delta": float(np.abs(proba - reference).max()),
+    }
+    return report
+
+
+def compact(predictor: SymptomDiseasePredictor, X_eval: np.ndarray, y_eval: np.ndarray,
+            X_transfer: np.ndarray, rf_trees: Sequence[int] = (0, 50, 25), rf_depths: Sequence[int] = (0, 12, 8),
+            xgb_rounds: Sequence[int] = (0, 50), student_depths: Sequence[int] = (8, 12),
+            value_dtype=np.float32, latency_rows: int = 200, workdir: Optional[str] = None) -> Dict:
+    """Build and measure every candidate; 0 in a grid means "as trained"
+    
+    Each candidate is saved like a normal model directory so artifact size
+    and load time are what a worker would see. Memory is the private
+    memory a fresh process gains by loading it, measured in a spawned
+    child so earlier candidates can't pollute the number.
+    """
+    workdir = workdir or tempfile.mkdtemp(prefix="compaction-")
+    reference = predictor.predict_proba(X_eval)
+    candidates = {"original": _variant(predictor, os.path.join(workdir, "original"))}
+    for trees in rf_trees:
+        for depth in rf_depths:
+            rf = compact_random_forest(predictor.rf_model, trees or None, depth or None, value_dtype)
+            for rounds in xgb_rounds:
+                xgb = compact_xgboost(predictor.xgb_model, rounds or None, value_dtype)
+                name = f"compact_rf{trees or rf.n_trees}_depth{depth or 'full'}_xgb{rounds or 'all'}"
+                candidates[name] = _variant(predictor, os.path.join(workdir, name), rf=rf, xgb=xgb)
+    for depth in student_depths:
+        name = f"distilled_tree_depth{depth}"
+        student = distill(predictor, X_transfer, depth)
+        candidates[name] = _variant(predictor, os.path.join(workdir, name), student=student)
+    
+    with multiprocessing.get_context("spawn").Pool(1, maxtasksperchild=1) as pool:
+        report = {name: evaluate_variant(variant, reference, X_eval, y_eval, latency_rows, pool)
+                  for name, variant in candidates.items()}
+    return {"workdir": workdir, "candidates": report}
+
+
+def choose(candidates: Dict[str, Dict], memory_budget: Optional[int] = None,
+           max_accuracy_loss: Optional[float] = None) -> Optional[str]:
+    """Most accurate candidate within the memory budget (smallest on ties); with
+    `max_accuracy_loss`, the smallest candidate within that much of the original"""
+    fits = {name: c for name, c in candidates.items()
+            if memory_budget is None or (c["memory_bytes"] or c["artifact_bytes"]) <= memory_budget}
+    if max_accuracy_loss is not None:
+        floor = candidates["original"]["accuracy"] - max_accuracy_loss
+        fits = {name: c for name, c in fits.items() if c["accuracy"] >= floor}
+        return min(fits, key=lambda name: fits[name]["memory_bytes"] or fits[name]["artifact_bytes"], default=None)
+    return max(fits, key=lambda name: (fits[name]["accuracy"], -(fits[name]["memory_bytes"] or 0)), default=None)
+
+
+def main():
+    from ml.training import generate_synthetic_training_data
+    
+    parser = argparse.ArgumentParser(description="Shrink saved models and report the size/latency/accuracy trade-off")
+    parser.add_argument("--model-path", default="models/")
+    parser.add_argument("--samples", type=int, default=5000, help="synthetic evaluation rows")
+    parser.add_argument("--transfer-samples", type=int, default=50000, help="synthetic rows the student learns from")
+    parser.add_argument("--rf-trees", type=int, nargs="+", default=[0, 50, 25], help="0 = all trees")
+    parser.add_argument("--rf-depths", type=int, nargs="+", default=[0, 12, 8], help="0 = unpruned")
+    parser.add_argument("--xgb-rounds", type=int, nargs="+", default=[0, 50], help="0 = all rounds")
+    parser.add_argument("--student-depths", type=int, nargs="*", default=[8, 12],
+                        help="depths of distilled single-tree students (none to skip)")
+    parser.add_argument("--float16", action="store_true", help="store leaf values as float16")
+    parser.add_argument("--memory-budget-mb", type=float, help="pick the most accurate candidate under this")
+    parser.add_argument("--max-accuracy-loss", type=float, help="instead pick the smallest within this accuracy loss")
+    parser.add_argument("--output", help="save the chosen candidate as a model directory here")
+    parser.add_argument("--publish", action="store_true", help="publish the chosen candidate to MODEL_REGISTRY_DIR")
+    parser.add_argument("--report", help="also write the JSON report to this file")
+    args = parser.parse_args()
+    
+    predictor = SymptomDiseasePredictor(model_path=args.model_path)
+    predictor.load()
+    if predictor.student is not None:
+        parser.error(f"{args.model_path} already holds a distilled student; compact the original ensemble")
+    # Seeds differ from training (42) and cascade tuning (7)
+    X_eval, y_eval = generate_synthetic_training_data(args.samples, seed=11)
+    X_transfer, _ = generate_synthetic_training_data(args.transfer_samples, seed=13)
+    result = compact(predictor, X_eval, y_eval, X_transfer, args.rf_trees, args.rf_depths, args.xgb_rounds,
+                     args.student_depths, np.float16 if args.float16 else np.float32)
+    
+    budget = int(args.memory_budget_mb * 2 ** 20) if args.memory_budget_mb else None
+    chosen = choose(result["candidates"], budget, args.max_accuracy_loss)
+    result["chosen"] = chosen
+    if chosen and (args.output or args.publish):
+        variant = SymptomDiseasePredictor(model_path=os.path.join(result["workdir"], chosen))
+        variant.load()
+        if args.output:
+            variant.model_path = args.output
+            os.makedirs(args.output, exist_ok=True)
+            variant.save()
+        if args.publish:
+            from ml.registry import registry
+            result["version"] = registry.publish(variant, metrics=result["candidates"][chosen],
+                                                 notes=f"ml.compaction {chosen} of {args.model_path}")
+    shutil.rmtree(result.pop("workdir"), ignore_errors=True)
+    
+    text = json.dumps(result, indent=2)
+    if args.report:
+        with open(args.report, "w") as f:
+            f.write(text)
+    print(text)
+
+
+if __name__ == "__main__":
+    # Run the importable module, so pickled CompactForests name ml.compaction rather than __main__
+    from ml.compaction import main as compaction_main
+    compaction_main()
@@ -0,0 +1,149 @@
+import threading
+from typing import Dict, List, Optional, Sequence
+
+import numpy as np
+
+from config import settings
+from monitoring.metrics import REGISTRY
+
+# Smoothing for empty bins so PSI stays finite
+EPSILON = 1e-4
+
+
+def build_reference(X: np.ndarray, predicted: np.ndarray, feature_names: Sequence[str],
+                    class_names: Sequence[str], bins: int = 20) -> Dict:
+    """Binned feature and predicted-class distributions of the training data
+    
+    Bin edges are per-feature training quantiles, so every reference bin
+    holds roughly the same share of rows and live traffic shifting between
+    them moves PSI quickly. JSON-serializable; stored next to the models.
+    """
+    edges = np.quantile(X, np.linspace(0, 1, bins + 1)[1:-1], axis=0).T
+    feature_counts = np.stack([
+        np.bincount(np.searchsorted(edges[i], X[:, i], side="left"), minlength=bins)
+        for i in range(X.shape[1])
+    ])
+    return {
+        "feature_names": list(feature_names),
+        "edges": edges.tolist(),
+        "feature_counts": feature_counts.tolist(),
+        "class_names": list(class_names),
+        "class_counts": np.bincount(predicted, minlength=len(class_names)).tolist(),
+        "rows": int(len(X)),
+    }
+
+
+def _proportions(counts: np.ndarray) -> np.ndarray:
+    smoothed = counts + EPSILON
+    return smoothed / smoothed.sum(axis=-1, keepdims=True)
+
+
+def psi(expected: np.ndarray, actual: np.ndarray) -> np.ndarray:
+    """Population stability index along the last axis"""
+    e, a = _proportions(expected), _proportions(actual)
+    return np.sum((a - e) * np.log(a / e), axis=-1)
+
+
+def ks(expected: np.ndarray, actual: np.ndarray) -> np.ndarray:
+    """Kolmogorov-Smirnov statistic on the binned CDFs, along the last axis"""
+    e = np.cumsum(expected, axis=-1) / np.sum(expected, axis=-1, keepdims=True)
+    a = np.cumsum(actual, axis=-1) / np.sum(actual, axis=-1, keepdims=True)
+    return np.max(np.abs(a - e), axis=-1)
+
+
+class DriftMonitor:
+    """Live feature and prediction histograms compared against a training reference
+    
+    Memory is fixed by the reference's bin count: two count arrays (the
+    current and the previous window of `window` requests) are kept, never
+    the requests themselves. Each observation bins all features in one
+    vectorized comparison. Scores cover the last one to two windows, so
+    drift shows up within `window` requests instead of being diluted by
+    everything seen since startup.
+    """
+    
+    def __init__(self, window: int = 5000):
+        self.window = window
+        self._lock = threading.Lock()
+        self._reference: Optional[Dict] = None
+    
+    def _bind(self, reference: Dict):
+        self._reference = reference
+        self.feature_names: List[str] = reference["feature_names"]
+        self._edges = np.asarray(reference["edges"])
+        self._ref_features = np.asarray(reference["feature_counts"], dtype=np.float64)
+        self._ref_classes = np.asarray(reference["class_counts"], dtype=np.float64)
+        self._class_index = {name: i for i, name in enumerate(reference["class_names"])}
+        self._rows = np.arange(len(self.feature_names))
+        self._current = np.zeros_like(self._ref_features)
+        self._previous = np.zeros_like(self._ref_features)
+        self._current_classes = np.zeros_like(self._ref_classes)
+        self._previous_classes = np.zeros_like(self._ref_classes)
+        self._count = 0
+    
+    def observe(self, reference: Optional[Dict], features: np.ndarray, predicted: str):
+        """Record one request; a new reference (model swap) restarts the windows"""
+        if reference is None:
+            return
+        with self._lock:
+            if reference is not self._reference:
+                self._bind(reference)
+            bins = (features[:, None] > self._edges).sum(axis=1)
+            self._current[self._rows, bins] += 1
+            index = self._class_index.get(predicted)
+            if index is not None:
+                self._current_classes[index] += 1
+            self._count += 1
+            if self._count >= self.window:
+                self._previous, self._current = self._current, self._previous
+                self._previous_classes, self._current_classes = self._current_classes, self._previous_classes
+                self._current[:] = 0
+                self._current_classes[:] = 0
+                self._count = 0
+    
+    def scores(self) -> Optional[Dict]:
+        with self._lock:
+            if self._reference is None:
+                return None
+            live = self._current + self._previous
+            live_classes = self._current_classes + self._previous_classes
+            feature_names, ref_features, ref_classes = self.feature_names, self._ref_features, self._ref_classes
+        observations = int(live[0].sum())
+        if not observations:
+            return {"observations": 0, "features": {}, "prediction_psi": None}
+        feature_psi, feature_ks = psi(ref_features, live), ks(ref_features, live)
+        return {
+            "observations": observations,
+            "features": {
+                name: {"psi": float(feature_psi[i]), "ks": float(feature_ks[i])}
+                for i, name in enumerate(feature_names)
+            },
+            "prediction_psi": float(psi(ref_classes, live_classes)),
+        }
+
+
+drift_monitor = DriftMonitor(settings.DRIFT_WINDOW)
+
+_FEATURE_PSI = REGISTRY.gauge(
+    "feature_drift_psi", "PSI of live vs training feature distribution", ("feature",))
+_FEATURE_KS = REGISTRY.gauge(
+    "feature_drift_ks", "Binned KS statistic of live vs training feature distribution", ("feature",))
+_PREDICTION_PSI = REGISTRY.gauge(
+    "prediction_drift_psi", "PSI of live vs training predicted-disease distribution")
+_OBSERVATIONS = REGISTRY.gauge(
+    "drift_window_observations", "Requests in the current drift comparison window")
+
+
+def _collect_drift():
+    scores = drift_monitor.scores()
+    if scores is None:
+        return
+    _OBSERVATIONS.labels().set(scores["observations"])
+    for name, feature in scores["features"].items():
+        _FEATURE_PSI.labels(name).set(feature["psi"])
+        _FEATURE_KS.labels(name).set(feature["ks"])
+    if scores["prediction_psi"] is not None:
+        _PREDICTION_PSI.labels().set(scores["prediction_psi"])
+
+
+REGISTRY.add_collector(_collect_drift)
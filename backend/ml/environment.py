@@ -0,0 +1,163 @@
+import logging
+import threading
+import time
+from dataclasses import dataclass
+from typing import Dict, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+from starlette.concurrency import run_in_threadpool
+
+from config import settings
+
+logger = logging.getLogger(__name__)
+
+# environmental_data columns held per location, in array column order
+COLUMNS = ["aqi_index", "humidity_percent", "temperature_celsius", "pm25"]
+
+# Latest reading per location among those recent enough to serve (PostgreSQL DISTINCT ON)
+LATEST_READINGS = """
+SELECT DISTINCT ON (location) location, aqi_index, humidity_percent, temperature_celsius, pm25, recorded_at
+FROM environmental_data
+WHERE location IS NOT NULL AND recorded_at >= :since
+ORDER BY location, recorded_at DESC
+"""
+# Symptom-model inputs (request field names) -> EnvironmentReading attribute
+MODEL_INPUTS = {"aqi": "aqi", "humidity": "humidity", "temperature_env": "temperature"}
+
+
+class LocationUnavailableError(ValueError):
+    pass
+
+
+@dataclass(frozen=True)
+class EnvironmentReading:
+    location: str
+    aqi: float
+    humidity: float
+    temperature: float
+    pm25: float
+    recorded_at: float  # Unix seconds
+
+
+class EnvironmentContext:
+    """Latest environmental_data reading per location, served from memory
+    
+    The whole index (a location -> row dict over one float array) is rebuilt
+    off the request path and swapped by reference, like LiveModel's
+    predictor, so lookups never wait on the source. A lookup at most once
+    per `refresh_interval` starts a background reload; a failed reload keeps
+    serving the previous index. Readings older than `ttl` count as missing.
+    
+    `source` is "database" (environmental_data at DATABASE_URL) or the path
+    of a CSV file with the same columns plus `location`, for development.
+    """
+    
+    def __init__(self, source: str, ttl: float, refresh_interval: float, database_url: str = ""):
+        self.source = source
+        self.ttl = ttl
+        self.refresh_interval = refresh_interval
+        self.database_url = database_url
+        # (location -> row, rows of COLUMNS + recorded_at), replaced as one reference
+        self._index: Tuple[Dict[str, int], np.ndarray] = ({}, np.empty((0, len(COLUMNS) + 1)))
+        self.loaded_at: Optional[float] = None
+        self._last_attempt = 0.0
+        self._refresh_lock = threading.Lock()
+        self._engine = None
+    
+    @property
+    def attempted(self) -> bool:
+        return self._last_attempt > 0
+    
+    def _read(self, since: float) -> pd.DataFrame:
+        if self.source == "database":
+            from sqlalchemy import create_engine, text
+            
+            if self._engine is None:
+                self._engine = create_engine(self.database_url, pool_pre_ping=True)
+            since_at = pd.Timestamp(since, unit="s").to_pydatetime()
+            with self._engine.connect() as conn:
+                return pd.read_sql(text(LATEST_READINGS), conn, params={"since": since_at})
+        return pd.read_csv(self.source)
+    
+    def refresh(self, wait: bool = False):
+        """Reload the index from the source (blocking); skipped if another reload is running
+        
+        With `wait`, a first load waits for a concurrent one instead and
+        doesn't repeat it.
+        """
+        if not self._refresh_lock.acquire(blocking=wait):
+            return
+        try:
+            if wait and self.attempted:
+                return
+            self._last_attempt = time.monotonic()
+            start = time.perf_counter()
+            now = time.time()
+            frame = self._read(now - self.ttl)
+            # recorded_at is TIMESTAMP without time zone, written in UTC
+            recorded_at = pd.to_datetime(frame["recorded_at"], utc=True)
+            frame = frame.assign(recorded_at=(recorded_at - pd.Timestamp(0, tz="UTC")).dt.total_seconds())
+            frame = frame[frame["recorded_at"] >= now - self.ttl].dropna(subset=["location"])
+            frame = frame.sort_values("recorded_at").drop_duplicates("location", keep="last")
+            values = frame[COLUMNS + ["recorded_at"]].to_numpy(dtype=np.float64)
+            rows = {str(location): i for i, location in enumerate(frame["location"])}
+            self._index = (rows, values)
+            self.loaded_at = now
+            logger.info("Loaded environmental readings for %d locations in %.2fs",
+                        len(rows), time.perf_counter() - start)
+        except Exception:
+            logger.exception("Failed to refresh environmental readings; keeping %d locations",
+                             len(self._index[0]))
+        finally:
+            self._refresh_lock.release()
+    
+    def maybe_refresh(self):
+        """Cheap per-request check; a due reload runs in a background thread"""
+        if time.monotonic() - self._last_attempt < self.refresh_interval or self._refresh_lock.locked():
+            return
+        self._last_attempt = time.monotonic()
+        threading.Thread(target=self.refresh, name="environment-refresh", daemon=True).start()
+    
+    def lookup(self, location: str) -> Optional[EnvironmentReading]:
+        """The location's latest reading, or None if unknown or older than the TTL"""
+        rows, values = self._index
+        row = rows.get(location)
+        if row is None or time.time() - values[row, -1] > self.ttl:
+            return None
+        return EnvironmentReading(location, *values[row].tolist())
+    
+    async def get(self, location: str) -> Optional[EnvironmentReading]:
+        """lookup() for request handlers; the first one on a worker loads the index off the event loop"""
+        if not self.attempted:
+            await run_in_threadpool(self.refresh, True)
+        else:
+            self.maybe_refresh()
+        return self.lookup(location)
+    
+    async def complete(self, location: str, inputs: Dict[str, Optional[float]]) -> Dict[str, float]:
+        """Values for the MODEL_INPUTS left as None in `inputs`, from the location's latest reading"""
+        reading = await self.get(location)
+        if reading is None:
+            raise LocationUnavailableError(
+                f"No environmental readings for location {location!r} in the last {self.ttl / 3600:g}h")
+        filled = {name: getattr(reading, MODEL_INPUTS[name]) for name, value in inputs.items() if value is None}
+        unrecorded = [name for name, value in filled.items() if np.isnan(value)]
+        if unrecorded:
+            raise LocationUnavailableError(f"Latest reading for {location!r} has no {', '.join(unrecorded)}")
+        return filled
+    
+    def stats(self) -> Dict:
+        return {
+            "source": "database" if self.source == "database" else "file",
+            "locations": len(self._index[0]),
+            "loaded_at": self.loaded_at,
+            "ttl_seconds": self.ttl,
+            "refresh_seconds": self.refresh_interval,
+        }
+
+
+environment_context = EnvironmentContext(
+    settings.ENVIRONMENT_SOURCE, settings.ENVIRONMENT_TTL_SECONDS,
+    settings.ENVIRONMENT_REFRESH_SECONDS, settings.DATABASE_URL,
+)
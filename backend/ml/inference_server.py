@@ -0,0 +1,482 @@
+import argparse
+import gc
+import itertools
+import json
+import logging
+import mmap
+import os
+import queue
+import signal
+import socket
+import socketserver
+import struct
+import threading
+import time
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from config import settings
+
+logger = logging.getLogger(__name__)
+
+# Frame: 4-byte big-endian length, then a JSON header. Arrays never go in the
+# frame; they live in a memfd shared by the two ends of the connection.
+_LENGTH = struct.Struct("!I")
+ALIGNMENT = 64
+DEFAULT_BUFFER_BYTES = 8 * 1024 * 1024
+
+
+class InferenceError(Exception):
+    pass
+
+
+class InferenceUnavailableError(InferenceError):
+    pass
+
+
+def _align(offset: int) -> int:
+    return (offset + ALIGNMENT - 1) // ALIGNMENT * ALIGNMENT
+
+
+def _send_frame(sock: socket.socket, header: Dict, fds: Sequence[int] = ()):
+    payload = json.dumps(header).encode()
+    frame = _LENGTH.pack(len(payload)) + payload
+    if fds:
+        sent = socket.send_fds(sock, [frame], list(fds))
+        sock.sendall(frame[sent:])
+    else:
+        sock.sendall(frame)
+
+
+def _recv_exact(sock: socket.socket, size: int, data: bytes = b"") -> bytes:
+    while len(data) < size:
+        chunk = sock.recv(size - len(data))
+        if not chunk:
+            raise ConnectionError("Connection closed mid-frame")
+        data += chunk
+    return data
+
+
+def _recv_frame(sock: socket.socket) -> Tuple[Optional[Dict], List[int]]:
+    """Next header and any file descriptors sent with it; (None, []) on clean EOF"""
+    # Passed descriptors arrive with the first bytes of the frame they were sent with
+    data, fds, _, _ = socket.recv_fds(sock, _LENGTH.size, 4)
+    if not data:
+        return None, []
+    (length,) = _LENGTH.unpack(_recv_exact(sock, _LENGTH.size, data))
+    return json.loads(_recv_exact(sock, length)), fds
+
+
+class SharedBuffer:
+    """Anonymous shared memory (memfd) mapped by both client and replica"""
+    
+    def __init__(self, size: int, fd: Optional[int] = None):
+        self.size = size
+        if fd is None:
+            fd = os.memfd_create("inference-buffer", os.MFD_CLOEXEC)
+            os.ftruncate(fd, size)
+        self.fd = fd
+        self.map = mmap.mmap(fd, size)
+    
+    def write(self, array: np.ndarray, offset: int) -> Dict:
+        array = np.ascontiguousarray(array)
+        end = offset + array.nbytes
+        if end > self.size:
+            raise ValueError("Shared buffer too small")
+        self.map[offset:end] = array.data.cast("B")
+        return {"offset": offset, "shape": list(array.shape), "dtype": array.dtype.str}
+    
+    def view(self, spec: Dict) -> np.ndarray:
+        """Array backed directly by the shared pages (no copy)"""
+        dtype = np.dtype(spec["dtype"])
+        count = int(np.prod(spec["shape"], dtype=np.int64))
+        return np.frombuffer(self.map, dtype=dtype, count=count, offset=spec["offset"]).reshape(spec["shape"])
+    
+    def close(self):
+        self.map.close()
+        os.close(self.fd)
+
+
+class _Models:
+    """What one replica serves; loaded before replicas fork so pages are shared"""
+    
+    def __init__(self, load_detector: bool):
+        from ml.registry import live_model, warm_up
+        self.live_model = live_model
+        live_model.load_initial()
+        if live_model.predictor is not None:
+            warm_up(live_model.predictor)
+        self.detector = None
+        if load_detector:
+            from dl.cnn_models import AbnormalityDetector
+            self.detector = AbnormalityDetector(model_path=settings.SCAN_MODEL_PATH)
+        self.inflight = 0
+        self._lock = threading.Lock()
+    
+    def predictor(self):
+        self.live_model.maybe_refresh()
+        predictor = self.live_model.predictor
+        if predictor is None:
+            raise InferenceError("No symptom model loaded")
+        return predictor
+
+
+class _ReplicaHandler(socketserver.BaseRequestHandler):
+    """One client connection: frames are handled in order on this thread"""
+    
+    def handle(self):
+        models: _Models = self.server.models
+        buffer: Optional[SharedBuffer] = None
+        # Outputs that didn't fit the client's buffer, kept for its "fetch" after growing it
+        self._unsent: Optional[Tuple[Dict, Dict[str, np.ndarray]]] = None
+        try:
+            while True:
+                header, fds = _recv_frame(self.request)
+                if header is None:
+                    return
+                if fds:
+                    if buffer is not None:
+                        buffer.close()
+                    for extra in fds[1:]:
+                        os.close(extra)
+                    buffer = SharedBuffer(header["buffer_size"], fds[0])
+                counted = header["op"] not in ("ping", "fetch")
+                if counted:
+                    with models._lock:
+                        models.inflight += 1
+                try:
+                    response = self._dispatch(models, header, buffer)
+                except Exception as e:
+                    logger.exception("Inference request failed")
+                    response = {"error": f"{type(e).__name__}: {e}"}
+                finally:
+                    if counted:
+                        with models._lock:
+                            models.inflight -= 1
+                _send_frame(self.request, response)
+        except (ConnectionError, OSError):
+            return
+        finally:
+            if buffer is not None:
+                buffer.close()
+    
+    def _dispatch(self, models: _Models, header: Dict, buffer: Optional[SharedBuffer]) -> Dict:
+        op = header["op"]
+        if op == "ping":
+            return {"pid": os.getpid(), "inflight": models.inflight, "version": models.live_model.version,
+                    "detector": models.detector is not None}
+        if op == "fetch":
+            if self._unsent is None:
+                raise InferenceError("No outputs waiting to be fetched")
+            response, outputs = self._unsent
+            return self._with_outputs(buffer, header["out_offset"], outputs, response)
+        
+        inputs = {name: buffer.view(spec) for name, spec in header["arrays"].items()}
+        out_offset = header["out_offset"]
+        if op == "predict":
+            predictor, version = models.predictor(), models.live_model.version
+            response = {"result": predictor.predict(inputs["features"]), "version": version}
+            # The drift reference rides along when the client has none or one for another version
+            # (sent as [version], since None is a valid version: the unregistered fallback models)
+            known = header.get("drift_version")
+            if known is None or known[0] != version:
+                response["drift_reference"] = predictor.drift_reference
+            return response
+        if op == "predict_proba":
+            proba = models.predictor().predict_proba(inputs["features"])
+            return self._with_outputs(buffer, out_offset, {"proba": proba})
+        if op == "analyze":
+            if models.detector is None:
+                raise InferenceError("This replica does not serve the scan detector")
+            import torch
+            tensor = torch.from_numpy(inputs["tensor"])
+            result = models.detector.analyze_scan(tensor, header.get("return_heatmap", False))
+            heatmap = result.pop("heatmap", None)
+            outputs = {"heatmap": heatmap} if heatmap is not None else {}
+            return self._with_outputs(buffer, out_offset, outputs, {"result": result})
+        raise InferenceError(f"Unknown op {op!r}")
+    
+    def _with_outputs(self, buffer: SharedBuffer, offset: int, outputs: Dict[str, np.ndarray],
+                      response: Optional[Dict] = None) -> Dict:
+        """`response` plus output specs, or buffer_too_small with the outputs kept for a fetch"""
+        response = dict(response or {})
+        outputs = {name: np.asarray(array) for name, array in outputs.items()}
+        needed = offset + sum(_align(array.nbytes) for array in outputs.values())
+        if needed > buffer.size:
+            # Keep the results rather than making the client re-run the inference
+            self._unsent = (response, outputs)
+            return {"error": "buffer_too_small", "needed": needed}
+        self._unsent = None
+        specs = {}
+        for name, array in outputs.items():
+            specs[name] = buffer.write(array, offset)
+            offset = _align(offset + array.nbytes)
+        response["outputs"] = specs
+        return response
+
+
+class _ReplicaServer(socketserver.ThreadingUnixStreamServer):
+    daemon_threads = True
+    
+    def __init__(self, path: str, models: _Models):
+        self.models = models
+        if os.path.exists(path):
+            os.remove(path)
+        super().__init__(path, _ReplicaHandler)
+        os.chmod(path, 0o660)
+
+
+def _run_replica(path: str, models: _Models, threads: int):
+    for sig in (signal.SIGTERM, signal.SIGINT):
+        signal.signal(sig, signal.SIG_DFL)
+    gc.enable()
+    import torch
+    torch.set_num_threads(threads)
+    from threadpoolctl import threadpool_limits
+    threadpool_limits(limits=threads)
+    with _ReplicaServer(path, models) as server:
+        logger.info("Inference replica %d serving %s", os.getpid(), path)
+        server.serve_forever()
+
+
+def replica_paths(socket_dir: str, replicas: int) -> List[str]:
+    return [os.path.join(socket_dir, f"replica-{i}.sock") for i in range(replicas)]
+
+
+def serve(socket_dir: str, replicas: int, threads: int, load_detector: bool = True):
+    """Load models once, fork `replicas` processes each on its own socket, restart any that die"""
+    os.makedirs(socket_dir, exist_ok=True)
+    import torch
+    # No OpenMP team may exist at fork time; replicas raise their own thread counts
+    torch.set_num_threads(1)
+    gc.disable()
+    models = _Models(load_detector)
+    gc.collect()
+    gc.freeze()
+    
+    def spawn(path: str) -> int:
+        pid = os.fork()
+        if pid == 0:
+            code = 0
+            try:
+                _run_replica(path, models, threads)
+            except BaseException:
+                logger.exception("Inference replica crashed")
+                code = 1
+            finally:
+                os._exit(code)
+        return pid
+    
+    children = {spawn(path): path for path in replica_paths(socket_dir, replicas)}
+    stopping = False
+    
+    def shutdown(signum, frame):
+        nonlocal stopping
+        stopping = True
+        for pid in children:
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+    
+    signal.signal(signal.SIGTERM, shutdown)
+    signal.signal(signal.SIGINT, shutdown)
+    logger.info("Started %d inference replicas in %s", replicas, socket_dir)
+    while children:
+        pid, status = os.waitpid(-1, 0)
+        path = children.pop(pid, None)
+        if path is not None and not stopping:
+            logger.warning("Replica %d exited with %d; restarting", pid, os.waitstatus_to_exitcode(status))
+            children[spawn(path)] = path
+
+
+class _Connection:
+    def __init__(self, path: str, buffer_size: int):
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            self.sock.connect(path)
+        except BaseException:
+            # A down replica is retried often; don't leak a descriptor per attempt
+            self.sock.close()
+            raise
+        self.buffer = SharedBuffer(buffer_size)
+        self._send_fd = True
+    
+    def grow(self, size: int):
+        self.buffer.close()
+        self.buffer = SharedBuffer(max(size, self.buffer.size * 2))
+        self._send_fd = True
+    
+    def call(self, op: str, arrays: Dict[str, np.ndarray], **params) -> Tuple[Dict, Dict[str, np.ndarray]]:
+        needed = sum(_align(a.nbytes) for a in arrays.values())
+        if needed > self.buffer.size:
+            self.grow(needed * 2)
+        offset, specs = 0, {}
+        for name, array in arrays.items():
+            specs[name] = self.buffer.write(array, offset)
+            offset = _align(offset + array.nbytes)
+        header = {"op": op, "arrays": specs, "out_offset": offset, **params}
+        while True:
+            fds = ()
+            if self._send_fd:
+                header["buffer_size"] = self.buffer.size
+                fds = (self.buffer.fd,)
+                self._send_fd = False
+            _send_frame(self.sock, header, fds)
+            response, _ = _recv_frame(self.sock)
+            if response is None:
+                raise ConnectionError("Replica closed the connection")
+            if response.get("error") == "buffer_too_small":
+                # The replica kept the outputs; fetch them into a bigger buffer (inputs aren't needed again)
+                self.grow(response["needed"])
+                header = {"op": "fetch", "out_offset": 0}
+                continue
+            if "error" in response:
+                raise InferenceError(response["error"])
+            # Copy outputs out: the buffer is reused by the next call on this connection
+            outputs = {name: self.buffer.view(spec).copy() for name, spec in response.get("outputs", {}).items()}
+            return response, outputs
+    
+    def close(self):
+        self.sock.close()
+        self.buffer.close()
+
+
+class _Replica:
+    def __init__(self, path: str):
+        self.path = path
+        self.inflight = 0
+        self.down_until = 0.0
+        self.idle: "queue.SimpleQueue[_Connection]" = queue.SimpleQueue()
+
+
+class InferenceClient:
+    """Calls a pool of local inference replicas, least-loaded first
+    
+    Safe to share between threads: every call takes an idle connection (one
+    shared buffer each) to the replica with the fewest requests in flight
+    from this process. A replica that refuses connections is skipped for
+    `retry_after` seconds while the others take its load.
+    """
+    
+    def __init__(self, paths: Sequence[str], buffer_size: int = DEFAULT_BUFFER_BYTES, retry_after: float = 1.0):
+        if not paths:
+            raise ValueError("No inference replicas configured")
+        self.replicas = [_Replica(path) for path in paths]
+        self.buffer_size = buffer_size
+        self.retry_after = retry_after
+        self._lock = threading.Lock()
+        self._ticket = itertools.count()
+        # (version, drift reference) from the last predict that carried one; None until then
+        self._drift: Optional[Tuple[Optional[str], Optional[Dict]]] = None
+    
+    def _pick(self, exclude: set) -> Optional[_Replica]:
+        now = time.monotonic()
+        with self._lock:
+            candidates = [r for r in self.replicas if r.down_until <= now and r.path not in exclude]
+            if not candidates:
+                return None
+            least = min(r.inflight for r in candidates)
+            # Rotate among equally loaded replicas so idle traffic spreads too
+            tied = [r for r in candidates if r.inflight == least]
+            replica = tied[next(self._ticket) % len(tied)]
+            replica.inflight += 1
+            return replica
+    
+    def _call(self, op: str, arrays: Dict[str, np.ndarray], **params) -> Tuple[Dict, Dict[str, np.ndarray]]:
+        tried: set = set()
+        while True:
+            replica = self._pick(tried)
+            if replica is None:
+                raise InferenceUnavailableError("No inference replica reachable")
+            try:
+                try:
+                    connection = replica.idle.get_nowait()
+                except queue.Empty:
+                    connection = _Connection(replica.path, self.buffer_size)
+                try:
+                    result = connection.call(op, arrays, **params)
+                except InferenceError:
+                    # The replica answered; only the request failed
+                    replica.idle.put(connection)
+                    raise
+                except BaseException:
+                    connection.close()
+                    raise
+                replica.idle.put(connection)
+                return result
+            except (ConnectionError, FileNotFoundError, OSError):
+                tried.add(replica.path)
+                with self._lock:
+                    replica.down_until = time.monotonic() + self.retry_after
+            finally:
+                with self._lock:
+                    replica.inflight -= 1
+    
+    def predict(self, X: np.ndarray) -> Dict:
+        """Same result as SymptomDiseasePredictor.predict, computed in a replica"""
+        drift = self._drift
+        params = {} if drift is None else {"drift_version": [drift[0]]}
+        response, _ = self._call("predict", {"features": np.asarray(X, dtype=np.float64)}, **params)
+        if "drift_reference" in response:
+            self._drift = (response["version"], response["drift_reference"])
+        return response["result"]
+    
+    def predict_proba(self, X: np.ndarray) -> np.ndarray:
+        _, outputs = self._call("predict_proba", {"features": np.asarray(X, dtype=np.float64)})
+        return outputs["proba"]
+    
+    def analyze_scan(self, image_tensor, return_heatmap: bool = False) -> Dict:
+        """Same result as AbnormalityDetector.analyze_scan; the tensor crosses via shared memory"""
+        array = image_tensor.detach().cpu().numpy() if hasattr(image_tensor, "detach") else image_tensor
+        response, outputs = self._call("analyze", {"tensor": np.asarray(array, dtype=np.float32)},
+                                       return_heatmap=return_heatmap)
+        result = response["result"]
+        if "heatmap" in outputs:
+            result["heatmap"] = outputs["heatmap"]
+        return result
+    
+    @property
+    def drift_reference(self) -> Optional[Dict]:
+        """Training reference of the version replicas last predicted with (sent by predict, no call here)"""
+        return None if self._drift is None else self._drift[1]
+    
+    def status(self) -> List[Dict]:
+        replicas = []
+        for replica in self.replicas:
+            try:
+                connection = _Connection(replica.path, ALIGNMENT)
+                try:
+                    response, _ = connection.call("ping", {})
+                finally:
+                    connection.close()
+                replicas.append({"path": replica.path, "up": True, **response})
+            except (OSError, InferenceError) as e:
+                replicas.append({"path": replica.path, "up": False, "error": str(e)})
+        return replicas
+
+
+remote_inference: Optional[InferenceClient] = None
+if settings.INFERENCE_SOCKETS:
+    remote_inference = InferenceClient([p for p in settings.INFERENCE_SOCKETS.split(",") if p])
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Local inference replicas over Unix sockets + shared memory")
+    parser.add_argument("--socket-dir", default="/tmp/healthcare-inference")
+    parser.add_argument("--replicas", type=int, default=2)
+    parser.add_argument("--threads", type=int, help="torch/BLAS threads per replica (default: cores / replicas)")
+    parser.add_argument("--no-scan-model", action="store_true", help="serve only the symptom ensemble")
+    args = parser.parse_args()
+    
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(process)d %(levelname)s %(message)s")
+    cpus = len(os.sched_getaffinity(0)) if hasattr(os, "sched_getaffinity") else os.cpu_count() or 1
+    threads = args.threads or max(1, cpus // args.replicas)
+    paths = replica_paths(args.socket_dir, args.replicas)
+    print(f"INFERENCE_SOCKETS={','.join(paths)}", flush=True)
+    serve(args.socket_dir, args.replicas, threads, load_detector=not args.no_scan_model)
+
+
+if __name__ == "__main__":
+    main()
@@ -5,8 +5,55 @@ from xgboost import XGBClassifier
 from sklearn.neural_network import MLPClassifier
 from sklearn.preprocessing import StandardScaler
 import joblib
+import json
 import os
-from typing import Dict, List, Tuple
+import time
+from typing import Dict, List, Optional, Tuple
+from ml.drift import build_reference
+from ml.rules import Ladder, Rule, RuleSet
+from monitoring.metrics import REGISTRY, STAGE_BUCKETS, stage, timed
+
+_SCALER = stage("diagnose", "scaler")
+_LR = stage("diagnose", "logistic_regression")
+_RF = stage("diagnose", "random_forest")
+_XGB = stage("diagnose", "xgboost")
+_MLP = stage("diagnose", "mlp")
+_EXPLANATION = stage("diagnose", "explanation")
+_STUDENT = stage("diagnose", "distilled_student")
+
+# "full": cascade off; "early_exit": logistic regression alone was confident enough;
+# "distilled": a single student model (ml.compaction) stands in for the ensemble
+CASCADE_PATHS = ("full", "early_exit", "escalated", "distilled")
+_CASCADE_REQUESTS = REGISTRY.counter(
+    "diagnose_cascade_total", "Diagnoses by cascade path", ("path",))
+_CASCADE_SECONDS = REGISTRY.histogram(
+    "diagnose_cascade_model_seconds", "Model time per diagnosis by cascade path",
+    ("path",), buckets=STAGE_BUCKETS)
+_CASCADE = {path: (_CASCADE_REQUESTS.labels(path), _CASCADE_SECONDS.labels(path)) for path in CASCADE_PATHS}
+
+FEATURE_NAMES = [
+    "age", "temperature", "cough_severity", "fatigue",
+    "body_ache", "aqi", "humidity", "temperature_env"
+]
+# Shown in /diagnose responses in this order, " | "-joined
+EXPLANATION_RULES = RuleSet([
+    Rule("temperature", ">", 38, "High temperature detected ({value}°C)"),
+    Rule("cough_severity", ">", 5, "Moderate to severe cough reported"),
+    Rule("aqi", ">", 150, "Poor air quality index ({value})"),
+], FEATURE_NAMES, default_message="Standard symptom profile")
+# Ensemble confidence to severity 1-5
+SEVERITY_LEVELS = Ladder([(">", 0.8, 5), (">", 0.6, 4), (">", 0.4, 3), (">", 0.2, 2)], default=1)
+
+CASCADE_FILE = "cascade.json"
+DRIFT_REFERENCE_FILE = "drift_reference.json"
+STUDENT_FILE = "student.pkl"
+
+
+def top_margin(proba: np.ndarray) -> np.ndarray:
+    """Gap between the two most probable classes, per row"""
+    top2 = np.partition(proba, -2, axis=-1)
+    return top2[..., -1] - top2[..., -2]
+
 
 class SymptomDiseasePredictor:
     """Multi-model ensemble for disease prediction"""
@@ -25,34 +72,83 @@ class SymptomDiseasePredictor:
             "Common Cold", "Flu", "COVID-19", "Pneumonia", 
             "Bronchitis", "Asthma", "Allergies", "Migraine"
         ]
-        self.feature_names = [
-            "age", "temperature", "cough_severity", "fatigue",
-            "body_ache", "aqi", "humidity", "temperature_env"
+        self.feature_names = list(FEATURE_NAMES)
+        # Logistic-regression margin at or above which predict() skips the other members
+        self.cascade_threshold: Optional[float] = None
+        # Training-time feature/outcome histograms for ml.drift
+        self.drift_reference: Optional[Dict] = None
+        # Distilled replacement for all four members (ml.compaction); None serves the ensemble
+        self.student = None
+    
+    def members(self) -> List[Tuple[str, object]]:
+        """Ensemble members in a fixed order, named as in the stage metrics"""
+        if self.student is not None:
+            return [("student", self.student)]
+        return [
+            ("logistic_regression", self.lr_model),
+            ("random_forest", self.rf_model),
+            ("xgboost", self.xgb_model),
+            ("mlp", self.mlp_model),
         ]
     
+    @property
+    def classes(self) -> np.ndarray:
+        """Label values behind the probability columns"""
+        return self.members()[0][1].classes_
+    
     def train(self, X: np.ndarray, y: np.ndarray):
         """Train all models"""
+        self.fit_seconds = {}
+        start = time.perf_counter()
         X_scaled = self.scaler.fit_transform(X)
+        self.fit_seconds["scaler"] = time.perf_counter() - start
         
-        self.lr_model.fit(X_scaled, y)
-        self.rf_model.fit(X_scaled, y)
-        self.xgb_model.fit(X_scaled, y)
-        self.mlp_model.fit(X_scaled, y)
+        for name, model in self.members():
+            start = time.perf_counter()
+            model.fit(X_scaled, y)
+            self.fit_seconds[name] = time.perf_counter() - start
         
+        self.fit_drift_reference(X)
         self.save()
     
-    def predict(self, X: np.ndarray) -> Dict:
-        """Ensemble prediction with confidence scores"""
+    def fit_drift_reference(self, X: np.ndarray, max_rows: int = 100_000):
+        """Record the training distribution that live traffic is compared against"""
+        if len(X) > max_rows:
+            X = X[np.random.default_rng(0).choice(len(X), max_rows, replace=False)]
+        predicted = self.predict_proba(X).argmax(axis=1)
+        self.drift_reference = build_reference(X, predicted, self.feature_names, self.diseases)
+    
+    def predict_member_proba(self, X: np.ndarray) -> Dict[str, np.ndarray]:
+        """Class probabilities from each member for a whole batch of rows"""
         X_scaled = self.scaler.transform(X)
+        return {name: model.predict_proba(X_scaled) for name, model in self.members()}
+    
+    def predict_proba(self, X: np.ndarray) -> np.ndarray:
+        """Ensemble (mean) class probabilities for a whole batch of rows"""
+        member_proba = self.predict_member_proba(X)
+        return sum(member_proba.values()) / len(member_proba)
+    
+    def predict(self, X: np.ndarray) -> Dict:
+        """Ensemble prediction with confidence scores
+        
+        With a `cascade_threshold`, logistic regression runs first and its
+        probabilities are returned as-is when its top-class margin clears the
+        threshold; only uncertain rows pay for the other three members.
+        """
+        start = time.perf_counter()
+        with timed(_SCALER):
+            X_scaled = self.scaler.transform(X)
         
-        # Get predictions from all models
-        lr_proba = self.lr_model.predict_proba(X_scaled)[0]
-        rf_proba = self.rf_model.predict_proba(X_scaled)[0]
-        xgb_proba = self.xgb_model.predict_proba(X_scaled)[0]
-        mlp_proba = self.mlp_model.predict_proba(X_scaled)[0]
+        if self.student is not None:
+            path = "distilled"
+            with timed(_STUDENT):
+                ensemble_proba = self.student.predict_proba(X_scaled)[0]
+        else:
+            path, ensemble_proba = self._ensemble_proba(X_scaled)
         
-        # Ensemble: average probabilities
-        ensemble_proba = (lr_proba + rf_proba + xgb_proba + mlp_proba) / 4
+        requests, seconds = _CASCADE[path]
+        requests.inc()
+        seconds.observe(time.perf_counter() - start)
         
         # Get top predictions
         top_indices = np.argsort(ensemble_proba)[-3:][::-1]
@@ -65,50 +161,89 @@ class SymptomDiseasePredictor:
                 "severity": self._calculate_severity(ensemble_proba[idx])
             })
         
+        with timed(_EXPLANATION):
+            explanation = self._generate_explanation(X[0])
+        
         return {
             "predictions": predictions,
-            "explanation": self._generate_explanation(X[0])
+            "explanation": explanation,
+            "cascade_path": path
         }
     
+    def _ensemble_proba(self, X_scaled: np.ndarray) -> Tuple[str, np.ndarray]:
+        """Cascade path taken and mean member probabilities for one scaled row"""
+        with timed(_LR):
+            lr_proba = self.lr_model.predict_proba(X_scaled)[0]
+        
+        if self.cascade_threshold is not None and top_margin(lr_proba) >= self.cascade_threshold:
+            path = "early_exit"
+            ensemble_proba = lr_proba
+        else:
+            path = "full" if self.cascade_threshold is None else "escalated"
+            with timed(_RF):
+                rf_proba = self.rf_model.predict_proba(X_scaled)[0]
+            with timed(_XGB):
+                xgb_proba = self.xgb_model.predict_proba(X_scaled)[0]
+            with timed(_MLP):
+                mlp_proba = self.mlp_model.predict_proba(X_scaled)[0]
+            
+            # Ensemble: average probabilities
+            ensemble_proba = (lr_proba + rf_proba + xgb_proba + mlp_proba) / 4
+        return path, ensemble_proba
+    
     def _calculate_severity(self, confidence: float) -> int:
         """Map confidence to severity level"""
-        if confidence > 0.8:
-            return 5
-        elif confidence > 0.6:
-            return 4
-        elif confidence > 0.4:
-            return 3
-        elif confidence > 0.2:
-            return 2
-        else:
-            return 1
+        return SEVERITY_LEVELS.level(confidence)
     
     def _generate_explanation(self, features: np.ndarray) -> str:
         """Generate human-readable explanation"""
-        explanations = []
-        for i, feature in enumerate(self.feature_names):
-            value = features[i]
-            if feature == "temperature" and value > 38:
-                explanations.append(f"High temperature detected ({value}°C)")
-            elif feature == "cough_severity" and value > 5:
-                explanations.append(f"Moderate to severe cough reported")
-            elif feature == "aqi" and value > 150:
-                explanations.append(f"Poor air quality index ({value})")
-        
-        return " | ".join(explanations) if explanations else "Standard symptom profile"
+        return EXPLANATION_RULES.explain(features)[0]
     
     def save(self):
         """Save trained models"""
         joblib.dump(self.scaler, os.path.join(self.model_path, "scaler.pkl"))
-        joblib.dump(self.lr_model, os.path.join(self.model_path, "lr_model.pkl"))
-        joblib.dump(self.rf_model, os.path.join(self.model_path, "rf_model.pkl"))
-        joblib.dump(self.xgb_model, os.path.join(self.model_path, "xgb_model.pkl"))
-        joblib.dump(self.mlp_model, os.path.join(self.model_path, "mlp_model.pkl"))
+        student_path = os.path.join(self.model_path, STUDENT_FILE)
+        if self.student is not None:
+            # The student is the whole model; member pickles aren't needed to serve it
+            joblib.dump(self.student, student_path)
+        else:
+            if os.path.exists(student_path):
+                os.remove(student_path)
+            joblib.dump(self.lr_model, os.path.join(self.model_path, "lr_model.pkl"))
+            joblib.dump(self.rf_model, os.path.join(self.model_path, "rf_model.pkl"))
+            joblib.dump(self.xgb_model, os.path.join(self.model_path, "xgb_model.pkl"))
+            joblib.dump(self.mlp_model, os.path.join(self.model_path, "mlp_model.pkl"))
+        self._save_json(CASCADE_FILE, None if self.cascade_threshold is None else {"threshold": self.cascade_threshold})
+        self._save_json(DRIFT_REFERENCE_FILE, self.drift_reference)
     
     def load(self):
         """Load pre-trained models"""
         self.scaler = joblib.load(os.path.join(self.model_path, "scaler.pkl"))
-        self.lr_model = joblib.load(os.path.join(self.model_path, "lr_model.pkl"))
-        self.rf_model = joblib.load(os.path.join(self.model_path, "rf_model.pkl"))
-        self.xgb_model = joblib.load(os.path.join(self.model_path, "xgb_model.pkl"))
-        self.mlp_model = joblib.load(os.path.join(self.model_path, "mlp_model.pkl"))
+        student_path = os.path.join(self.model_path, STUDENT_FILE)
+        if os.path.exists(student_path):
+            self.student = joblib.load(student_path)
+        else:
+            self.student = None
+            self.lr_model = joblib.load(os.path.join(self.model_path, "lr_model.pkl"))
+            self.rf_model = joblib.load(os.path.join(self.model_path, "rf_model.pkl"))
+            self.xgb_model = joblib.load(os.path.join(self.model_path, "xgb_model.pkl"))
+            self.mlp_model = joblib.load(os.path.join(self.model_path, "mlp_model.pkl"))
+        cascade = self._load_json(CASCADE_FILE)
+        self.cascade_threshold = cascade["threshold"] if cascade else None
+        self.drift_reference = self._load_json(DRIFT_REFERENCE_FILE)
+    
+    def _save_json(self, name: str, data: Optional[Dict]):
+        """Write optional metadata; None removes a stale file from an earlier save"""
+        path = os.path.join(self.model_path, name)
+        if data is not None:
+            with open(path, "w") as f:
+                json.dump(data, f)
+        elif os.path.exists(path):
+            os.remove(path)
+    
+    def _load_json(self, name: str) -> Optional[Dict]:
+        try:
+            with open(os.path.join(self.model_path, name)) as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return None
@@ -0,0 +1,175 @@
+import os
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+from scipy.stats import loguniform, randint, uniform
+from sklearn.base import clone
+from sklearn.ensemble import RandomForestClassifier
+from sklearn.experimental import enable_halving_search_cv  # noqa: F401
+from sklearn.linear_model import LogisticRegression
+from sklearn.model_selection import HalvingRandomSearchCV, StratifiedKFold
+from sklearn.neural_network import MLPClassifier
+from sklearn.preprocessing import StandardScaler
+from threadpoolctl import threadpool_limits
+from xgboost import XGBClassifier
+
+from ml.models import SymptomDiseasePredictor
+
+MEMBERS = ("logistic_regression", "random_forest", "xgboost", "mlp")
+
+# Relative cost of a search per member, used to split the core budget
+MEMBER_WEIGHTS = {"logistic_regression": 1, "random_forest": 3, "xgboost": 3, "mlp": 2}
+
+
+def _member_spec(name: str, seed: int) -> Tuple[object, Dict]:
+    """Base estimator (single-threaded) and its search space"""
+    if name == "logistic_regression":
+        return LogisticRegression(max_iter=1000, random_state=seed), {
+            "C": loguniform(1e-3, 1e2),
+        }
+    if name == "random_forest":
+        return RandomForestClassifier(n_estimators=100, n_jobs=1, random_state=seed), {
+            "n_estimators": [100, 200, 400],
+            "max_depth": [None, 8, 16, 32],
+            "min_samples_leaf": randint(1, 10),
+            "max_features": ["sqrt", 0.5, None],
+        }
+    if name == "xgboost":
+        return XGBClassifier(n_estimators=100, n_jobs=1, random_state=seed), {
+            "n_estimators": [100, 200, 400],
+            "max_depth": randint(3, 10),
+            "learning_rate": loguniform(0.01, 0.3),
+            "subsample": uniform(0.6, 0.4),
+            "colsample_bytree": uniform(0.6, 0.4),
+        }
+    if name == "mlp":
+        return MLPClassifier(hidden_layer_sizes=(128, 64), max_iter=500, random_state=seed), {
+            "hidden_layer_sizes": [(64,), (128, 64), (256, 128)],
+            "alpha": loguniform(1e-5, 1e-2),
+            "learning_rate_init": loguniform(1e-4, 1e-2),
+        }
+    raise ValueError(f"Unknown ensemble member: {name}")
+
+
+def allocate_cores(core_budget: int, members=MEMBERS) -> Dict[str, int]:
+    """Split the core budget across members by expected cost, at least one core each"""
+    allocation = {name: 1 for name in members}
+    spare = core_budget - len(members)
+    if spare <= 0:
+        return allocation
+    total_weight = sum(MEMBER_WEIGHTS[name] for name in members)
+    shares = {name: spare * MEMBER_WEIGHTS[name] / total_weight for name in members}
+    for name in members:
+        allocation[name] += int(shares[name])
+    # Hand out cores lost to rounding by largest remainder
+    leftover = core_budget - sum(allocation.values())
+    for name in sorted(members, key=lambda n: shares[n] - int(shares[n]), reverse=True)[:leftover]:
+        allocation[name] += 1
+    return allocation
+
+
+def _set_threads(model, cores: int):
+    if isinstance(model, (RandomForestClassifier, XGBClassifier)):
+        model.set_params(n_jobs=cores)
+
+
+def _search_member(name: str, data_path: str, y: np.ndarray, cores: int, n_candidates: int,
+                   cv_folds: int, seed: int) -> Dict:
+    """Run in a pool worker: halving search across `cores`, then refit the winner"""
+    X = np.load(data_path, mmap_mode="r")
+    estimator, space = _member_spec(name, seed)
+    n_classes = len(np.unique(y))
+    
+    start = time.perf_counter()
+    # Folds run in `cores` joblib workers, each estimator single-threaded
+    search = HalvingRandomSearchCV(
+        estimator,
+        space,
+        n_candidates=n_candidates,
+        factor=3,
+        resource="n_samples",
+        # Small rounds must still see every class in every fold
+        min_resources=min(len(y), max(n_classes * cv_folds * 50, len(y) // 27)),
+        cv=StratifiedKFold(n_splits=cv_folds, shuffle=True, random_state=seed),
+        scoring="f1_macro",
+        refit=False,
+        n_jobs=cores,
+        random_state=seed,
+    )
+    with threadpool_limits(limits=1):
+        search.fit(X, y)
+    search_seconds = time.perf_counter() - start
+    
+    start = time.perf_counter()
+    model = clone(estimator).set_params(**search.best_params_)
+    _set_threads(model, cores)
+    with threadpool_limits(limits=cores):
+        model.fit(X, y)
+    _set_threads(model, 1)  # serving runs one request per thread
+    
+    return {
+        "name": name,
+        "model": model,
+        "best_params": search.best_params_,
+        "cv_f1_macro": float(search.best_score_),
+        "candidates_evaluated": int(len(search.cv_results_["params"])),
+        "cores": cores,
+        "search_seconds": search_seconds,
+        "refit_seconds": time.perf_counter() - start,
+    }
+
+
+class TrainingOrchestrator:
+    """Fits the four ensemble members concurrently, each with a budgeted search
+    
+    Members run in separate processes; within each, successive halving
+    shards cross-validation fits over the member's share of the core budget,
+    and every estimator is pinned to one thread during the search so the
+    total never exceeds `core_budget`.
+    """
+    
+    def __init__(self, core_budget: Optional[int] = None, n_candidates: int = 27,
+                 cv_folds: int = 3, seed: int = 42):
+        self.core_budget = core_budget or os.cpu_count() or 1
+        self.n_candidates = n_candidates
+        self.cv_folds = cv_folds
+        self.seed = seed
+    
+    def train(self, X: np.ndarray, y: np.ndarray, model_path: str = "models/") -> Tuple[SymptomDiseasePredictor, Dict]:
+        start = time.perf_counter()
+        scaler = StandardScaler()
+        X_scaled = scaler.fit_transform(X)
+        allocation = allocate_cores(self.core_budget)
+        
+        with tempfile.TemporaryDirectory(prefix="ensemble-train-") as tmp:
+            # Workers memory-map the scaled matrix instead of each unpickling a copy
+            data_path = os.path.join(tmp, "X_scaled.npy")
+            np.save(data_path, X_scaled)
+            with ProcessPoolExecutor(max_workers=min(len(MEMBERS), self.core_budget)) as pool:
+                futures = [
+                    pool.submit(_search_member, name, data_path, y, allocation[name],
+                                self.n_candidates, self.cv_folds, self.seed)
+                    for name in MEMBERS
+                ]
+                results: List[Dict] = [future.result() for future in futures]
+        
+        predictor = SymptomDiseasePredictor(model_path=model_path)
+        predictor.scaler = scaler
+        models = {result["name"]: result.pop("model") for result in results}
+        predictor.lr_model = models["logistic_regression"]
+        predictor.rf_model = models["random_forest"]
+        predictor.xgb_model = models["xgboost"]
+        predictor.mlp_model = models["mlp"]
+        predictor.fit_drift_reference(X)
+        predictor.save()
+        
+        report = {
+            "core_budget": self.core_budget,
+            "allocation": allocation,
+            "members": {result["name"]: result for result in results},
+            "wall_seconds": time.perf_counter() - start,
+        }
+        return predictor, report
@@ -0,0 +1,237 @@
+import hashlib
+import json
+import logging
+import os
+import shutil
+import stat
+import tempfile
+import threading
+import time
+import uuid
+from datetime import datetime, timezone
+from typing import Dict, List, Optional
+
+import joblib
+import numpy as np
+
+from config import settings
+from ml.models import SymptomDiseasePredictor
+
+logger = logging.getLogger(__name__)
+
+MANIFEST = "manifest.json"
+CURRENT = "CURRENT"
+SCALER_FILE = "scaler.pkl"
+
+
+class RegistryError(Exception):
+    pass
+
+
+def _sha256(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+class ModelRegistry:
+    """Immutable, versioned model artifacts on local disk
+    
+    Each version is a directory under `versions/` holding the predictor's
+    pickles plus a manifest with checksums and metrics. Versions are built in
+    a temp directory and renamed into place, so readers never see a partial
+    version; `CURRENT` names the promoted version and is replaced atomically.
+    """
+    
+    def __init__(self, root: str):
+        self.root = root
+        self.versions_dir = os.path.join(root, "versions")
+        os.makedirs(self.versions_dir, exist_ok=True)
+    
+    def _version_dir(self, version: str) -> str:
+        if not version or os.sep in version or version.startswith("."):
+            raise RegistryError(f"Invalid model version: {version!r}")
+        return os.path.join(self.versions_dir, version)
+    
+    def publish(self, predictor: SymptomDiseasePredictor, metrics: Optional[Dict] = None,
+                notes: Optional[str] = None) -> str:
+        """Write the predictor as a new immutable version and return its id"""
+        version = f"{datetime.now(timezone.utc):%Y%m%dT%H%M%S}-{uuid.uuid4().hex[:6]}"
+        staging = tempfile.mkdtemp(prefix=".staging-", dir=self.versions_dir)
+        try:
+            original_path = predictor.model_path
+            predictor.model_path = staging
+            try:
+                predictor.save()
+            finally:
+                predictor.model_path = original_path
+            
+            files = {name: _sha256(os.path.join(staging, name)) for name in sorted(os.listdir(staging))}
+            manifest = {
+                "version": version,
+                "created_at": datetime.now(timezone.utc).isoformat(),
+                "files": files,
+                "metrics": metrics or {},
+                "notes": notes,
+            }
+            with open(os.path.join(staging, MANIFEST), "w") as f:
+                json.dump(manifest, f, indent=2, default=str)
+            for name in os.listdir(staging):
+                os.chmod(os.path.join(staging, name), stat.S_IRUSR | stat.S_IRGRP | stat.S_IROTH)
+            os.rename(staging, self._version_dir(version))
+        except BaseException:
+            shutil.rmtree(staging, ignore_errors=True)
+            raise
+        return version
+    
+    def list_versions(self) -> List[Dict]:
+        manifests = []
+        for name in sorted(os.listdir(self.versions_dir)):
+            if name.startswith("."):
+                continue
+            try:
+                manifests.append(self.manifest(name))
+            except RegistryError:
+                continue
+        return manifests
+    
+    def manifest(self, version: str) -> Dict:
+        path = os.path.join(self._version_dir(version), MANIFEST)
+        try:
+            with open(path) as f:
+                return json.load(f)
+        except FileNotFoundError:
+            raise RegistryError(f"Unknown model version: {version}")
+    
+    def verify(self, version: str):
+        """Raise if any artifact no longer matches its manifest checksum"""
+        version_dir = self._version_dir(version)
+        for name, expected in self.manifest(version)["files"].items():
+            if _sha256(os.path.join(version_dir, name)) != expected:
+                raise RegistryError(f"Checksum mismatch for {version}/{name}")
+    
+    def load(self, version: str) -> SymptomDiseasePredictor:
+        self.verify(version)
+        predictor = SymptomDiseasePredictor(model_path=self._version_dir(version))
+        predictor.load()
+        return predictor
+    
+    def load_scaler(self, version: str):
+        """Just the version's fitted feature scaler, checksum-verified; no models are loaded"""
+        path = os.path.join(self._version_dir(version), SCALER_FILE)
+        if _sha256(path) != self.manifest(version)["files"].get(SCALER_FILE):
+            raise RegistryError(f"Checksum mismatch for {version}/{SCALER_FILE}")
+        return joblib.load(path)
+    
+    def current_version(self) -> Optional[str]:
+        try:
+            with open(os.path.join(self.root, CURRENT)) as f:
+                return f.read().strip() or None
+        except FileNotFoundError:
+            return None
+    
+    def promote(self, version: str):
+        """Point CURRENT at `version` (atomic rename, visible to every worker)"""
+        self.manifest(version)
+        fd, tmp = tempfile.mkstemp(prefix=".current-", dir=self.root)
+        with os.fdopen(fd, "w") as f:
+            f.write(version + "\n")
+        os.replace(tmp, os.path.join(self.root, CURRENT))
+    
+    def current_mtime(self) -> Optional[float]:
+        try:
+            return os.stat(os.path.join(self.root, CURRENT)).st_mtime
+        except FileNotFoundError:
+            return None
+
+
+def warm_up(predictor: SymptomDiseasePredictor, rows: int = 8):
+    """Run every member on single rows and a batch so first real requests don't pay lazy init
+    
+    Goes around predict(), so warm-up rows don't show up as diagnose traffic
+    in the stage and cascade metrics.
+    """
+    X = np.random.default_rng(0).random((rows, len(predictor.feature_names))) * 100
+    for i in range(rows):
+        predictor.predict_member_proba(X[i:i + 1])
+    predictor.predict_proba(X)
+
+
+class LiveModel:
+    """The predictor this worker serves, swapped by reference flip
+    
+    Request handlers read `.predictor` once and keep that reference, so an
+    in-flight request finishes on the model it started with. New versions
+    are loaded and warmed up off the request path before the flip.
+    Workers notice promotions made elsewhere by polling CURRENT's mtime at
+    most once per `poll_interval`; a swap that fails is retried at the next
+    poll.
+    """
+    
+    def __init__(self, registry: ModelRegistry, fallback_path: str, poll_interval: float = 5.0):
+        self.registry = registry
+        self.fallback_path = fallback_path
+        self.poll_interval = poll_interval
+        self.predictor: Optional[SymptomDiseasePredictor] = None
+        self.version: Optional[str] = None
+        self._seen_mtime: Optional[float] = None
+        self._last_poll = 0.0
+        self._swap_lock = threading.Lock()
+    
+    def set(self, predictor: SymptomDiseasePredictor, version: Optional[str] = None):
+        self.predictor, self.version = predictor, version
+    
+    def load_initial(self):
+        """Load the promoted version, or the legacy fixed-filename models"""
+        mtime = self.registry.current_mtime()
+        version = self.registry.current_version()
+        if version:
+            self.set(self.registry.load(version), version)
+        else:
+            predictor = SymptomDiseasePredictor(model_path=self.fallback_path)
+            predictor.load()
+            self.set(predictor, None)
+        # Only once loaded: after a failure the next poll tries the promoted version again
+        self._seen_mtime = mtime
+    
+    def swap_to(self, version: str):
+        """Load, verify and warm `version`, then flip the reference (blocking)"""
+        with self._swap_lock:
+            if version == self.version:
+                return
+            start = time.perf_counter()
+            predictor = self.registry.load(version)
+            warm_up(predictor)
+            self.set(predictor, version)
+            logger.info("Swapped to model %s in %.2fs", version, time.perf_counter() - start)
+    
+    def maybe_refresh(self):
+        """Cheap per-request check; a changed CURRENT triggers a background swap"""
+        now = time.monotonic()
+        if now - self._last_poll < self.poll_interval:
+            return
+        self._last_poll = now
+        mtime = self.registry.current_mtime()
+        if mtime is None or mtime == self._seen_mtime or self._swap_lock.locked():
+            return
+        version = self.registry.current_version()
+        if version and version != self.version:
+            threading.Thread(target=self._swap_in_background, args=(version, mtime),
+                             name="model-swap", daemon=True).start()
+        else:
+            self._seen_mtime = mtime
+    
+    def _swap_in_background(self, version: str, mtime: float):
+        try:
+            self.swap_to(version)
+        except Exception:
+            # CURRENT stays unseen, so the next poll retries
+            logger.exception("Failed to swap to model %s; still serving %s", version, self.version)
+            return
+        self._seen_mtime = mtime
+
+
+registry = ModelRegistry(settings.MODEL_REGISTRY_DIR)
+live_model = LiveModel(registry, settings.MODEL_PATH, settings.MODEL_POLL_SECONDS)
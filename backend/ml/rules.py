@@ -0,0 +1,135 @@
+import operator
+from dataclasses import dataclass
+from typing import List, Optional, Sequence, Tuple
+
+import numpy as np
+
+# Comparisons with a missing (NaN) value are false, so absent inputs never fire a rule
+OPS = {
+    ">": operator.gt,
+    ">=": operator.ge,
+    "<": operator.lt,
+    "<=": operator.le,
+    "==": operator.eq,
+    "present": lambda values, _: ~np.isnan(values),
+}
+
+
+@dataclass(frozen=True)
+class Rule:
+    feature: str
+    op: str                  # a key of OPS
+    threshold: float = 0.0
+    message: str = ""        # explanation text; "{value}" is replaced by the feature value
+    weight: float = 1.0      # score added when the rule fires
+    per: Optional[float] = None  # if set, add value / per * weight instead (proportional rules)
+
+
+class RuleSet:
+    """Threshold rules over named feature columns, evaluated for a whole batch at once
+    
+    Rules sharing a comparator are checked together as one NumPy comparison
+    of the matching columns against their thresholds, giving a (rows, rules)
+    mask. Scores add each firing rule's contribution in rule order and
+    explanations join firing rules' messages in rule order, the same results
+    as checking the rules one by one for each row.
+    """
+    
+    def __init__(self, rules: Sequence[Rule], features: Sequence[str], cap: Optional[float] = None,
+                 default_message: str = "", separator: str = " | "):
+        unknown = [rule for rule in rules if rule.feature not in features or rule.op not in OPS]
+        if unknown:
+            raise ValueError(f"Rules with unknown feature or comparator: {unknown}")
+        self.rules = list(rules)
+        self.features = list(features)
+        self.cap = cap
+        self.default_message = default_message
+        self.separator = separator
+        self.columns = np.array([self.features.index(rule.feature) for rule in self.rules], dtype=np.intp)
+        self._groups: List[Tuple[str, np.ndarray, np.ndarray, np.ndarray]] = []
+        for op in dict.fromkeys(rule.op for rule in self.rules):
+            positions = np.array([i for i, rule in enumerate(self.rules) if rule.op == op], dtype=np.intp)
+            thresholds = np.array([self.rules[i].threshold for i in positions], dtype=np.float64)
+            self._groups.append((op, positions, self.columns[positions], thresholds))
+    
+    def masks(self, X: np.ndarray) -> np.ndarray:
+        """Which rules fire for each row, shape (rows, rules)"""
+        X = np.atleast_2d(X)
+        fired = np.zeros((len(X), len(self.rules)), dtype=bool)
+        for op, positions, columns, thresholds in self._groups:
+            fired[:, positions] = OPS[op](X[:, columns], thresholds)
+        return fired
+    
+    def contributions(self, X: np.ndarray) -> np.ndarray:
+        """What each rule adds to each row's score (0 where it doesn't fire), shape (rows, rules)"""
+        X = np.atleast_2d(X)
+        fired = self.masks(X)
+        added = np.zeros(fired.shape)
+        for i, rule in enumerate(self.rules):
+            if not fired[:, i].any():
+                continue
+            if rule.per is None:
+                added[:, i] = np.where(fired[:, i], rule.weight, 0.0)
+            else:
+                added[:, i] = np.where(fired[:, i], X[:, self.columns[i]] / rule.per * rule.weight, 0.0)
+        return added
+    
+    def score(self, X: np.ndarray) -> np.ndarray:
+        """Sum of firing rules' weights per row, capped at `cap`"""
+        total = self.contributions(X).sum(axis=1)
+        return total if self.cap is None else np.minimum(total, self.cap)
+    
+    def messages(self, x: np.ndarray, fired: Optional[np.ndarray] = None) -> List[str]:
+        """Messages of the rules firing for one row, in rule order"""
+        if fired is None:
+            fired = self.masks(x)[0]
+        return [self.rules[i].message.format(value=x[self.columns[i]]) for i in np.flatnonzero(fired)]
+    
+    def explain(self, X: np.ndarray) -> List[str]:
+        """Firing rules' messages joined per row; `default_message` when none fire"""
+        X = np.atleast_2d(X)
+        fired = self.masks(X)
+        if len(X) == 1:
+            messages = self.messages(X[0], fired[0])
+            return [self.separator.join(messages) if messages else self.default_message]
+        messages = np.full(len(X), self.default_message, dtype=object)
+        # Rows that fire the same rules share one join; only "{value}" messages are formatted per row
+        patterns = fired @ (1 << np.arange(len(self.rules), dtype=np.int64)) if len(self.rules) else np.zeros(len(X))
+        for pattern in np.unique(patterns[patterns > 0]):
+            rows = np.flatnonzero(patterns == pattern)
+            parts = []
+            for i in np.flatnonzero(fired[rows[0]]):
+                message = self.rules[i].message
+                if "{value}" in message:
+                    parts.append([message.format(value=value) for value in X[rows, self.columns[i]]])
+                else:
+                    parts.append([message] * len(rows))
+            messages[rows] = [self.separator.join(row_parts) for row_parts in zip(*parts)]
+        return messages.tolist()
+
+
+class Ladder:
+    """Ordered (comparator, threshold, level) steps; the first that holds gives the level
+    
+    The table form of an if/elif chain on one value, classifying a whole
+    array with one np.select.
+    """
+    
+    def __init__(self, steps: Sequence[Tuple[str, float, object]], default):
+        self.steps = list(steps)
+        self.default = default
+        self._levels = np.array([level for _, _, level in self.steps] + [default])
+        self._bounds = np.array([threshold for _, threshold, _ in self.steps], dtype=np.float64)
+    
+    def classify(self, values: np.ndarray) -> np.ndarray:
+        values = np.asarray(values, dtype=np.float64)
+        conditions = [OPS[op](values, bound) for (op, _, _), bound in zip(self.steps, self._bounds)]
+        return np.select(conditions, self._levels[:-1], self._levels[-1])
+    
+    def level(self, value: float):
+        """One value's level, walking the steps directly (np.select costs more than it saves for one value)"""
+        for op, threshold, level in self.steps:
+            if OPS[op](value, threshold):
+                return level
+        return self.default
+
@@ -0,0 +1,147 @@
+import logging
+import queue
+import random
+import threading
+import time
+from collections import Counter
+from typing import Dict, Optional
+
+import numpy as np
+
+from config import settings
+from ml.models import SymptomDiseasePredictor
+
+logger = logging.getLogger(__name__)
+
+
+class ShadowScorer:
+    """Scores a sample of live traffic with a candidate model, off the request path
+    
+    `submit` is called after the production model has answered; it samples,
+    then enqueues without blocking and drops the row when the queue is full,
+    so a slow candidate can never add latency. A daemon thread drains the
+    queue in batches through the candidate's batched `predict_proba` and
+    compares top-1 diseases with what production returned.
+    Statistics are per worker process.
+    """
+    
+    def __init__(self, max_queue: int = 1024, batch_size: int = 64):
+        self.max_queue = max_queue
+        self.batch_size = batch_size
+        self._lock = threading.Lock()
+        self._queue: "queue.Queue" = queue.Queue(maxsize=max_queue)
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self.candidate: Optional[SymptomDiseasePredictor] = None
+        self.candidate_version: Optional[str] = None
+        self.sample_rate = 0.0
+        self._reset_stats()
+    
+    def _reset_stats(self):
+        self.started_at: Optional[float] = None
+        self.sampled = 0
+        self.dropped = 0
+        self.scored = 0
+        self.agreements = 0
+        self.confidence_delta_sum = 0.0
+        self.candidate_seconds = 0.0
+        self.divergences: Counter = Counter()
+    
+    @property
+    def running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+    
+    def start(self, candidate: SymptomDiseasePredictor, version: Optional[str], sample_rate: float):
+        self.stop()
+        with self._lock:
+            self._reset_stats()
+            self._queue = queue.Queue(maxsize=self.max_queue)
+            self.candidate, self.candidate_version = candidate, version
+            self.sample_rate = sample_rate
+            self.started_at = time.time()
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name="shadow-scorer", daemon=True)
+            self._thread.start()
+    
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        self.sample_rate = 0.0
+    
+    def submit(self, features: np.ndarray, primary: Dict):
+        """Offer one request's features and the production result; never blocks"""
+        if not self.sample_rate or random.random() >= self.sample_rate:
+            return
+        top = primary["predictions"][0]
+        try:
+            self._queue.put_nowait((features[0], top["disease"], top["confidence"]))
+            self.sampled += 1
+        except queue.Full:
+            self.dropped += 1
+    
+    def _drain(self):
+        items = [self._queue.get(timeout=0.25)]
+        while len(items) < self.batch_size:
+            try:
+                items.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return items
+    
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                items = self._drain()
+            except queue.Empty:
+                continue
+            try:
+                self._score([features for features, _, _ in items],
+                            [disease for _, disease, _ in items],
+                            np.array([confidence for _, _, confidence in items]))
+            except Exception:
+                logger.exception("Shadow scoring failed for a batch of %d rows", len(items))
+    
+    def _score(self, rows, primary_diseases, primary_confidence: np.ndarray):
+        candidate = self.candidate
+        start = time.perf_counter()
+        proba = candidate.predict_proba(np.vstack(rows))
+        elapsed = time.perf_counter() - start
+        top = proba.argmax(axis=1)
+        candidate_diseases = [candidate.diseases[idx] for idx in top]
+        with self._lock:
+            self.candidate_seconds += elapsed
+            self.scored += len(rows)
+            self.confidence_delta_sum += float(np.abs(proba[np.arange(len(top)), top] - primary_confidence).sum())
+            for primary, shadow in zip(primary_diseases, candidate_diseases):
+                if primary == shadow:
+                    self.agreements += 1
+                else:
+                    self.divergences[(primary, shadow)] += 1
+    
+    def stats(self, top_divergences: int = 10) -> Dict:
+        with self._lock:
+            scored = self.scored
+            return {
+                "running": self.running,
+                "candidate_version": self.candidate_version,
+                "sample_rate": self.sample_rate,
+                "started_at": self.started_at,
+                "queue_depth": self._queue.qsize(),
+                "max_queue": self.max_queue,
+                "sampled": self.sampled,
+                "dropped": self.dropped,
+                "scored": scored,
+                "agreement_rate": self.agreements / scored if scored else None,
+                "top1_divergence_rate": 1 - self.agreements / scored if scored else None,
+                "mean_abs_confidence_delta": self.confidence_delta_sum / scored if scored else None,
+                "candidate_ms_per_row": 1000 * self.candidate_seconds / scored if scored else None,
+                "top_divergences": [
+                    {"production": primary, "candidate": shadow, "count": count}
+                    for (primary, shadow), count in self.divergences.most_common(top_divergences)
+                ],
+            }
+
+
+shadow_scorer = ShadowScorer(settings.SHADOW_MAX_QUEUE, settings.SHADOW_BATCH_SIZE)
@@ -0,0 +1,348 @@
+import argparse
+import json
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+from sklearn.neighbors import BallTree, KDTree
+
+from config import settings
+from ml.streaming import FEATURE_COLUMNS
+
+AGE_BAND_YEARS = 10
+MAX_AGE_BAND = 9  # 90+
+# Appended cases are scanned brute force until this many (or this share of the tree) pile up
+REBUILD_MIN = 2048
+REBUILD_FRACTION = 0.05
+TREES = {"kd": KDTree, "ball": BallTree}
+
+
+def age_band(age: float) -> int:
+    return min(int(age) // AGE_BAND_YEARS, MAX_AGE_BAND)
+
+
+class _Shard:
+    """One tree over scaled points plus a small unindexed tail of newer cases
+    
+    Queries search the tree and brute-force the tail. Once the tail is big
+    enough, a background rebuild folds it into a new tree and swaps it in;
+    cases added meanwhile stay in the tail, so writers never wait on a build.
+    Case ids, ages and outcomes are kept in arrays aligned with the points.
+    """
+    
+    def __init__(self, dim: int, tree_type: str, leaf_size: int):
+        self.dim = dim
+        self.tree_type = tree_type
+        self.leaf_size = leaf_size
+        self.tree = None
+        self.rows = _Rows.empty()
+        self.tail_points = np.empty((0, dim))
+        self.tail_rows: List[Tuple] = []
+        self.rebuilding = False
+    
+    def __len__(self) -> int:
+        return len(self.rows.ids) + len(self.tail_rows)
+    
+    def build(self, points: np.ndarray, rows: "_Rows"):
+        self.tree = TREES[self.tree_type](points, leaf_size=self.leaf_size) if len(points) else None
+        self.rows = rows
+    
+    def append(self, point: np.ndarray, row: Tuple) -> bool:
+        """Add to the tail; True if the tail is now due to be folded into the tree"""
+        size = len(self.tail_rows)
+        if size == len(self.tail_points):
+            grown = np.empty((max(64, 2 * size), self.dim))
+            grown[:size] = self.tail_points[:size]
+            self.tail_points = grown
+        self.tail_points[size] = point
+        self.tail_rows.append(row)
+        due = len(self.tail_rows) >= max(REBUILD_MIN, REBUILD_FRACTION * len(self.rows.ids))
+        return due and not self.rebuilding
+    
+    def snapshot(self) -> Tuple:
+        size = len(self.tail_rows)
+        return self.tree, self.rows, self.tail_points[:size], self.tail_rows[:size]
+    
+    def rebuilt(self, tree, rows: "_Rows", folded: int):
+        """Install a tree that includes the first `folded` tail entries"""
+        self.tree, self.rows = tree, rows
+        self.tail_points = self.tail_points[folded:len(self.tail_rows)].copy()
+        self.tail_rows = self.tail_rows[folded:]
+        self.rebuilding = False
+
+
+class _Rows:
+    """Per-case columns aligned with a shard's points"""
+    __slots__ = ("ids", "ages", "diseases")
+    
+    def __init__(self, ids: np.ndarray, ages: np.ndarray, diseases: np.ndarray):
+        self.ids, self.ages, self.diseases = ids, ages, diseases
+    
+    @classmethod
+    def empty(cls) -> "_Rows":
+        return cls(np.empty(0, dtype=object), np.empty(0), np.empty(0, dtype=object))
+    
+    @classmethod
+    def from_tuples(cls, rows: Sequence[Tuple]) -> "_Rows":
+        if not rows:
+            return cls.empty()
+        ids, ages, diseases = zip(*rows)
+        return cls(np.asarray(ids, dtype=object), np.asarray(ages, dtype=np.float64),
+                   np.asarray(diseases, dtype=object))
+    
+    def take(self, index: np.ndarray) -> "_Rows":
+        return _Rows(self.ids[index], self.ages[index], self.diseases[index])
+    
+    def concat(self, other: "_Rows") -> "_Rows":
+        return _Rows(np.concatenate([self.ids, other.ids]), np.concatenate([self.ages, other.ages]),
+                     np.concatenate([self.diseases, other.diseases]))
+
+
+def _points(state: Tuple, dim: int) -> Tuple[np.ndarray, _Rows]:
+    """Every point in a shard snapshot (tree data, then tail) with its rows"""
+    tree, rows, tail_points, tail_rows = state
+    base = np.asarray(tree.data) if tree is not None else np.empty((0, dim))
+    return np.concatenate([base, tail_points]), rows.concat(_Rows.from_tuples(tail_rows))
+
+
+def _query_shard(state: Tuple, query: np.ndarray, k: int) -> Tuple[np.ndarray, _Rows]:
+    tree, rows, tail_points, tail_rows = state
+    distances, found = [], []
+    if tree is not None:
+        d, i = tree.query(query[None, :], k=min(k, len(rows.ids)))
+        distances.append(d[0])
+        found.append(rows.take(i[0]))
+    if len(tail_points):
+        d = np.sqrt(((tail_points - query) ** 2).sum(axis=1))
+        nearest = np.argsort(d)[:k]
+        distances.append(d[nearest])
+        found.append(_Rows.from_tuples([tail_rows[i] for i in nearest]))
+    if not distances:
+        return np.empty(0), _Rows.empty()
+    merged = found[0]
+    for rows in found[1:]:
+        merged = merged.concat(rows)
+    return np.concatenate(distances), merged
+
+
+class SimilarCaseIndex:
+    """k-nearest similar cases over scaler-normalized symptom feature vectors
+    
+    Each case is stored in four KD-trees: one over everything, one per age
+    band, one per outcome disease and one per (band, disease) pair. A query
+    searches only the trees for its filter shape, so filtering makes queries
+    cheaper rather than turning them into a post-filtered scan; the price is
+    four copies of the points (about 256 bytes per case).
+    Features are normalized with the training scaler's mean and scale, kept
+    with the index so it survives model swaps unchanged.
+    """
+    
+    def __init__(self, mean: Optional[np.ndarray] = None, scale: Optional[np.ndarray] = None,
+                 tree_type: str = "kd", leaf_size: int = 40):
+        if tree_type not in TREES:
+            raise ValueError(f"Unknown tree type {tree_type!r}")
+        self.mean = None if mean is None else np.asarray(mean, dtype=np.float64)
+        self.scale = None if scale is None else np.asarray(scale, dtype=np.float64)
+        self.tree_type = tree_type
+        self.leaf_size = leaf_size
+        self.dim = len(FEATURE_COLUMNS)
+        self._all = self._new_shard()
+        # Keyed (band, disease), (band, None) and (None, disease)
+        self._shards: Dict[Tuple[Optional[int], Optional[str]], _Shard] = {}
+        self._ids = set()
+        self._lock = threading.Lock()
+        self._rebuilder = ThreadPoolExecutor(max_workers=1, thread_name_prefix="similar-cases-rebuild")
+    
+    def _new_shard(self) -> _Shard:
+        return _Shard(self.dim, self.tree_type, self.leaf_size)
+    
+    @property
+    def ready(self) -> bool:
+        return self.mean is not None
+    
+    def set_scaler(self, mean: np.ndarray, scale: np.ndarray):
+        """Adopt a scaler if the index has none yet (empty index, first recorded case)"""
+        with self._lock:
+            if self.mean is None:
+                self.mean, self.scale = np.asarray(mean, dtype=np.float64), np.asarray(scale, dtype=np.float64)
+    
+    def _normalize(self, X: np.ndarray) -> np.ndarray:
+        return (np.asarray(X, dtype=np.float64) - self.mean) / self.scale
+    
+    def __len__(self) -> int:
+        return len(self._all)
+    
+    def build(self, ids: Sequence, X: np.ndarray, diseases: Sequence[str]):
+        """Replace the index contents with these cases (raw, unscaled features)"""
+        X = np.asarray(X, dtype=np.float64)
+        rows = _Rows(np.asarray(ids, dtype=object), X[:, 0].copy(), np.asarray(diseases, dtype=object))
+        points = self._normalize(X)
+        bands = np.minimum(X[:, 0] // AGE_BAND_YEARS, MAX_AGE_BAND).astype(int)
+        names = rows.diseases.astype(str)
+        masks = [((int(band), None), bands == band) for band in np.unique(bands)]
+        masks += [((None, str(disease)), names == disease) for disease in np.unique(names)]
+        masks += [((band, disease), in_band & in_disease)
+                  for (band, _), in_band in masks if band is not None
+                  for (_, disease), in_disease in masks if disease is not None]
+        shards = {}
+        for key, mask in masks:
+            index = np.flatnonzero(mask)
+            if len(index):
+                shards[key] = self._new_shard()
+                shards[key].build(points[index], rows.take(index))
+        everything = self._new_shard()
+        everything.build(points, rows)
+        with self._lock:
+            self._all, self._shards = everything, shards
+            self._ids = set(rows.ids.tolist())
+    
+    def add(self, case_id, features: np.ndarray, disease: str) -> bool:
+        """Record one case (e.g. a just-stored prediction); searchable immediately
+        
+        False, and nothing added, if `case_id` is already in the index.
+        """
+        features = np.asarray(features, dtype=np.float64).reshape(-1)
+        point = self._normalize(features)
+        band = age_band(features[0])
+        row = (case_id, float(features[0]), disease)
+        with self._lock:
+            if case_id in self._ids:
+                return False
+            self._ids.add(case_id)
+            targets = [self._all]
+            for key in ((band, None), (None, disease), (band, disease)):
+                if key not in self._shards:
+                    self._shards[key] = self._new_shard()
+                targets.append(self._shards[key])
+            for target in targets:
+                if target.append(point, row):
+                    target.rebuilding = True
+                    self._rebuilder.submit(self._rebuild, target)
+        return True
+    
+    def _rebuild(self, shard: _Shard):
+        with self._lock:
+            state = shard.snapshot()
+        points, rows = _points(state, self.dim)
+        tree = TREES[self.tree_type](points, leaf_size=self.leaf_size)
+        with self._lock:
+            shard.rebuilt(tree, rows, len(state[3]))
+    
+    def _snapshots(self, age_bands: Optional[Iterable[int]], diseases: Optional[Iterable[str]]) -> List[Tuple]:
+        with self._lock:
+            if age_bands is None and diseases is None:
+                return [self._all.snapshot()]
+            bands = [None] if age_bands is None else set(age_bands)
+            names = [None] if diseases is None else set(diseases)
+            shards = (self._shards.get((band, disease)) for band in bands for disease in names)
+            return [shard.snapshot() for shard in shards if shard is not None]
+    
+    def query(self, features: np.ndarray, k: int = 10, age_bands: Optional[Iterable[int]] = None,
+              diseases: Optional[Iterable[str]] = None, exclude: Iterable = ()) -> List[Dict]:
+        """The `k` nearest cases, optionally restricted to age bands and outcome diseases
+        
+        Case ids in `exclude` (e.g. the presentation's own stored case) are skipped.
+        """
+        query = self._normalize(np.asarray(features, dtype=np.float64).reshape(-1))
+        exclude = set(exclude)
+        distances, found = [], []
+        for state in self._snapshots(age_bands, diseases):
+            d, rows = _query_shard(state, query, k + len(exclude))
+            distances.append(d)
+            found.append(rows)
+        if not distances:
+            return []
+        distances = np.concatenate(distances)
+        rows = found[0]
+        for more in found[1:]:
+            rows = rows.concat(more)
+        order = np.argsort(distances, kind="stable")
+        if exclude:
+            order = order[~np.isin(rows.ids[order], list(exclude))]
+        return self._results(distances, rows, order[:k])
+    
+    @staticmethod
+    def _results(distances: np.ndarray, rows: _Rows, order: np.ndarray) -> List[Dict]:
+        return [{
+            "case_id": rows.ids[i],
+            "distance": float(distances[i]),
+            "disease": rows.diseases[i],
+            "age": float(rows.ages[i]),
+            "age_band": age_band(rows.ages[i]),
+        } for i in order]
+    
+    def brute_force(self, features: np.ndarray, k: int = 10, age_bands: Optional[Iterable[int]] = None,
+                    diseases: Optional[Iterable[str]] = None) -> List[Dict]:
+        """Reference answer scanning every stored case with a mask; for benchmarks and checks"""
+        with self._lock:
+            state = self._all.snapshot()
+        points, rows = _points(state, self.dim)
+        query = self._normalize(np.asarray(features, dtype=np.float64).reshape(-1))
+        distances = np.sqrt(((points - query) ** 2).sum(axis=1))
+        keep = np.ones(len(points), dtype=bool)
+        if age_bands is not None:
+            keep &= np.isin(np.minimum(rows.ages // AGE_BAND_YEARS, MAX_AGE_BAND), list(age_bands))
+        if diseases is not None:
+            keep &= np.isin(rows.diseases, list(diseases))
+        candidates = np.flatnonzero(keep)
+        order = candidates[np.argsort(distances[candidates], kind="stable")[:k]]
+        return self._results(distances, rows, order)
+    
+    def save(self, path: str):
+        """Raw features, outcomes and the scaler as .npz (no pickled objects)"""
+        with self._lock:
+            state = self._all.snapshot()
+        points, rows = _points(state, self.dim)
+        features = points * self.scale + self.mean
+        features[:, 0] = rows.ages
+        np.savez(path, features=features, ids=rows.ids.astype(str), diseases=rows.diseases.astype(str),
+                 mean=self.mean, scale=self.scale)
+    
+    @classmethod
+    def load(cls, path: str, tree_type: str = "kd") -> "SimilarCaseIndex":
+        data = np.load(path, allow_pickle=False)
+        index = cls(data["mean"], data["scale"], tree_type)
+        index.build(data["ids"].astype(object), data["features"], data["diseases"].astype(object))
+        return index
+
+
+def _open_index() -> SimilarCaseIndex:
+    if settings.SIMILAR_CASES_PATH and os.path.exists(settings.SIMILAR_CASES_PATH):
+        return SimilarCaseIndex.load(settings.SIMILAR_CASES_PATH)
+    return SimilarCaseIndex()
+
+
+similar_cases = _open_index()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build the similar-case index from a case file")
+    parser.add_argument("--input", required=True, help=".csv or .parquet with feature columns, disease and an id")
+    parser.add_argument("--output", default=settings.SIMILAR_CASES_PATH)
+    parser.add_argument("--model-path", default=settings.MODEL_PATH, help="predictor whose scaler normalizes")
+    parser.add_argument("--id-column", default="case_id")
+    parser.add_argument("--disease-column", default="disease")
+    parser.add_argument("--tree", choices=sorted(TREES), default="kd")
+    args = parser.parse_args()
+    
+    import pandas as pd
+    from ml.models import SymptomDiseasePredictor
+    columns = [args.id_column, args.disease_column] + FEATURE_COLUMNS
+    frame = pd.read_parquet(args.input, columns=columns) if args.input.endswith(".parquet") \
+        else pd.read_csv(args.input, usecols=columns)
+    predictor = SymptomDiseasePredictor(model_path=args.model_path)
+    predictor.load()
+    index = SimilarCaseIndex(predictor.scaler.mean_, predictor.scaler.scale_, args.tree)
+    started = time.perf_counter()
+    index.build(frame[args.id_column].astype(str).tolist(), frame[FEATURE_COLUMNS].to_numpy(dtype=np.float64),
+                frame[args.disease_column].astype(str).tolist())
+    seconds = time.perf_counter() - started
+    index.save(args.output)
+    print(json.dumps({"cases": len(index), "build_seconds": seconds, "output": args.output}, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,266 @@
+import argparse
+import json
+import os
+import resource
+import tempfile
+import time
+from typing import Callable, Dict, Iterator, Optional, Sequence, Tuple
+
+import numpy as np
+import pandas as pd
+import xgboost as xgb
+from sklearn.ensemble import RandomForestClassifier
+from sklearn.linear_model import SGDClassifier
+from sklearn.neural_network import MLPClassifier
+from sklearn.preprocessing import StandardScaler
+
+from ml.models import SymptomDiseasePredictor
+
+FEATURE_COLUMNS = [
+    "age", "temperature", "cough_severity", "fatigue",
+    "body_ache", "aqi", "humidity", "temperature_env"
+]
+
+Chunk = Tuple[np.ndarray, np.ndarray]
+
+
+class ChunkSource:
+    """Re-iterable stream of (X, y) chunks; each iteration re-opens the input"""
+    
+    def __init__(self, open_chunks: Callable[[], Iterator[pd.DataFrame]],
+                 feature_columns: Sequence[str] = FEATURE_COLUMNS, label_column: str = "label"):
+        self._open_chunks = open_chunks
+        self.feature_columns = list(feature_columns)
+        self.label_column = label_column
+    
+    def __iter__(self) -> Iterator[Chunk]:
+        for frame in self._open_chunks():
+            X = frame[self.feature_columns].to_numpy(dtype=np.float64)
+            y = frame[self.label_column].to_numpy()
+            yield X, y
+    
+    @classmethod
+    def from_csv(cls, path: str, chunk_size: int = 100_000, **kwargs) -> "ChunkSource":
+        columns = list(kwargs.get("feature_columns", FEATURE_COLUMNS)) + [kwargs.get("label_column", "label")]
+        return cls(lambda: pd.read_csv(path, usecols=columns, chunksize=chunk_size), **kwargs)
+    
+    @classmethod
+    def from_parquet(cls, path: str, chunk_size: int = 100_000, **kwargs) -> "ChunkSource":
+        import pyarrow.parquet as pq
+        
+        columns = list(kwargs.get("feature_columns", FEATURE_COLUMNS)) + [kwargs.get("label_column", "label")]
+        
+        def open_chunks():
+            parquet = pq.ParquetFile(path)
+            for batch in parquet.iter_batches(batch_size=chunk_size, columns=columns):
+                yield batch.to_pandas()
+        
+        return cls(open_chunks, **kwargs)
+    
+    @classmethod
+    def from_query(cls, database_url: str, query: str, chunk_size: int = 100_000, **kwargs) -> "ChunkSource":
+        """Stream a SQL query through a server-side cursor"""
+        from sqlalchemy import create_engine, text
+        
+        engine = create_engine(database_url)
+        
+        def open_chunks():
+            with engine.connect() as conn:
+                conn = conn.execution_options(stream_results=True)
+                yield from pd.read_sql(text(query), conn, chunksize=chunk_size)
+        
+        return cls(open_chunks, **kwargs)
+
+
+class _ScaledIter(xgb.DataIter):
+    """Feeds scaled chunks to XGBoost without materializing the dataset"""
+    
+    def __init__(self, source: ChunkSource, scaler: StandardScaler, classes: np.ndarray,
+                 cache_prefix: Optional[str] = None):
+        self._source = source
+        self._scaler = scaler
+        self._classes = classes
+        self._chunks: Optional[Iterator[Chunk]] = None
+        super().__init__(cache_prefix=cache_prefix)
+    
+    def next(self, input_data: Callable) -> int:
+        if self._chunks is None:
+            self._chunks = iter(self._source)
+        try:
+            X, y = next(self._chunks)
+        except StopIteration:
+            return 0
+        # XGBoost wants labels 0..k-1 in the same order as the sklearn members' classes_
+        input_data(data=self._scaler.transform(X), label=np.searchsorted(self._classes, y))
+        return 1
+    
+    def reset(self):
+        self._chunks = None
+
+
+class _Reservoir:
+    """Uniform fixed-size row sample over a stream (Algorithm R, vectorized per chunk)"""
+    
+    def __init__(self, capacity: int, n_features: int, seed: int = 42):
+        self.capacity = capacity
+        self.X = np.empty((capacity, n_features))
+        self.y: Optional[np.ndarray] = None  # dtype follows the labels: ints, strings, objects
+        self.seen = 0
+        self._rng = np.random.default_rng(seed)
+    
+    def _fit_labels(self, y: np.ndarray):
+        """Allocate the label array on the first chunk, widen it if a later one needs (e.g. a longer name)"""
+        if self.y is None:
+            self.y = np.empty(self.capacity, dtype=y.dtype)
+            return
+        dtype = np.promote_types(self.y.dtype, y.dtype)
+        if dtype != self.y.dtype:
+            self.y = self.y.astype(dtype)
+    
+    def add(self, X: np.ndarray, y: np.ndarray):
+        y = np.asarray(y)
+        self._fit_labels(y)
+        n = len(y)
+        fill = max(0, min(self.capacity - self.seen, n))
+        if fill:
+            self.X[self.seen:self.seen + fill] = X[:fill]
+            self.y[self.seen:self.seen + fill] = y[:fill]
+        if fill < n:
+            # Row t (0-based, t >= capacity) replaces a random slot with probability capacity / (t + 1)
+            positions = np.arange(self.seen + fill, self.seen + n)
+            slots = (self._rng.random(n - fill) * (positions + 1)).astype(np.int64)
+            keep = slots < self.capacity
+            self.X[slots[keep]] = X[fill:][keep]
+            self.y[slots[keep]] = y[fill:][keep]
+        self.seen += n
+    
+    def sample(self) -> Chunk:
+        size = min(self.seen, self.capacity)
+        return self.X[:size], (self.y[:size] if self.y is not None else np.empty(0))
+
+
+def _peak_rss_mb() -> float:
+    # ru_maxrss is KiB on Linux (bytes on macOS)
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / 1024 if os.uname().sysname == "Linux" else peak / (1024 * 1024)
+
+
+def train_streaming(source: ChunkSource, model_path: str = "models/", epochs: int = 3,
+                    rf_sample_size: int = 200_000, external_memory: bool = False,
+                    xgb_rounds: int = 100, seed: int = 42) -> Tuple[SymptomDiseasePredictor, Dict]:
+    """Fit the ensemble in bounded memory from a chunked source
+    
+    Pass 1 accumulates scaler statistics, the label set and a reservoir
+    sample for the random forest. SGD-logistic and the MLP then learn with
+    `partial_fit` over `epochs` further passes, and XGBoost builds a
+    quantized matrix (or an on-disk external-memory cache) from an iterator.
+    """
+    timings: Dict[str, float] = {}
+    peak_rss: Dict[str, float] = {}
+    rng = np.random.default_rng(seed)
+    
+    start = time.perf_counter()
+    scaler = StandardScaler()
+    reservoir = _Reservoir(rf_sample_size, len(source.feature_columns), seed)
+    labels: set = set()
+    for X, y in source:
+        scaler.partial_fit(X)
+        labels.update(np.unique(y).tolist())
+        reservoir.add(X, y)
+    classes = np.array(sorted(labels))
+    timings["stats_pass"] = time.perf_counter() - start
+    peak_rss["stats_pass"] = _peak_rss_mb()
+    
+    start = time.perf_counter()
+    sgd = SGDClassifier(loss="log_loss", random_state=seed)
+    mlp = MLPClassifier(hidden_layer_sizes=(128, 64), random_state=seed)
+    for _ in range(epochs):
+        for X, y in source:
+            order = rng.permutation(len(y))
+            X_scaled = scaler.transform(X[order])
+            y = y[order]
+            sgd.partial_fit(X_scaled, y, classes=classes)
+            mlp.partial_fit(X_scaled, y, classes=classes)
+    timings["incremental_fit"] = time.perf_counter() - start
+    peak_rss["incremental_fit"] = _peak_rss_mb()
+    
+    start = time.perf_counter()
+    X_sample, y_sample = reservoir.sample()
+    rows, rf_rows = reservoir.seen, len(y_sample)
+    rf = RandomForestClassifier(n_estimators=100, random_state=seed)
+    rf.fit(scaler.transform(X_sample), y_sample)
+    timings["random_forest_sample_fit"] = time.perf_counter() - start
+    peak_rss["random_forest_sample_fit"] = _peak_rss_mb()
+    
+    start = time.perf_counter()
+    params = {"objective": "multi:softprob", "num_class": len(classes), "tree_method": "hist", "seed": seed}
+    with tempfile.TemporaryDirectory(prefix="xgb-cache-") as cache_dir:
+        if external_memory:
+            iterator = _ScaledIter(source, scaler, classes, cache_prefix=os.path.join(cache_dir, "cache"))
+            dtrain = xgb.DMatrix(iterator)
+        else:
+            dtrain = xgb.QuantileDMatrix(_ScaledIter(source, scaler, classes))
+        booster = xgb.train(params, dtrain, num_boost_round=xgb_rounds)
+        del dtrain
+    xgb_model = xgb.XGBClassifier()
+    xgb_model.load_model(bytearray(booster.save_raw("json")))
+    timings["xgboost_fit"] = time.perf_counter() - start
+    peak_rss["xgboost_fit"] = _peak_rss_mb()
+    
+    predictor = SymptomDiseasePredictor(model_path=model_path)
+    predictor.scaler = scaler
+    predictor.lr_model = sgd  # logistic regression fit by SGD
+    predictor.rf_model = rf
+    predictor.xgb_model = xgb_model
+    predictor.mlp_model = mlp
+    # The reservoir is a uniform sample, so it stands in for the full data as the drift reference
+    predictor.fit_drift_reference(X_sample)
+    del reservoir, X_sample, y_sample
+    predictor.save()
+    
+    report = {
+        "rows": rows,
+        "classes": classes.tolist(),
+        "epochs": epochs,
+        "rf_sample_rows": rf_rows,
+        "external_memory": external_memory,
+        "timings_s": timings,
+        "peak_rss_mb": peak_rss,
+    }
+    return predictor, report
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Train the symptom ensemble from data larger than memory")
+    source_group = parser.add_mutually_exclusive_group(required=True)
+    source_group.add_argument("--csv")
+    source_group.add_argument("--parquet")
+    source_group.add_argument("--query", help="SQL query against --database-url (default DATABASE_URL)")
+    parser.add_argument("--database-url")
+    parser.add_argument("--label-column", default="label")
+    parser.add_argument("--chunk-size", type=int, default=100_000)
+    parser.add_argument("--epochs", type=int, default=3)
+    parser.add_argument("--rf-sample-size", type=int, default=200_000)
+    parser.add_argument("--xgb-rounds", type=int, default=100)
+    parser.add_argument("--external-memory", action="store_true",
+                        help="page XGBoost's training matrix through an on-disk cache")
+    parser.add_argument("--model-path", default="models/")
+    args = parser.parse_args()
+    
+    kwargs = {"label_column": args.label_column}
+    if args.csv:
+        source = ChunkSource.from_csv(args.csv, args.chunk_size, **kwargs)
+    elif args.parquet:
+        source = ChunkSource.from_parquet(args.parquet, args.chunk_size, **kwargs)
+    else:
+        from config import settings
+        source = ChunkSource.from_query(args.database_url or settings.DATABASE_URL, args.query,
+                                        args.chunk_size, **kwargs)
+    
+    _, report = train_streaming(source, args.model_path, args.epochs, args.rf_sample_size,
+                                args.external_memory, args.xgb_rounds)
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
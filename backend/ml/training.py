@@ -1,12 +1,19 @@
+import argparse
+import json
+import time
 import numpy as np
 import pandas as pd
-from models import SymptomDiseasePredictor
+from config import settings
+from ml.cascade import tune_cascade_threshold
+from ml.models import SymptomDiseasePredictor
+from ml.orchestrator import TrainingOrchestrator
 from sklearn.model_selection import train_test_split
 from sklearn.metrics import accuracy_score, precision_score, recall_score, f1_score
+from typing import Dict
 
-def generate_synthetic_training_data(n_samples: int = 10000):
+def generate_synthetic_training_data(n_samples: int = 10000, seed: int = 42):
     """Generate synthetic training data for demo"""
-    np.random.seed(42)
+    np.random.seed(seed)
     
     # Features: age, temperature, cough_severity, fatigue, body_ache, aqi, humidity, temperature_env
     X = np.random.rand(n_samples, 8) * 100
@@ -14,42 +21,131 @@ def generate_synthetic_training_data(n_samples: int = 10000):
     X[:, 5] = np.random.rand(n_samples) * 200  # AQI
     
     # Generate labels with some correlation to features
-    y = np.zeros(n_samples, dtype=int)
-    for i in range(n_samples):
-        score = 0
-        if X[i, 1] > 38: score += 3
-        if X[i, 2] > 5: score += 2
-        if X[i, 5] > 150: score += 2
-        y[i] = min(score // 2, 7)  # Assign disease type 0-7
+    score = (
+        3 * (X[:, 1] > 38)
+        + 2 * (X[:, 2] > 5)
+        + 2 * (X[:, 5] > 150)
+    )
+    y = np.minimum(score // 2, 7)  # Assign disease type 0-7
     
     return X, y
 
-def train_models():
-    """Train and save ML models"""
+def classification_metrics(y_true: np.ndarray, y_pred: np.ndarray) -> Dict[str, float]:
+    """Accuracy plus macro-averaged precision/recall/F1"""
+    return {
+        "accuracy": float(accuracy_score(y_true, y_pred)),
+        "precision": float(precision_score(y_true, y_pred, average="macro", zero_division=0)),
+        "recall": float(recall_score(y_true, y_pred, average="macro", zero_division=0)),
+        "f1_score": float(f1_score(y_true, y_pred, average="macro", zero_division=0)),
+    }
+
+def evaluate(predictor: SymptomDiseasePredictor, X_test: np.ndarray, y_test: np.ndarray) -> Dict[str, Dict[str, float]]:
+    """Score every member and the ensemble with one batched probability pass"""
+    member_proba = predictor.predict_member_proba(X_test)
+    # Probability columns follow the label values seen in training
+    classes = predictor.classes
+    
+    report = {
+        name: classification_metrics(y_test, classes[proba.argmax(axis=1)])
+        for name, proba in member_proba.items()
+    }
+    ensemble_proba = sum(member_proba.values()) / len(member_proba)
+    report["ensemble"] = classification_metrics(y_test, classes[ensemble_proba.argmax(axis=1)])
+    return report
+
+def train_models(n_samples: int = 10000, model_path: str = "models/", search: bool = False,
+                 cores: int = None, candidates: int = None, cascade_max_loss: float = None) -> Dict:
+    """Train and save ML models; with `search`, tune members in parallel first
+    
+    With `cascade_max_loss`, also tune the early-exit threshold on fresh
+    validation rows and save it alongside the models.
+    """
+    timings = {}
+    
     print("Generating training data...")
-    X, y = generate_synthetic_training_data(10000)
+    start = time.perf_counter()
+    X, y = generate_synthetic_training_data(n_samples)
+    timings["generate"] = time.perf_counter() - start
     
+    start = time.perf_counter()
     X_train, X_test, y_train, y_test = train_test_split(
         X, y, test_size=0.2, random_state=42
     )
+    timings["split"] = time.perf_counter() - start
     
-    print("Training models...")
-    predictor = SymptomDiseasePredictor()
-    predictor.train(X_train, y_train)
+    start = time.perf_counter()
+    if search:
+        orchestrator = TrainingOrchestrator(
+            core_budget=cores or settings.TRAINING_CORES,
+            n_candidates=candidates or settings.SEARCH_CANDIDATES,
+            cv_folds=settings.SEARCH_CV_FOLDS,
+        )
+        print(f"Searching hyperparameters on {orchestrator.core_budget} cores...")
+        predictor, search_report = orchestrator.train(X_train, y_train, model_path=model_path)
+        timings["train_breakdown"] = {
+            name: member["search_seconds"] + member["refit_seconds"]
+            for name, member in search_report["members"].items()
+        }
+    else:
+        print("Training models...")
+        predictor = SymptomDiseasePredictor(model_path=model_path)
+        predictor.train(X_train, y_train)
+        timings["train_breakdown"] = predictor.fit_seconds
+        search_report = None
+    timings["train"] = time.perf_counter() - start
     
     # Evaluate
-    predictions = []
-    for sample in X_test:
-        result = predictor.predict(sample.reshape(1, -1))
-        top_prediction = result["predictions"][0]["disease"]
-        disease_index = predictor.diseases.index(top_prediction)
-        predictions.append(disease_index)
+    start = time.perf_counter()
+    metrics = evaluate(predictor, X_test, y_test)
+    timings["evaluate"] = time.perf_counter() - start
     
-    predictions = np.array(predictions)
-    accuracy = accuracy_score(y_test, predictions)
+    if cascade_max_loss is not None:
+        start = time.perf_counter()
+        X_val, y_val = generate_synthetic_training_data(max(len(y_test), 1000), seed=7)
+        cascade = tune_cascade_threshold(predictor, X_val, y_val, cascade_max_loss)
+        predictor.cascade_threshold = cascade["threshold"]
+        predictor.save()
+        metrics["cascade"] = cascade
+        timings["cascade_tuning"] = time.perf_counter() - start
+        print(f"Cascade threshold {cascade['threshold']}: "
+              f"{cascade['early_exit_fraction']:.1%} early exits, accuracy {cascade['accuracy_cascade']:.4f}")
     
-    print(f"Model Accuracy: {accuracy:.4f}")
+    print(pd.DataFrame({k: v for k, v in metrics.items() if k != "cascade"}).T.to_string(float_format="{:.4f}".format))
+    print(f"Model Accuracy: {metrics['ensemble']['accuracy']:.4f}")
+    print("Stage timings (s): " + ", ".join(
+        f"{stage}={seconds:.2f}" for stage, seconds in timings.items() if not isinstance(seconds, dict)))
     print("Models saved successfully!")
+    
+    return {"n_samples": n_samples, "metrics": metrics, "timings": timings, "search": search_report,
+            "predictor": predictor}
 
 if __name__ == "__main__":
-    train_models()
+    parser = argparse.ArgumentParser(description="Train the symptom disease ensemble on synthetic data")
+    parser.add_argument("--samples", type=int, default=10000)
+    parser.add_argument("--model-path", default="models/")
+    parser.add_argument("--report", help="write metrics and timings as JSON to this file")
+    parser.add_argument("--search", action="store_true",
+                        help="fit members concurrently with a successive-halving hyperparameter search")
+    parser.add_argument("--cores", type=int, help="core budget for --search (default TRAINING_CORES)")
+    parser.add_argument("--candidates", type=int, help="candidates per member for --search")
+    parser.add_argument("--cascade-max-loss", type=float,
+                        help="tune the early-exit cascade to lose at most this much accuracy")
+    parser.add_argument("--publish", action="store_true",
+                        help="also publish the models as a new version in MODEL_REGISTRY_DIR")
+    parser.add_argument("--promote", action="store_true", help="promote the published version (implies --publish)")
+    args = parser.parse_args()
+    
+    result = train_models(args.samples, args.model_path, args.search, args.cores, args.candidates,
+                          args.cascade_max_loss)
+    if args.publish or args.promote:
+        from ml.registry import registry
+        version = registry.publish(result.pop("predictor"), metrics=result["metrics"],
+                                   notes=f"ml.training --samples {args.samples}" + (" --search" if args.search else ""))
+        if args.promote:
+            registry.promote(version)
+        print(f"Published model version {version}" + (" (promoted)" if args.promote else ""))
+        result["version"] = version
+    result.pop("predictor", None)
+    if args.report:
+        with open(args.report, "w") as f:
+            json.dump(result, f, indent=2, default=str)
@@ -0,0 +1,214 @@
+import math
+import time
+from collections import OrderedDict
+from typing import Callable, Dict, List, Optional
+
+import numpy as np
+
+from config import settings
+from ml.rules import Rule, RuleSet
+from monitoring.metrics import REGISTRY
+
+# Device readings, named as the health_metrics columns they end up in
+VITALS = ["heart_rate", "temperature_celsius", "blood_pressure_systolic", "blood_pressure_diastolic",
+          "oxygen_saturation"]
+# Movement of a smoothed vital since the last scoring that is worth a new score
+MATERIAL_DELTA = np.array([10.0, 0.3, 10.0, 8.0, 2.0])
+# Vitals the symptom model reads, by feature index (the rest only drive alerts)
+MODEL_FEATURES = {"temperature_celsius": 1}
+CONTEXT_FEATURES = 8
+
+VITAL_ALERTS = RuleSet([
+    Rule("heart_rate", ">", 100, "Elevated heart rate ({value:.0f} bpm)"),
+    Rule("heart_rate", "<", 50, "Low heart rate ({value:.0f} bpm)"),
+    Rule("temperature_celsius", ">", 38, "Fever ({value:.1f}°C)"),
+    Rule("blood_pressure_systolic", ">=", 140, "High systolic blood pressure ({value:.0f} mmHg)"),
+    Rule("blood_pressure_diastolic", ">=", 90, "High diastolic blood pressure ({value:.0f} mmHg)"),
+    Rule("oxygen_saturation", "<", 94, "Low oxygen saturation ({value:.0f}%)"),
+], VITALS)
+
+_ACTIVE = REGISTRY.gauge("vitals_active_streams", "Open vitals streams on this worker")
+_PATIENTS = REGISTRY.gauge("vitals_tracked_patients", "Patients with vitals state held on this worker")
+
+
+class StreamLimitError(Exception):
+    pass
+
+
+class VitalsTracker:
+    """Exponentially weighted per-patient vital statistics in preallocated arrays
+    
+    Each patient owns one row: smoothed mean and variance per vital, the
+    values they had when last scored, the time of the last reading and the
+    model features (age, symptoms, weather). Every stream for the patient
+    (a reconnecting device, a second device) shares the row, which is
+    reference-counted and kept for `idle_ttl` seconds after the last
+    stream closes, so a reconnect resumes the smoothed state instead of
+    re-scoring from scratch. Rows are recycled through a free list, so
+    thousands of patients cost a few hundred bytes each. The smoothing
+    weight follows the actual gap between readings: a reading `half_life`
+    seconds after the previous one counts half.
+    
+    Event-loop only, like AdmissionController: no locking.
+    """
+    
+    # Per-stream arrays: name -> (columns, or None for one value per stream; value of a fresh row)
+    FIELDS = {
+        "mean": (len(VITALS), np.nan),
+        "var": (len(VITALS), 0.0),
+        "scored": (len(VITALS), np.nan),
+        "context": (CONTEXT_FEATURES, np.nan),
+        "updated": (None, np.nan),
+        "readings": (None, 0),
+    }
+    
+    def __init__(self, half_life: float, max_streams: int, idle_ttl: float, initial_capacity: int = 256,
+                 clock: Callable[[], float] = time.monotonic):
+        self.half_life = half_life
+        self.max_streams = max_streams
+        self.idle_ttl = idle_ttl
+        self.clock = clock
+        self._decay = math.log(2) / half_life
+        self._free: List[int] = []
+        self._used = 0
+        self._slots: Dict[str, int] = {}
+        self._patients: Dict[int, str] = {}
+        self._refs: Dict[int, int] = {}
+        # Slots no stream holds, oldest release first: slot -> release time
+        self._idle: "OrderedDict[int, float]" = OrderedDict()
+        self.results: List[Optional[Dict]] = []  # last model result per slot
+        self._allocate(min(initial_capacity, max_streams))
+    
+    def _allocate(self, capacity: int):
+        for name, (columns, fill) in self.FIELDS.items():
+            grown = np.full((capacity,) if columns is None else (capacity, columns), fill,
+                            dtype=np.int64 if name == "readings" else np.float64)
+            existing = getattr(self, name, None)
+            if existing is not None:
+                grown[:len(existing)] = existing
+            setattr(self, name, grown)
+        self.results.extend([None] * (capacity - len(self.results)))
+        self.capacity = capacity
+    
+    @property
+    def active(self) -> int:
+        """Open streams"""
+        return sum(self._refs.values())
+    
+    @property
+    def patients(self) -> int:
+        """Patients with state held, streaming or idle"""
+        return len(self._slots)
+    
+    def _release_slot(self, slot: int):
+        del self._slots[self._patients.pop(slot)]
+        del self._refs[slot]
+        self._idle.pop(slot, None)
+        self.results[slot] = None
+        self._free.append(slot)
+    
+    def _expire(self, now: float):
+        while self._idle:
+            slot, released = next(iter(self._idle.items()))
+            if now - released < self.idle_ttl:
+                break
+            self._release_slot(slot)
+    
+    def open(self, patient: str) -> int:
+        """The patient's slot, resuming held state; a fresh one if none is held"""
+        now = self.clock()
+        self._expire(now)
+        slot = self._slots.get(patient)
+        if slot is not None:
+            self._refs[slot] += 1
+            self._idle.pop(slot, None)
+            _ACTIVE.labels().set(self.active)
+            return slot
+        if self._free:
+            slot = self._free.pop()
+        elif self._used < self.max_streams:
+            if self._used == self.capacity:
+                self._allocate(min(2 * self.capacity, self.max_streams))
+            slot = self._used
+            self._used += 1
+        elif self._idle:
+            # Full: evict the patient idle the longest rather than refuse a live stream
+            self._release_slot(next(iter(self._idle)))
+            slot = self._free.pop()
+        else:
+            raise StreamLimitError(f"{self.max_streams} patients already streaming")
+        for name, (_, fill) in self.FIELDS.items():
+            getattr(self, name)[slot] = fill
+        self._slots[patient] = slot
+        self._patients[slot] = patient
+        self._refs[slot] = 1
+        _ACTIVE.labels().set(self.active)
+        _PATIENTS.labels().set(self.patients)
+        return slot
+    
+    def close(self, slot: int):
+        """One stream for the slot ended; the state outlives it by `idle_ttl`"""
+        self._refs[slot] -= 1
+        if not self._refs[slot]:
+            self._idle[slot] = self.clock()
+        self._expire(self.clock())
+        _ACTIVE.labels().set(self.active)
+        _PATIENTS.labels().set(self.patients)
+    
+    def has_context(self, slot: int) -> bool:
+        return not np.isnan(self.context[slot]).all()
+    
+    def set_context(self, slot: int, features: np.ndarray):
+        """The stream's full model feature row; vitals overwrite their columns once seen"""
+        self.context[slot] = features
+    
+    def update(self, slot: int, values: np.ndarray, timestamp: float) -> np.ndarray:
+        """Fold one reading (NaN for vitals not in it) in; returns which vitals moved materially"""
+        present = ~np.isnan(values)
+        mean, var = self.mean[slot], self.var[slot]
+        first = present & np.isnan(mean)
+        mean[first] = values[first]
+        # A reading no newer than the last one carries no weight
+        elapsed = max(timestamp - self.updated[slot], 0.0) if not np.isnan(self.updated[slot]) else 0.0
+        alpha = 1.0 - math.exp(-elapsed * self._decay)
+        blend = present & ~first
+        diff = values[blend] - mean[blend]
+        increment = alpha * diff
+        mean[blend] += increment
+        var[blend] = (1 - alpha) * (var[blend] + diff * increment)
+        self.updated[slot] = timestamp
+        self.readings[slot] += 1
+        # NaN scored (never scored) compares false, so count it as moved explicitly
+        scored = self.scored[slot]
+        return present & (np.isnan(scored) | (np.abs(mean - scored) >= MATERIAL_DELTA))
+    
+    def mark_scored(self, slot: int, values: np.ndarray, which: np.ndarray):
+        """Record the smoothed values (taken when scoring started) a score was based on"""
+        self.scored[slot, which] = values[which]
+    
+    def features(self, slot: int) -> np.ndarray:
+        """Model input: the context row with smoothed vitals in their feature columns"""
+        row = self.context[slot].copy()
+        for name, column in MODEL_FEATURES.items():
+            value = self.mean[slot, VITALS.index(name)]
+            if not np.isnan(value):
+                row[column] = value
+        return row[None, :]
+    
+    def alerts(self, slot: int) -> List[str]:
+        return VITAL_ALERTS.messages(self.mean[slot])
+    
+    def summary(self, slot: int) -> Dict[str, Dict[str, float]]:
+        return {
+            name: {"mean": float(self.mean[slot, i]), "std": float(math.sqrt(self.var[slot, i]))}
+            for i, name in enumerate(VITALS) if not np.isnan(self.mean[slot, i])
+        }
+    
+    def stats(self) -> Dict:
+        return {"active_streams": self.active, "patients": self.patients, "idle_patients": len(self._idle),
+                "capacity": self.capacity, "max_streams": self.max_streams,
+                "half_life_seconds": self.half_life, "idle_ttl_seconds": self.idle_ttl}
+
+
+vitals_tracker = VitalsTracker(settings.VITALS_HALF_LIFE_SECONDS, settings.VITALS_MAX_STREAMS,
+                               settings.VITALS_IDLE_SECONDS)
@@ -0,0 +1,230 @@
+import threading
+import time
+from bisect import bisect_left
+from typing import Callable, Dict, List, Sequence, Tuple
+
+# Request latency in seconds, roughly Prometheus' defaults with a finer low end
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+# Pipeline stages are often sub-millisecond
+STAGE_BUCKETS = (0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 1.0)
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(pairs: Sequence[Tuple[str, str]]) -> str:
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{k}="{_escape(str(v))}"' for k, v in pairs) + "}"
+
+
+def _format_value(value: float) -> str:
+    value = float(value)
+    if value == float("inf"):
+        return "+Inf"
+    return str(int(value)) if value.is_integer() else repr(value)
+
+
+class Histogram:
+    """Fixed-bucket histogram; buckets are allocated once and only incremented"""
+    
+    __slots__ = ("bounds", "counts", "sum", "count", "_lock")
+    
+    def __init__(self, bounds: Sequence[float]):
+        self.bounds = tuple(bounds)
+        self.counts = [0] * (len(self.bounds) + 1)  # last slot is +Inf
+        self.sum = 0.0
+        self.count = 0
+        self._lock = threading.Lock()
+    
+    def observe(self, value: float):
+        i = bisect_left(self.bounds, value)
+        with self._lock:
+            self.counts[i] += 1
+            self.sum += value
+            self.count += 1
+    
+    def snapshot(self) -> Tuple[List[int], float, int]:
+        with self._lock:
+            return list(self.counts), self.sum, self.count
+
+
+class Counter:
+    __slots__ = ("value", "_lock")
+    
+    def __init__(self):
+        self.value = 0.0
+        self._lock = threading.Lock()
+    
+    def inc(self, amount: float = 1.0):
+        with self._lock:
+            self.value += amount
+
+
+class Gauge:
+    __slots__ = ("value",)
+    
+    def __init__(self):
+        self.value = 0.0
+    
+    def set(self, value: float):
+        self.value = value
+
+
+class _Family:
+    """A named metric with one child per distinct label-value tuple"""
+    
+    kind = ""
+    
+    def __init__(self, name: str, documentation: str, label_names: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.label_names = tuple(label_names)
+        self._children: Dict[Tuple[str, ...], object] = {}
+        self._lock = threading.Lock()
+    
+    def _new_child(self):
+        raise NotImplementedError
+    
+    def labels(self, *values: str):
+        """Child for these label values; create it once and keep the reference on hot paths"""
+        child = self._children.get(values)
+        if child is None:
+            if len(values) != len(self.label_names):
+                raise ValueError(f"{self.name} expects labels {self.label_names}")
+            with self._lock:
+                child = self._children.setdefault(values, self._new_child())
+        return child
+    
+    def _header(self) -> List[str]:
+        return [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+    
+    def render(self) -> List[str]:
+        raise NotImplementedError
+
+
+class HistogramFamily(_Family):
+    kind = "histogram"
+    
+    def __init__(self, name: str, documentation: str, label_names: Sequence[str] = (),
+                 buckets: Sequence[float] = LATENCY_BUCKETS):
+        super().__init__(name, documentation, label_names)
+        self.buckets = tuple(buckets)
+    
+    def _new_child(self) -> Histogram:
+        return Histogram(self.buckets)
+    
+    def render(self) -> List[str]:
+        lines = self._header()
+        for values, child in list(self._children.items()):
+            labels = list(zip(self.label_names, values))
+            counts, total, count = child.snapshot()
+            cumulative = 0
+            for bound, n in zip(self.buckets + (float("inf"),), counts):
+                cumulative += n
+                lines.append(f"{self.name}_bucket{_format_labels(labels + [('le', _format_value(bound))])} {cumulative}")
+            lines.append(f"{self.name}_sum{_format_labels(labels)} {_format_value(total)}")
+            lines.append(f"{self.name}_count{_format_labels(labels)} {count}")
+        return lines
+
+
+class CounterFamily(_Family):
+    kind = "counter"
+    
+    def _new_child(self) -> Counter:
+        return Counter()
+    
+    def render(self) -> List[str]:
+        lines = self._header()
+        for values, child in list(self._children.items()):
+            lines.append(f"{self.name}{_format_labels(list(zip(self.label_names, values)))} {_format_value(child.value)}")
+        return lines
+
+
+class GaugeFamily(_Family):
+    kind = "gauge"
+    
+    def _new_child(self) -> Gauge:
+        return Gauge()
+    
+    def render(self) -> List[str]:
+        lines = self._header()
+        for values, child in list(self._children.items()):
+            lines.append(f"{self.name}{_format_labels(list(zip(self.label_names, values)))} {_format_value(child.value)}")
+        return lines
+
+
+class MetricsRegistry:
+    """Collects metric families and renders them in Prometheus text format"""
+    
+    def __init__(self):
+        self._families: Dict[str, _Family] = {}
+        self._collectors: List[Callable[[], None]] = []
+    
+    def _register(self, family: _Family) -> _Family:
+        existing = self._families.get(family.name)
+        if existing is not None:
+            return existing
+        self._families[family.name] = family
+        return family
+    
+    def histogram(self, name: str, documentation: str, label_names: Sequence[str] = (),
+                  buckets: Sequence[float] = LATENCY_BUCKETS) -> HistogramFamily:
+        return self._register(HistogramFamily(name, documentation, label_names, buckets))
+    
+    def counter(self, name: str, documentation: str, label_names: Sequence[str] = ()) -> CounterFamily:
+        return self._register(CounterFamily(name, documentation, label_names))
+    
+    def gauge(self, name: str, documentation: str, label_names: Sequence[str] = ()) -> GaugeFamily:
+        return self._register(GaugeFamily(name, documentation, label_names))
+    
+    def add_collector(self, collect: Callable[[], None]):
+        """Run `collect` before each scrape, e.g. to refresh gauges derived from other state"""
+        self._collectors.append(collect)
+    
+    def render(self) -> str:
+        for collect in self._collectors:
+            collect()
+        lines = []
+        for family in self._families.values():
+            lines.extend(family.render())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = MetricsRegistry()
+
+HTTP_REQUEST_DURATION = REGISTRY.histogram(
+    "http_request_duration_seconds", "HTTP request latency by route", ("method", "route"))
+HTTP_REQUESTS = REGISTRY.counter(
+    "http_requests_total", "HTTP requests by route and status code", ("method", "route", "status"))
+STAGE_DURATION = REGISTRY.histogram(
+    "pipeline_stage_duration_seconds", "Time spent in each stage of an inference pipeline",
+    ("pipeline", "stage"), buckets=STAGE_BUCKETS)
+
+
+def stage(pipeline: str, name: str) -> Histogram:
+    """Histogram for one pipeline stage; resolve at import time and reuse"""
+    return STAGE_DURATION.labels(pipeline, name)
+
+
+class timed:
+    """Context manager observing elapsed seconds into a histogram
+        
+        FORWARD = stage("analyze_scan", "forward")
+        with timed(FORWARD):
+            ...
+    """
+    
+    __slots__ = ("histogram", "start")
+    
+    def __init__(self, histogram: Histogram):
+        self.histogram = histogram
+    
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+    
+    def __exit__(self, *exc):
+        self.histogram.observe(time.perf_counter() - self.start)
+        return False
@@ -0,0 +1,48 @@
+import time
+
+from monitoring.metrics import HTTP_REQUEST_DURATION, HTTP_REQUESTS
+
+
+def _route_label(scope) -> str:
+    # Label by route template, never the raw path, so ids in URLs can't blow up cardinality.
+    # Newer FastAPI releases resolve included routers lazily and keep the prefixed
+    # template on the effective route context rather than on the route itself.
+    context = (scope.get("fastapi") or {}).get("effective_route_context")
+    if context is not None and hasattr(context, "path_format"):
+        return context.path_format
+    route = scope.get("route")
+    if route is not None and hasattr(route, "path"):
+        return route.path
+    endpoint = scope.get("endpoint")
+    if endpoint is not None:
+        return getattr(endpoint, "__name__", "unknown")
+    return "unmatched"
+
+
+class LatencyMiddleware:
+    """Pure ASGI middleware recording per-route latency and status counts"""
+    
+    def __init__(self, app):
+        self.app = app
+    
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        
+        status_code = 500
+        
+        async def send_wrapper(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            await send(message)
+        
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            elapsed = time.perf_counter() - start
+            method, route = scope["method"], _route_label(scope)
+            HTTP_REQUEST_DURATION.labels(method, route).observe(elapsed)
+            HTTP_REQUESTS.labels(method, route, str(status_code)).inc()
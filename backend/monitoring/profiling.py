@@ -0,0 +1,228 @@
+import os
+import sys
+import threading
+import time
+import tracemalloc
+from collections import Counter
+from typing import Dict, List, Optional
+
+MAX_PROFILE_SECONDS = 300
+
+
+def _frame_label(frame) -> str:
+    code = frame.f_code
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+
+class SamplingProfiler:
+    """Wall-clock sampling profiler for the current worker process
+    
+    A daemon thread snapshots every thread's stack with `sys._current_frames()`
+    at a fixed interval and folds them into collapsed stacks (the input format
+    of flamegraph.pl and speedscope). Nothing runs until `start` is called, so
+    leaving it compiled in costs nothing while idle.
+    """
+    
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+        self._stacks: Counter = Counter()
+        self.samples = 0
+        self.started_at: Optional[float] = None
+        self.finished_at: Optional[float] = None
+        self.interval = 0.01
+    
+    @property
+    def running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+    
+    def start(self, seconds: float, interval: float = 0.01):
+        with self._lock:
+            if self.running:
+                raise RuntimeError("A profile is already running on this worker")
+            self._stacks = Counter()
+            self.samples = 0
+            self.interval = interval
+            self.started_at = time.time()
+            self.finished_at = None
+            self._stop.clear()
+            self._thread = threading.Thread(
+                target=self._run, args=(min(seconds, MAX_PROFILE_SECONDS),),
+                name="sampling-profiler", daemon=True,
+            )
+            self._thread.start()
+    
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+    
+    def _run(self, seconds: float):
+        own_id = threading.get_ident()
+        names = {}
+        deadline = time.monotonic() + seconds
+        while not self._stop.is_set() and time.monotonic() < deadline:
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == own_id:
+                    continue
+                stack = []
+                while frame is not None:
+                    stack.append(_frame_label(frame))
+                    frame = frame.f_back
+                if thread_id not in names:
+                    names = {t.ident: t.name for t in threading.enumerate()}
+                stack.append(names.get(thread_id, str(thread_id)))
+                self._stacks[";".join(reversed(stack))] += 1
+            self.samples += 1
+            self._stop.wait(self.interval)
+        self.finished_at = time.time()
+    
+    def status(self) -> Dict:
+        return {
+            "pid": os.getpid(),
+            "running": self.running,
+            "samples": self.samples,
+            "interval_s": self.interval,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+        }
+    
+    def collapsed(self) -> str:
+        """Collapsed stacks, one `frame;frame;frame count` line per distinct stack"""
+        return "".join(f"{stack} {count}\n" for stack, count in self._stacks.most_common())
+
+
+def start_tracemalloc(frames: int = 10):
+    if not tracemalloc.is_tracing():
+        tracemalloc.start(frames)
+
+
+def stop_tracemalloc():
+    tracemalloc.stop()
+
+
+def top_allocations(limit: int = 25, group_by: str = "lineno") -> Dict:
+    """Largest live allocations since tracemalloc was started"""
+    if not tracemalloc.is_tracing():
+        raise RuntimeError("tracemalloc is not running on this worker")
+    snapshot = tracemalloc.take_snapshot().filter_traces((
+        tracemalloc.Filter(False, tracemalloc.__file__),
+        tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+    ))
+    current, peak = tracemalloc.get_traced_memory()
+    stats = snapshot.statistics(group_by)[:limit]
+    return {
+        "pid": os.getpid(),
+        "traced_current_bytes": current,
+        "traced_peak_bytes": peak,
+        "top": [
+            {
+                "location": [f"{frame.filename}:{frame.lineno}" for frame in stat.traceback],
+                "size_bytes": stat.size,
+                "count": stat.count,
+            }
+            for stat in stats
+        ],
+    }
+
+
+def thread_pool_settings() -> Dict:
+    """Thread counts that torch, BLAS/OpenMP and the environment are using"""
+    info: Dict = {
+        "pid": os.getpid(),
+        "cpu_count": os.cpu_count(),
+        "affinity": len(os.sched_getaffinity(0)) if hasattr(os, "sched_getaffinity") else None,
+        "env": {
+            name: os.environ.get(name)
+            for name in ("OMP_NUM_THREADS", "MKL_NUM_THREADS", "OPENBLAS_NUM_THREADS",
+                         "NUMEXPR_NUM_THREADS", "VECLIB_MAXIMUM_THREADS")
+        },
+    }
+    try:
+        import torch
+        info["torch"] = {
+            "num_threads": torch.get_num_threads(),
+            "num_interop_threads": torch.get_num_interop_threads(),
+            "parallel_info": torch.__config__.parallel_info(),
+        }
+    except ImportError:
+        info["torch"] = None
+    try:
+        from threadpoolctl import threadpool_info
+        info["native_thread_pools"] = threadpool_info()
+    except ImportError:
+        info["native_thread_pools"] = None
+    return info
+
+
+# Set by server.py in the pre-fork master so any worker can report on its siblings
+MASTER_PID_ENV = "PREFORK_MASTER_PID"
+
+
+def process_memory(pid: int) -> Optional[Dict]:
+    """RSS, PSS and USS (private pages) of one process from /proc (Linux), in bytes
+    
+    RSS counts copy-on-write pages shared with the pre-fork master in every
+    worker; USS is what exiting the process would free, and PSS splits the
+    shared pages evenly, so summing PSS gives the real footprint.
+    """
+    fields = {}
+    try:
+        with open(f"/proc/{pid}/smaps_rollup") as f:
+            for line in f:
+                name, _, value = line.partition(":")
+                parts = value.split()
+                if len(parts) == 2 and parts[1] == "kB":
+                    fields[name] = int(parts[0]) * 1024
+    except (FileNotFoundError, ProcessLookupError, PermissionError):
+        return None
+    return {
+        "pid": pid,
+        "rss": fields.get("Rss", 0),
+        "pss": fields.get("Pss", 0),
+        "uss": fields.get("Private_Clean", 0) + fields.get("Private_Dirty", 0),
+        "shared": fields.get("Shared_Clean", 0) + fields.get("Shared_Dirty", 0),
+        "swap": fields.get("Swap", 0),
+    }
+
+
+def child_pids(pid: int) -> List[int]:
+    try:
+        with open(f"/proc/{pid}/task/{pid}/children") as f:
+            return [int(child) for child in f.read().split()]
+    except FileNotFoundError:
+        pass
+    children = []
+    for entry in os.scandir("/proc"):
+        if not entry.name.isdigit():
+            continue
+        try:
+            with open(f"/proc/{entry.name}/stat") as f:
+                # Field 4 is the parent pid; the command name before it may contain spaces
+                if int(f.read().rsplit(")", 1)[1].split()[1]) == pid:
+                    children.append(int(entry.name))
+        except (FileNotFoundError, ProcessLookupError, IndexError, ValueError):
+            continue
+    return children
+
+
+def server_memory() -> Dict:
+    """Memory of the pre-fork master and all its workers, or just this process when run alone"""
+    master = int(os.environ.get(MASTER_PID_ENV, 0))
+    if master and master == os.getppid():
+        pids = {"master": [master], "workers": sorted(child_pids(master))}
+    else:
+        pids = {"master": [], "workers": [os.getpid()]}
+    processes = {role: [m for m in map(process_memory, group) if m] for role, group in pids.items()}
+    everything = processes["master"] + processes["workers"]
+    total = {kind: sum(m[kind] for m in everything) for kind in ("rss", "pss", "uss")}
+    return {
+        **processes,
+        "total": total,
+        # What the RSS column suggests minus what is really resident: pages shared copy-on-write
+        "shared_savings": total["rss"] - total["pss"],
+    }
+
+
+profiler = SamplingProfiler()
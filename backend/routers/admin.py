@@ -1,4 +1,20 @@
-from fastapi import APIRouter
+from fastapi import APIRouter, Depends, HTTPException, Query, status
+from fastapi.responses import PlainTextResponse
+from starlette.concurrency import run_in_threadpool
+import os
+from auth.admission import admission
+from auth.models import UserRole
+from auth.rbac import require_role
+from ml.drift import drift_monitor
+from ml.environment import environment_context
+from ml.inference_server import remote_inference
+from ml.registry import RegistryError, live_model, registry
+from ml.shadow import shadow_scorer
+from ml.vitals import vitals_tracker
+from monitoring.profiling import (
+    MAX_PROFILE_SECONDS, profiler, server_memory, start_tracemalloc, stop_tracemalloc,
+    thread_pool_settings, top_allocations,
+)
 
 router = APIRouter()
 
@@ -25,3 +41,167 @@ async def get_model_performance():
         "neural_network": {"accuracy": 0.85, "f1_score": 0.83},
         "ensemble": {"accuracy": 0.91, "f1_score": 0.89}
     }
+
+# Profiling: per-worker, so repeat against each worker you want to inspect
+admin_only = [Depends(require_role(UserRole.ADMIN))]
+
+@router.post("/profiling/cpu/start", dependencies=admin_only)
+async def start_cpu_profile(
+    seconds: float = Query(30, gt=0, le=MAX_PROFILE_SECONDS),
+    interval_ms: float = Query(10, ge=1, le=1000),
+):
+    """Start sampling this worker's stacks for `seconds`"""
+    try:
+        profiler.start(seconds, interval_ms / 1000)
+    except RuntimeError as e:
+        raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail=str(e))
+    return profiler.status()
+
+@router.post("/profiling/cpu/stop", dependencies=admin_only)
+async def stop_cpu_profile():
+    """Stop the running profile early"""
+    await run_in_threadpool(profiler.stop)
+    return profiler.status()
+
+@router.get("/profiling/cpu", dependencies=admin_only)
+async def get_cpu_profile():
+    """Download the last profile as collapsed stacks (flamegraph.pl / speedscope input)"""
+    if profiler.running:
+        raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail="Profile still running")
+    if profiler.started_at is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="No profile recorded on this worker")
+    filename = f"profile_{os.getpid()}_{int(profiler.started_at)}.collapsed"
+    return PlainTextResponse(
+        profiler.collapsed(),
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'},
+    )
+
+@router.post("/profiling/memory/start", dependencies=admin_only)
+async def start_memory_profile(frames: int = Query(10, ge=1, le=100)):
+    """Start tracing allocations with tracemalloc"""
+    start_tracemalloc(frames)
+    return {"pid": os.getpid(), "tracing": True}
+
+@router.get("/profiling/memory/top", dependencies=admin_only)
+async def get_top_allocations(
+    limit: int = Query(25, ge=1, le=500),
+    group_by: str = Query("lineno", pattern="^(lineno|filename|traceback)$"),
+):
+    """Largest live allocations since tracing started"""
+    try:
+        return await run_in_threadpool(top_allocations, limit, group_by)
+    except RuntimeError as e:
+        raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail=str(e))
+
+@router.post("/profiling/memory/stop", dependencies=admin_only)
+async def stop_memory_profile():
+    """Stop tracing allocations and free tracemalloc's bookkeeping"""
+    stop_tracemalloc()
+    return {"pid": os.getpid(), "tracing": False}
+
+@router.get("/profiling/threads", dependencies=admin_only)
+async def get_thread_settings():
+    """Torch, BLAS/OpenMP and environment thread-pool settings for this worker"""
+    return thread_pool_settings()
+
+@router.get("/profiling/memory/processes", dependencies=admin_only)
+async def get_process_memory():
+    """RSS/PSS/USS of the pre-fork master and every worker (Linux /proc)"""
+    return await run_in_threadpool(server_memory)
+
+@router.get("/admission", dependencies=admin_only)
+async def get_admission_state():
+    """Inference slots in use and queue depth per priority class on this worker"""
+    return {**admission.stats(), "pid": os.getpid()}
+
+@router.get("/inference", dependencies=admin_only)
+async def get_inference_replicas():
+    """Ping each out-of-process inference replica (INFERENCE_SOCKETS)"""
+    if remote_inference is None:
+        return {"mode": "in-process", "replicas": []}
+    return {"mode": "replicas", "replicas": await run_in_threadpool(remote_inference.status)}
+
+@router.get("/vitals", dependencies=admin_only)
+async def get_vitals_streams():
+    """Open vitals WebSocket streams and tracker capacity on this worker"""
+    return {**vitals_tracker.stats(), "pid": os.getpid()}
+
+@router.get("/environment", dependencies=admin_only)
+async def get_environment_context():
+    """Locations with a cached environmental reading and when this worker last loaded them"""
+    return {**environment_context.stats(), "pid": os.getpid()}
+
+# Model registry
+@router.get("/models", dependencies=admin_only)
+async def list_model_versions():
+    """Published model versions and which one is promoted / served here (or by each replica)"""
+    return {
+        "versions": await run_in_threadpool(registry.list_versions),
+        "promoted": registry.current_version(),
+        **await _serving(),
+        "pid": os.getpid(),
+    }
+
+async def _serving() -> dict:
+    """The served version: this worker's, or each replica's when the models run out of process"""
+    if remote_inference is None:
+        return {"serving": live_model.version}
+    replicas = await run_in_threadpool(remote_inference.status)
+    return {"serving": {replica["path"]: replica.get("version") for replica in replicas}}
+
+@router.post("/models/{version}/promote", dependencies=admin_only)
+async def promote_model_version(version: str):
+    """Verify, warm up and hot-swap `version` here; other workers follow within MODEL_POLL_SECONDS"""
+    try:
+        registry.manifest(version)
+    except RegistryError as e:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=str(e))
+    if remote_inference is not None:
+        # The replicas own the models and follow CURRENT themselves; loading one here is what they avoid
+        try:
+            await run_in_threadpool(registry.verify, version)
+        except RegistryError as e:
+            raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail=str(e))
+        registry.promote(version)
+        return {"promoted": version, **await _serving(), "pid": os.getpid()}
+    try:
+        # Swap before flipping CURRENT so a bad version never becomes the promoted one
+        await run_in_threadpool(live_model.swap_to, version)
+    except RegistryError as e:
+        raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail=str(e))
+    registry.promote(version)
+    return {"promoted": version, "serving": live_model.version, "pid": os.getpid()}
+
+@router.get("/drift", dependencies=admin_only)
+async def get_drift_scores():
+    """PSI / KS of recent /diagnose inputs and predictions vs the training reference (this worker)"""
+    scores = drift_monitor.scores()
+    if scores is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND,
+                            detail="Served model has no drift reference or no traffic yet")
+    return scores
+
+# Shadow scoring: per-worker, like profiling
+@router.post("/shadow/{version}/start", dependencies=admin_only)
+async def start_shadow_scoring(version: str, sample_rate: float = Query(0.1, gt=0, le=1)):
+    """Score a sample of live /diagnose traffic with `version` in the background"""
+    if remote_inference is not None:
+        raise HTTPException(status_code=status.HTTP_409_CONFLICT,
+                            detail="Shadow scoring runs in-process; unavailable while INFERENCE_SOCKETS is set")
+    try:
+        candidate = await run_in_threadpool(registry.load, version)
+    except RegistryError as e:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=str(e))
+    await run_in_threadpool(shadow_scorer.start, candidate, version, sample_rate)
+    return shadow_scorer.stats()
+
+@router.post("/shadow/stop", dependencies=admin_only)
+async def stop_shadow_scoring():
+    """Stop sampling; statistics are kept until the next start"""
+    await run_in_threadpool(shadow_scorer.stop)
+    return shadow_scorer.stats()
+
+@router.get("/shadow", dependencies=admin_only)
+async def get_shadow_stats(top: int = Query(10, ge=1, le=100)):
+    """Agreement and top-1 divergence between production and the shadow candidate"""
+    return shadow_scorer.stats(top)
@@ -1,9 +1,9 @@
-from fastapi import APIRouter, HTTPException, status
+from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi.security import HTTPAuthorizationCredentials, HTTPBearer
 from pydantic import BaseModel, EmailStr
-from datetime import datetime, timedelta
-import jwt
-from config import settings
-import hashlib
+from typing import Optional
+from auth.passwords import hash_password, hash_password_sync, verify_password
+from auth.tokens import TokenError, token_service
 
 router = APIRouter()
 
@@ -15,56 +15,60 @@ class LoginResponse(BaseModel):
     access_token: str
     token_type: str
     user: dict
+    refresh_token: Optional[str] = None
+
+class RefreshRequest(BaseModel):
+    refresh_token: str
+
+class LogoutRequest(BaseModel):
+    refresh_token: Optional[str] = None
+
+class TokenPair(BaseModel):
+    access_token: str
+    refresh_token: str
+    token_type: str = "bearer"
+
+optional_bearer = HTTPBearer(auto_error=False)
 
 # Mock database
 USERS_DB = {
     "aditya161499@gmail.com": {
         "id": "admin-001",
         "email": "aditya161499@gmail.com",
-        "password_hash": hashlib.sha256("password".encode()).hexdigest(),
+        "password_hash": hash_password_sync("password"),
         "role": "admin",
     }
 }
 
-def create_access_token(user_id: str, email: str, role: str, expires_delta: timedelta = None):
-    """Create JWT token"""
-    if expires_delta is None:
-        expires_delta = timedelta(minutes=settings.ACCESS_TOKEN_EXPIRE_MINUTES)
-    
-    expire = datetime.utcnow() + expires_delta
-    to_encode = {
-        "user_id": user_id,
-        "email": email,
-        "role": role,
-        "exp": expire
-    }
-    
-    encoded_jwt = jwt.encode(to_encode, settings.SECRET_KEY, algorithm=settings.ALGORITHM)
-    return encoded_jwt
-
 @router.post("/login", response_model=LoginResponse)
 async def login(request: LoginRequest):
     """User login endpoint"""
     user = USERS_DB.get(request.email)
+    newly_registered = False
     
     if not user:
-        # Auto-register as patient
-        user_id = f"patient-{len(USERS_DB)}"
-        USERS_DB[request.email] = {
-            "id": user_id,
+        # Auto-register as patient; setdefault because another login may have
+        # registered the same email while this one was hashing
+        password_hash = await hash_password(request.password)
+        user = USERS_DB.setdefault(request.email, {
+            "id": f"patient-{len(USERS_DB)}",
             "email": request.email,
-            "password_hash": hashlib.sha256(request.password.encode()).hexdigest(),
+            "password_hash": password_hash,
             "role": "patient",
-        }
-        user = USERS_DB[request.email]
+        })
+        newly_registered = user["password_hash"] is password_hash
     
-    # Verify password
-    password_hash = hashlib.sha256(request.password.encode()).hexdigest()
-    if user["password_hash"] != password_hash:
+    # Verify password (a password hashed just above trivially matches)
+    if not newly_registered and not await verify_password(request.password, user["password_hash"]):
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid credentials")
     
-    # Create token
-    access_token = create_access_token(
+    # Create tokens
+    access_token = token_service.create_access_token(
+        user_id=user["id"],
+        email=user["email"],
+        role=user["role"]
+    )
+    refresh_token = token_service.create_refresh_token(
         user_id=user["id"],
         email=user["email"],
         role=user["role"]
@@ -72,6 +76,7 @@ async def login(request: LoginRequest):
     
     return LoginResponse(
         access_token=access_token,
+        refresh_token=refresh_token,
         token_type="bearer",
         user={
             "id": user["id"],
@@ -80,7 +85,23 @@ async def login(request: LoginRequest):
         }
     )
 
+@router.post("/refresh", response_model=TokenPair)
+async def refresh(request: RefreshRequest):
+    """Exchange a refresh token for a new token pair"""
+    try:
+        access_token, refresh_token = token_service.refresh(request.refresh_token)
+    except TokenError as e:
+        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail=str(e))
+    return TokenPair(access_token=access_token, refresh_token=refresh_token)
+
 @router.post("/logout")
-async def logout():
-    """User logout endpoint"""
+async def logout(
+    request: Optional[LogoutRequest] = None,
+    credentials: Optional[HTTPAuthorizationCredentials] = Depends(optional_bearer),
+):
+    """User logout endpoint; revokes the presented access and refresh tokens"""
+    if credentials:
+        token_service.revoke(credentials.credentials)
+    if request and request.refresh_token:
+        token_service.revoke(request.refresh_token)
     return {"message": "Logged out successfully"}
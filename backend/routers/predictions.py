@@ -1,8 +1,21 @@
-from fastapi import APIRouter, HTTPException, Depends
-from pydantic import BaseModel
-from typing import List
+from fastapi import APIRouter, HTTPException, Depends, Request
+from pydantic import BaseModel, Field, model_validator
+from starlette.concurrency import run_in_threadpool
+from typing import List, Optional
+import os
+import joblib
 import numpy as np
-from ml.models import SymptomDiseasePredictor
+from auth.admission import admission
+from auth.models import TokenData
+from auth.rbac import Permission, optional_token, require_permission
+from config import settings
+from ml.drift import drift_monitor
+from ml.environment import MODEL_INPUTS, LocationUnavailableError, environment_context
+from ml.inference_server import InferenceUnavailableError, remote_inference
+from ml.registry import SCALER_FILE, RegistryError, live_model, registry
+from ml.shadow import shadow_scorer
+from ml.similar_cases import similar_cases
+from monitoring.metrics import stage, timed
 
 router = APIRouter()
 
@@ -12,9 +25,17 @@ class PredictionRequest(BaseModel):
     cough_severity: float
     fatigue: float
     body_ache: float
-    aqi: float
-    humidity: float
-    temperature_env: float
+    aqi: Optional[float] = None
+    humidity: Optional[float] = None
+    temperature_env: Optional[float] = None
+    # Stands in for the environmental fields left out: the latest environmental_data reading there
+    location: Optional[str] = None
+    
+    @model_validator(mode="after")
+    def _environment_given(self):
+        if self.location is None and any(getattr(self, name) is None for name in MODEL_INPUTS):
+            raise ValueError("Give aqi, humidity and temperature_env, or a location")
+        return self
 
 class DiseaseInfo(BaseModel):
     disease: str
@@ -25,17 +46,56 @@ class PredictionResponse(BaseModel):
     predictions: List[DiseaseInfo]
     explanation: str
 
-# Initialize predictor
-predictor = SymptomDiseasePredictor()
-try:
-    predictor.load()
-except:
-    pass
+class SimilarCasesRequest(PredictionRequest):
+    k: int = Field(10, ge=1, le=100)
+    age_bands: Optional[List[int]] = Field(None, description="decades: 3 = ages 30-39, 9 = 90+")
+    diseases: Optional[List[str]] = None
+    # The stored prediction this presentation is, if any: left out of its own results
+    case_id: Optional[str] = None
 
-@router.post("/diagnose", response_model=PredictionResponse)
-async def diagnose(request: PredictionRequest):
-    """Get AI disease prediction"""
-    features = np.array([[
+class RecordedCase(PredictionRequest):
+    case_id: str = Field(..., description="id of the stored prediction record")
+    disease: str
+
+class SimilarCase(BaseModel):
+    case_id: str
+    distance: float
+    disease: str
+    age: float
+    age_band: int
+
+_FEATURE_BUILD = stage("diagnose", "feature_build")
+
+async def _with_environment(request: PredictionRequest) -> PredictionRequest:
+    """Fill environmental fields left out from the location's cached reading (no external call per request)"""
+    inputs = {name: getattr(request, name) for name in MODEL_INPUTS}
+    if all(value is not None for value in inputs.values()):
+        return request
+    try:
+        filled = await environment_context.complete(request.location, inputs)
+    except LocationUnavailableError as e:
+        raise HTTPException(status_code=422, detail=str(e))
+    return request.model_copy(update=filled)
+
+def _load_case_scaler():
+    """The serving model's scaler: the registry's promoted version, else MODEL_PATH's"""
+    version = registry.current_version()
+    if version:
+        return registry.load_scaler(version)
+    return joblib.load(os.path.join(settings.MODEL_PATH, SCALER_FILE))
+
+async def _require_similar_cases():
+    """503 until the index has a scaler; adopts the serving model's on first use (any inference mode)"""
+    if similar_cases.ready:
+        return
+    try:
+        scaler = await run_in_threadpool(_load_case_scaler)
+    except (OSError, RegistryError) as e:
+        raise HTTPException(status_code=503, detail=f"Similar-case index not built: {e}")
+    similar_cases.set_scaler(scaler.mean_, scaler.scale_)
+
+def _feature_row(request: PredictionRequest) -> np.ndarray:
+    return np.array([[
         request.age,
         request.temperature,
         request.cough_severity,
@@ -45,8 +105,41 @@ async def diagnose(request: PredictionRequest):
         request.humidity,
         request.temperature_env
     ]])
+
+# Initialize predictor (the promoted registry version, else MODEL_PATH)
+if remote_inference is None:
+    try:
+        live_model.load_initial()
+    except:
+        pass
+
+@router.post("/diagnose", response_model=PredictionResponse)
+async def diagnose(
+    request: PredictionRequest,
+    http_request: Request,
+    token: Optional[TokenData] = Depends(optional_token),
+):
+    """Get AI disease prediction (admitted by caller role; anonymous calls are the bulk tier)"""
+    if remote_inference is not None:
+        # Inference replicas own the model (and its hot swaps); this worker only forwards
+        predictor = remote_inference
+    else:
+        live_model.maybe_refresh()
+        # One read per request: a concurrent hot swap can't change the model mid-request
+        predictor = live_model.predictor
+        if predictor is None:
+            raise HTTPException(status_code=503, detail="No model loaded")
+    request = await _with_environment(request)
+    with timed(_FEATURE_BUILD):
+        features = _feature_row(request)
     
-    result = predictor.predict(features)
+    client = http_request.client.host if http_request.client else None
+    try:
+        result = await admission.run(token, client, predictor.predict, features)
+    except InferenceUnavailableError as e:
+        raise HTTPException(status_code=503, detail=str(e))
+    shadow_scorer.submit(features, result)
+    drift_monitor.observe(predictor.drift_reference, features[0], result["predictions"][0]["disease"])
     
     predictions = [
         DiseaseInfo(**pred) for pred in result["predictions"]
@@ -56,3 +149,26 @@ async def diagnose(request: PredictionRequest):
         predictions=predictions,
         explanation=result["explanation"]
     )
+
+@router.post("/similar", response_model=List[SimilarCase])
+async def similar_presentations(
+    request: SimilarCasesRequest,
+    token: TokenData = Depends(require_permission(Permission.VIEW_PREDICTIONS)),
+):
+    """Nearest recorded cases to this presentation, optionally by age band and outcome"""
+    await _require_similar_cases()
+    request = await _with_environment(request)
+    exclude = [request.case_id] if request.case_id is not None else []
+    return similar_cases.query(_feature_row(request)[0], request.k, request.age_bands, request.diseases, exclude)
+
+@router.post("/cases", status_code=201)
+async def record_case(
+    request: RecordedCase,
+    token: TokenData = Depends(require_permission(Permission.VIEW_PREDICTIONS)),
+):
+    """Make a stored prediction searchable by /similar on this worker, under its record id"""
+    await _require_similar_cases()
+    request = await _with_environment(request)
+    if not similar_cases.add(request.case_id, _feature_row(request)[0], request.disease):
+        raise HTTPException(status_code=409, detail=f"Case {request.case_id} already recorded")
+    return {"case_id": request.case_id, "cases": len(similar_cases)}
@@ -52,7 +52,7 @@ async def generate_pdf_report(request: ReportRequest):
         c.drawString(70, y_position, f"{i}. {rec}")
         y_position -= 20
     
-    c.setFont("Helvetica-Italic", 8)
+    c.setFont("Helvetica-Oblique", 8)
     c.drawString(50, 50, "This report is AI-generated for clinical assistant purposes only. Not for diagnosis.")
     
     c.save()
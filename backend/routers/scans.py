@@ -0,0 +1,171 @@
+from fastapi import APIRouter, Depends, HTTPException, Path, Query, Request, Response, status
+from starlette.concurrency import run_in_threadpool
+from PIL import Image, UnidentifiedImageError
+import threading
+from auth.admission import admission
+from auth.models import TokenData
+from auth.rbac import Permission, has_permission, require_permission, verify_token
+from config import settings
+from dl.image_preprocessing import MedicalImagePreprocessor
+from dl.scan_store import ScanNotFoundError, ScanTooLargeError, scan_store
+from dl.tensor_cache import tensor_cache
+from dl.tile_pyramid import TileNotFoundError, tile_pyramid
+from ml.inference_server import InferenceUnavailableError, remote_inference
+
+router = APIRouter()
+
+ACCEPTED_CONTENT_TYPES = ("image/", "application/octet-stream", "application/dicom")
+DIGEST = Path(pattern="^[0-9a-f]{64}$")
+# Tiles are derived from content-addressed scans, so they never change; overlays revalidate
+TILE_CACHE_CONTROL = "private, max-age=31536000, immutable"
+OVERLAY_CACHE_CONTROL = "private, no-cache"
+# Roles that see scans they didn't upload (patient assignment isn't modeled yet, so doctors see all)
+SCAN_VIEWER_PERMISSIONS = (Permission.VIEW_ALL_DATA, Permission.VIEW_ASSIGNED_PATIENTS)
+
+# The detector pulls in ResNet-50 weights, so build it on first analysis, not at import
+_detector = None
+_detector_lock = threading.Lock()
+
+def get_detector():
+    global _detector
+    with _detector_lock:
+        if _detector is None:
+            from dl.cnn_models import AbnormalityDetector
+            _detector = AbnormalityDetector(model_path=settings.SCAN_MODEL_PATH)
+        return _detector
+
+_preprocessor = MedicalImagePreprocessor(cache=tensor_cache)
+
+def _authorize(digest: str, token: TokenData):
+    """404, not 403, for scans the caller may not see: a digest alone shouldn't reveal that it exists"""
+    if any(has_permission(token.role, permission) for permission in SCAN_VIEWER_PERMISSIONS):
+        return
+    if not scan_store.is_owner(digest, token.user_id):
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Scan not found")
+
+class _UndecodableScan(Exception):
+    pass
+
+def _analyze_stored(digest: str) -> dict:
+    # The preprocessor decodes straight from the mapped file; no bytes copy of the scan
+    with scan_store.open_mmap(digest) as view:
+        try:
+            Image.open(view).verify()
+        except (UnidentifiedImageError, SyntaxError, OSError, ValueError) as e:
+            # PIL reports corrupt data as SyntaxError, truncated data as OSError, and a probe
+            # seeking past the end of a short mmap as ValueError
+            raise _UndecodableScan() from e
+        if remote_inference is not None:
+            # Preprocess (and hit the tensor cache) here; the tensor goes over shared memory
+            tensor = _preprocessor.preprocess_from_bytes(view, digest)
+            result = remote_inference.analyze_scan(tensor, return_heatmap=True)
+        else:
+            result = get_detector().analyze_bytes(view, digest, return_heatmap=True)
+    tile_pyramid.save_overlay(digest, result.pop("heatmap"), result["regions_of_interest"])
+    return result
+
+async def _analyze(digest: str, token: TokenData, request: Request) -> dict:
+    client = request.client.host if request.client else None
+    try:
+        return await admission.run(token, client, _analyze_stored, digest)
+    except ScanNotFoundError:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Scan not found")
+    except InferenceUnavailableError as e:
+        raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, detail=str(e))
+    except _UndecodableScan:
+        raise HTTPException(status_code=status.HTTP_422_UNPROCESSABLE_ENTITY, detail="Not a decodable image")
+
+@router.post("/upload", status_code=status.HTTP_201_CREATED)
+async def upload_scan(
+    request: Request,
+    analyze: bool = Query(True),
+    token: TokenData = Depends(require_permission(Permission.UPLOAD_SCANS)),
+):
+    """Upload a scan as the raw request body (not multipart), streamed to disk"""
+    content_type = request.headers.get("content-type", "")
+    if not content_type.startswith(ACCEPTED_CONTENT_TYPES):
+        raise HTTPException(status_code=status.HTTP_415_UNSUPPORTED_MEDIA_TYPE,
+                            detail="Send the scan as image/* or application/octet-stream")
+    declared = request.headers.get("content-length")
+    if declared is not None and declared.isdigit() and int(declared) > settings.MAX_FILE_SIZE:
+        raise HTTPException(status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+                            detail=f"Scan exceeds {settings.MAX_FILE_SIZE} bytes")
+    
+    try:
+        stored = await scan_store.save_stream(request.stream(), settings.MAX_FILE_SIZE, token.user_id)
+    except ScanTooLargeError as e:
+        raise HTTPException(status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE, detail=str(e))
+    except ValueError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+    
+    result = {"sha256": stored.digest, "size": stored.size, "deduplicated": stored.deduplicated}
+    if analyze:
+        result["analysis"] = await _analyze(stored.digest, token, request)
+    return result
+
+@router.post("/{digest}/analyze")
+async def analyze_scan(
+    request: Request,
+    digest: str = DIGEST,
+    token: TokenData = Depends(require_permission(Permission.UPLOAD_SCANS)),
+):
+    """Re-run analysis on a stored scan (e.g. after a model update)"""
+    _authorize(digest, token)
+    return {"sha256": digest, "analysis": await _analyze(digest, token, request)}
+
+def _image_response(request: Request, render, etag: str, cache_control: str, media_type: str) -> Response:
+    headers = {"ETag": etag, "Cache-Control": cache_control}
+    if request.headers.get("if-none-match") == etag:
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+    return Response(content=render(), media_type=media_type, headers=headers)
+
+@router.get("/{digest}/pyramid")
+async def scan_pyramid(digest: str = DIGEST, token: TokenData = Depends(verify_token)):
+    """Size, tile size and per-level grid of a scan's tile pyramid (DeepZoom layout)"""
+    _authorize(digest, token)
+    try:
+        return await run_in_threadpool(tile_pyramid.info, digest)
+    except ScanNotFoundError:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Scan not found")
+
+@router.get("/{digest}/tiles/{level}/{col}/{row}")
+async def scan_tile(
+    request: Request,
+    level: int,
+    col: int,
+    row: int,
+    digest: str = DIGEST,
+    token: TokenData = Depends(verify_token),
+):
+    """One tile of the scan; its pyramid level is built on first access"""
+    _authorize(digest, token)
+    etag = f'"{digest}-{level}-{col}-{row}"'
+    try:
+        return await run_in_threadpool(
+            _image_response, request, lambda: tile_pyramid.tile(digest, level, col, row),
+            etag, TILE_CACHE_CONTROL, tile_pyramid.media_type)
+    except ScanNotFoundError:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Scan not found")
+    except TileNotFoundError as e:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=str(e))
+
+@router.get("/{digest}/overlays/{level}/{col}/{row}")
+async def scan_overlay_tile(
+    request: Request,
+    level: int,
+    col: int,
+    row: int,
+    digest: str = DIGEST,
+    token: TokenData = Depends(verify_token),
+):
+    """Transparent PNG with the latest analysis' heatmap and ROI boxes for one tile"""
+    _authorize(digest, token)
+    try:
+        etag = f'"{digest}-{level}-{col}-{row}-{tile_pyramid.overlay_version(digest)}"'
+        return await run_in_threadpool(
+            _image_response, request, lambda: tile_pyramid.overlay_tile(digest, level, col, row),
+            etag, OVERLAY_CACHE_CONTROL, "image/png")
+    except ScanNotFoundError:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Scan not found")
+    except TileNotFoundError as e:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=str(e))
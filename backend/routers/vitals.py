@@ -0,0 +1,234 @@
+from fastapi import APIRouter, HTTPException, Query, WebSocket, WebSocketDisconnect, status
+from pydantic import BaseModel, model_validator
+from typing import Optional
+import asyncio
+import time
+import numpy as np
+from auth.admission import admission
+from auth.models import TokenData
+from auth.rbac import Permission, decode_token, has_permission
+from auth.tokens import token_service
+from config import settings
+from ml.environment import MODEL_INPUTS, environment_context
+from ml.inference_server import InferenceUnavailableError, remote_inference
+from ml.registry import live_model
+from ml.vitals import MODEL_FEATURES, VITALS, StreamLimitError, vitals_tracker
+from monitoring.metrics import REGISTRY
+
+router = APIRouter()
+
+# WebSocket close codes (RFC 6455)
+NORMAL_CLOSURE = 1000
+POLICY_VIOLATION = 1008
+TRY_AGAIN_LATER = 1013
+MODEL_VITALS = np.isin(VITALS, list(MODEL_FEATURES))
+
+_READINGS = REGISTRY.counter("vitals_readings_total", "Vitals readings received over WebSocket streams")
+_RESCORES = REGISTRY.counter(
+    "vitals_rescores_total", "Stream re-evaluations: model re-run, alerts only, or refused by admission", ("kind",))
+
+class VitalsContext(BaseModel):
+    """The non-vital model inputs for a stream; `temperature` until the device reports one"""
+    age: float
+    temperature: float = 37.0
+    cough_severity: float = 0
+    fatigue: float = 0
+    body_ache: float = 0
+    aqi: Optional[float] = None
+    humidity: Optional[float] = None
+    temperature_env: Optional[float] = None
+    location: Optional[str] = None
+    
+    @model_validator(mode="after")
+    def _environment_given(self):
+        if self.location is None and any(getattr(self, name) is None for name in MODEL_INPUTS):
+            raise ValueError("Give aqi, humidity and temperature_env, or a location")
+        return self
+
+class VitalsReading(BaseModel):
+    heart_rate: Optional[float] = None
+    temperature_celsius: Optional[float] = None
+    blood_pressure_systolic: Optional[float] = None
+    blood_pressure_diastolic: Optional[float] = None
+    oxygen_saturation: Optional[float] = None
+
+def _stream_token(websocket: WebSocket, token: Optional[str]) -> Optional[TokenData]:
+    """Browsers can't set headers on WebSockets, so accept ?token= as well as a bearer header"""
+    header = websocket.headers.get("authorization", "")
+    credentials = token or (header[7:] if header.lower().startswith("bearer ") else None)
+    if not credentials:
+        return None
+    try:
+        data = decode_token(credentials)
+    except HTTPException:
+        return None
+    allowed = (has_permission(data.role, Permission.VIEW_OWN_PREDICTIONS)
+               or has_permission(data.role, Permission.VIEW_PREDICTIONS))
+    return data if allowed else None
+
+def _stream_patient(token: TokenData, patient: Optional[str]) -> Optional[str]:
+    """Whose vitals the stream carries: the token's own user, or any patient for clinicians"""
+    if patient is None or patient == token.user_id:
+        return token.user_id
+    return patient if has_permission(token.role, Permission.VIEW_PREDICTIONS) else None
+
+def _token_live(token: TokenData) -> bool:
+    """Whether a stream's token still holds: not expired, nor revoked (e.g. /auth/logout) since connect"""
+    if time.time() >= token.exp:
+        return False
+    token_service.revoked.sync()
+    return not (token.jti and token.jti in token_service.revoked)
+
+class _TokenLapsed(Exception):
+    pass
+
+class _Stream:
+    """One connection's re-scoring: at most one evaluation in flight, later requests coalesced
+    
+    The smoothed vitals, context and last result live in the patient's
+    tracker slot, shared with any other stream for the same patient.
+    """
+    
+    def __init__(self, websocket: WebSocket, token: TokenData, slot: int):
+        self.websocket = websocket
+        self.token = token
+        self.client = websocket.client.host if websocket.client else None
+        self.slot = slot
+        self.model_due = False
+        self.due = False
+        self.task: Optional[asyncio.Task] = None
+    
+    async def handle(self, message: dict):
+        kind = message.get("type", "vitals")
+        if kind == "context":
+            context = VitalsContext.model_validate(message)
+            inputs = {name: getattr(context, name) for name in MODEL_INPUTS}
+            if any(value is None for value in inputs.values()):
+                # LocationUnavailableError is a ValueError: reported like a bad field
+                context = context.model_copy(update=await environment_context.complete(context.location, inputs))
+            vitals_tracker.set_context(self.slot, np.array([
+                context.age, context.temperature, context.cough_severity, context.fatigue,
+                context.body_ache, context.aqi, context.humidity, context.temperature_env,
+            ]))
+            self.request(model=True)
+        elif kind == "vitals":
+            reading = VitalsReading.model_validate(message)
+            values = np.array([np.nan if v is None else v for v in (getattr(reading, name) for name in VITALS)])
+            _READINGS.labels().inc()
+            moved = vitals_tracker.update(self.slot, values, time.monotonic())
+            if moved.any():
+                self.request(model=bool((moved & MODEL_VITALS).any()))
+        else:
+            await self.websocket.send_json({"type": "error", "detail": f"Unknown message type {kind!r}"})
+    
+    def request(self, model: bool):
+        self.due = True
+        self.model_due = self.model_due or model
+        if self.task is None or self.task.done():
+            self.task = asyncio.create_task(self._evaluate())
+    
+    async def _evaluate(self):
+        while self.due:
+            self.due = False
+            if not _token_live(self.token):
+                # No more scores; the receive loop closes the stream on its next turn
+                return
+            snapshot = vitals_tracker.mean[self.slot].copy()
+            message = {"type": "risk", "rescored": False}
+            if self.model_due and vitals_tracker.has_context(self.slot):
+                self.model_due = False
+                try:
+                    result = await self._predict(vitals_tracker.features(self.slot))
+                except HTTPException as e:
+                    # Shed or rate limited: the next material change tries again
+                    _RESCORES.labels("refused").inc()
+                    self.model_due = True
+                    await self.websocket.send_json({"type": "throttled", "detail": e.detail,
+                                                    "retry_after": (e.headers or {}).get("Retry-After")})
+                    continue
+                vitals_tracker.results[self.slot] = result
+                message["rescored"] = True
+                vitals_tracker.mark_scored(self.slot, snapshot, np.ones(len(VITALS), dtype=bool))
+                _RESCORES.labels("model").inc()
+            else:
+                # Only alert vitals moved (or no context yet): the last prediction still holds
+                vitals_tracker.mark_scored(self.slot, snapshot, ~MODEL_VITALS)
+                _RESCORES.labels("alerts").inc()
+            result = vitals_tracker.results[self.slot]
+            if result is not None:
+                message["predictions"] = result["predictions"]
+                message["explanation"] = result["explanation"]
+            message["alerts"] = vitals_tracker.alerts(self.slot)
+            message["vitals"] = vitals_tracker.summary(self.slot)
+            message["readings"] = int(vitals_tracker.readings[self.slot])
+            await self.websocket.send_json(message)
+    
+    async def _predict(self, features: np.ndarray) -> dict:
+        if remote_inference is not None:
+            predictor = remote_inference
+        else:
+            live_model.maybe_refresh()
+            predictor = live_model.predictor
+            if predictor is None:
+                raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, detail="No model loaded")
+        try:
+            return await admission.run(self.token, self.client, predictor.predict, features)
+        except InferenceUnavailableError as e:
+            raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, detail=str(e))
+    
+    def cancel(self):
+        if self.task is not None:
+            self.task.cancel()
+
+@router.websocket("/stream")
+async def stream_vitals(websocket: WebSocket, token: Optional[str] = Query(None),
+                        patient: Optional[str] = Query(None)):
+    """Live vitals in, risk updates out
+    
+    Send {"type": "context", age, aqi, humidity, temperature_env (or location), ...} once,
+    then {"type": "vitals", heart_rate, temperature_celsius, ...} per reading.
+    A "risk" message comes back whenever a smoothed vital moved materially;
+    the model only re-runs when a vital it reads (temperature) did.
+    
+    State is per patient (the token's user, or ?patient= for clinicians) and
+    outlives the connection by VITALS_IDLE_SECONDS: a reconnect gets the
+    held state at once and needn't resend its context.
+    """
+    token_data = _stream_token(websocket, token)
+    patient_id = _stream_patient(token_data, patient) if token_data is not None else None
+    if patient_id is None:
+        await websocket.close(code=POLICY_VIOLATION)
+        return
+    try:
+        slot = vitals_tracker.open(patient_id)
+    except StreamLimitError:
+        await websocket.close(code=TRY_AGAIN_LATER)
+        return
+    
+    stream = _Stream(websocket, token_data, slot)
+    try:
+        await websocket.accept()
+        if vitals_tracker.readings[slot] or vitals_tracker.results[slot] is not None:
+            stream.request(model=False)
+        while True:
+            # Wake at the token's expiry even if the client stays quiet
+            timeout = max(min(settings.VITALS_IDLE_SECONDS, token_data.exp - time.time()), 0)
+            try:
+                message = await asyncio.wait_for(websocket.receive_json(), timeout)
+                if not _token_live(token_data):
+                    raise _TokenLapsed()
+                if not isinstance(message, dict):
+                    raise ValueError("Expected a JSON object")
+                await stream.handle(message)
+            except ValueError as e:
+                # Bad JSON or fields (pydantic's ValidationError included) don't end the stream
+                await websocket.send_json({"type": "error", "detail": str(e)})
+    except asyncio.TimeoutError:
+        await websocket.close(code=POLICY_VIOLATION if time.time() >= token_data.exp else NORMAL_CLOSURE)
+    except _TokenLapsed:
+        await websocket.close(code=POLICY_VIOLATION)
+    except WebSocketDisconnect:
+        pass
+    finally:
+        stream.cancel()
+        vitals_tracker.close(slot)
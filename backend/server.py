@@ -0,0 +1,192 @@
+"""Pre-fork production server: load models once, then fork workers sharing them
+
+    python server.py --workers 4
+
+The master imports the app (which loads the symptom ensemble) and, unless
+disabled, the scan detector, then freezes the GC and forks. Workers share
+the model pages copy-on-write and serve from one listening socket. Compare
+`--no-preload` to see the per-worker cost without sharing.
+"""
+import argparse
+import gc
+import logging
+import os
+import signal
+import socket
+import time
+
+from config import settings
+from monitoring.profiling import MASTER_PID_ENV, process_memory
+
+logger = logging.getLogger("server")
+
+THREAD_ENV_VARS = ("OMP_NUM_THREADS", "MKL_NUM_THREADS", "OPENBLAS_NUM_THREADS",
+                   "NUMEXPR_NUM_THREADS", "VECLIB_MAXIMUM_THREADS")
+
+
+def _available_cpus() -> int:
+    if hasattr(os, "sched_getaffinity"):
+        return len(os.sched_getaffinity(0))
+    return os.cpu_count() or 1
+
+
+def _preload(preload_scan_model: bool):
+    # Intra-op thread pools must not exist at fork time (an OpenMP team in the
+    # parent can deadlock children), so the master warms up single-threaded
+    import torch
+    torch.set_num_threads(1)
+
+    import main  # noqa: F401  imports every router, loading the symptom ensemble
+    from ml.registry import live_model, warm_up
+    if live_model.predictor is not None:
+        warm_up(live_model.predictor)
+    else:
+        logger.warning("No symptom model loaded; /diagnose will return 503")
+    if preload_scan_model:
+        try:
+            from routers.scans import get_detector
+            get_detector()
+        except Exception:
+            logger.exception("Scan detector preload failed; workers will load it on first use")
+
+
+def _init_worker(threads: int):
+    """Runs in each child right after fork, before it serves anything"""
+    for sig in (signal.SIGTERM, signal.SIGINT, signal.SIGHUP):
+        signal.signal(sig, signal.SIG_DFL)
+    gc.enable()
+    import torch
+    torch.set_num_threads(threads)
+    try:
+        torch.set_num_interop_threads(1)
+    except RuntimeError:
+        # Already fixed once inter-op work ran in the master
+        pass
+    from threadpoolctl import threadpool_limits
+    threadpool_limits(limits=threads)
+
+
+def _serve(sock: socket.socket, threads: int):
+    _init_worker(threads)
+    import uvicorn
+    from main import app
+    config = uvicorn.Config(app, log_level="info", access_log=False)
+    uvicorn.Server(config).run(sockets=[sock])
+
+
+def _spawn(sock: socket.socket, threads: int) -> int:
+    pid = os.fork()
+    if pid == 0:
+        code = 0
+        try:
+            _serve(sock, threads)
+        except BaseException:
+            logger.exception("Worker %s crashed", os.getpid())
+            code = 1
+        finally:
+            # Skip the master's atexit handlers and buffered-IO flushes
+            os._exit(code)
+    return pid
+
+
+def _mb(value: int) -> str:
+    return f"{value / 2 ** 20:8.1f}"
+
+
+def report_memory(master: int, workers: list):
+    lines = [f"{'role':8} {'pid':>7} {'rss MB':>8} {'pss MB':>8} {'uss MB':>8}"]
+    totals = {"rss": 0, "pss": 0, "uss": 0}
+    for role, pid in [("master", master)] + [("worker", pid) for pid in workers]:
+        memory = process_memory(pid)
+        if memory is None:
+            continue
+        for kind in totals:
+            totals[kind] += memory[kind]
+        lines.append(f"{role:8} {pid:>7} {_mb(memory['rss'])} {_mb(memory['pss'])} {_mb(memory['uss'])}")
+    lines.append(f"{'total':8} {'':>7} {_mb(totals['rss'])} {_mb(totals['pss'])} {_mb(totals['uss'])}")
+    logger.info("Process memory (sum of PSS is the real footprint):\n%s", "\n".join(lines))
+
+
+def run(host: str, port: int, workers: int, threads: int, preload: bool = True,
+        preload_scan_model: bool = True, report_interval: float = 0):
+    # Native pools read these at library load; set before anything imports torch/numpy
+    for name in THREAD_ENV_VARS:
+        os.environ.setdefault(name, str(threads))
+    os.environ[MASTER_PID_ENV] = str(os.getpid())
+
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind((host, port))
+    sock.listen(2048)
+    sock.set_inheritable(True)
+
+    if preload:
+        started = time.perf_counter()
+        gc.disable()
+        _preload(preload_scan_model)
+        # Move everything loaded so far out of the collector's reach: collections in the
+        # workers would otherwise write GC headers and un-share the model pages
+        gc.collect()
+        gc.freeze()
+        logger.info("Preloaded models in %.1fs; %d objects frozen", time.perf_counter() - started,
+                    gc.get_freeze_count())
+
+    children = {_spawn(sock, threads) for _ in range(workers)}
+    logger.info("Serving on http://%s:%d with %d workers x %d threads", host, port, workers, threads)
+
+    stopping = False
+
+    def shutdown(signum, frame):
+        nonlocal stopping
+        stopping = True
+        for pid in children:
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+    signal.signal(signal.SIGTERM, shutdown)
+    signal.signal(signal.SIGINT, shutdown)
+
+    # Once workers have booted, then every `report_interval` seconds if set
+    next_report = time.monotonic() + 10
+    while children:
+        pid, status = os.waitpid(-1, os.WNOHANG)
+        if pid:
+            children.discard(pid)
+            if not stopping:
+                logger.warning("Worker %d exited with %d; restarting", pid, os.waitstatus_to_exitcode(status))
+                children.add(_spawn(sock, threads))
+            continue
+        if not stopping and time.monotonic() >= next_report:
+            report_memory(os.getpid(), sorted(children))
+            next_report = time.monotonic() + report_interval if report_interval else float("inf")
+        time.sleep(0.2)
+    sock.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Pre-fork server with models shared copy-on-write")
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--workers", type=int, default=settings.SERVER_WORKERS,
+                        help="worker processes (default: one per available core)")
+    parser.add_argument("--threads", type=int, default=settings.WORKER_THREADS,
+                        help="torch/BLAS threads per worker (default: cores / workers)")
+    parser.add_argument("--no-preload", action="store_true",
+                        help="load models in each worker instead (for comparison)")
+    parser.add_argument("--no-scan-model", action="store_true", help="don't preload the ResNet-50 detector")
+    parser.add_argument("--report-interval", type=float, default=0,
+                        help="log per-process RSS/PSS/USS every N seconds (default: once after startup)")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(process)d %(levelname)s %(message)s")
+    cpus = _available_cpus()
+    workers = args.workers or cpus
+    threads = args.threads or max(1, cpus // workers)
+    run(args.host, args.port, workers, threads, preload=not args.no_preload,
+        preload_scan_model=not args.no_scan_model, report_interval=args.report_interval)
+
+
+if __name__ == "__main__":
+    main()
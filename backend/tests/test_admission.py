@@ -0,0 +1,72 @@
+import asyncio
+
+import pytest
+
+from auth.admission import AdmissionController
+from auth.models import TokenData, UserRole
+
+
+def _token(user_id: str, role: UserRole = UserRole.DOCTOR) -> TokenData:
+    return TokenData(user_id=user_id, email=f"{user_id}@example.com", role=role, exp=2 ** 40)
+
+
+def test_cancelled_waiter_released_in_same_tick_does_not_leak_slot():
+    async def scenario():
+        admission = AdmissionController(concurrency=1, slo=1.0, max_queue=10)
+        await admission.acquire(_token("a"))
+        waiting = asyncio.create_task(admission.acquire(_token("b")))
+        await asyncio.sleep(0)
+        assert admission.stats()["queued"]["doctor"] == 1
+        
+        # The queued request is cancelled, and the holder releases before its handler runs
+        waiting.cancel()
+        admission.release()
+        with pytest.raises(asyncio.CancelledError):
+            await waiting
+        assert admission.active == 0
+        assert admission.stats()["queued"]["doctor"] == 0
+        
+        # The slot is free again: the next request is admitted without queueing
+        await asyncio.wait_for(admission.acquire(_token("c")), timeout=1)
+        assert admission.active == 1
+    
+    asyncio.run(scenario())
+
+
+def test_release_skips_cancelled_waiter_and_grants_the_next():
+    async def scenario():
+        admission = AdmissionController(concurrency=1, slo=1.0, max_queue=10)
+        await admission.acquire(_token("a"))
+        cancelled = asyncio.create_task(admission.acquire(_token("b")))
+        granted = asyncio.create_task(admission.acquire(_token("c")))
+        await asyncio.sleep(0)
+        
+        cancelled.cancel()
+        admission.release()
+        with pytest.raises(asyncio.CancelledError):
+            await cancelled
+        assert await asyncio.wait_for(granted, timeout=1) == "doctor"
+        assert admission.active == 1
+        admission.release()
+        assert admission.active == 0
+    
+    asyncio.run(scenario())
+
+
+def test_cancel_after_grant_passes_the_slot_on():
+    async def scenario():
+        admission = AdmissionController(concurrency=1, slo=1.0, max_queue=10)
+        await admission.acquire(_token("a"))
+        first = asyncio.create_task(admission.acquire(_token("b")))
+        second = asyncio.create_task(admission.acquire(_token("c")))
+        await asyncio.sleep(0)
+        
+        # Granted by release, then cancelled before it resumes
+        admission.release()
+        first.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await first
+        await asyncio.wait_for(second, timeout=1)
+        assert admission.active == 1
+    
+    asyncio.run(scenario())
@@ -0,0 +1,91 @@
+import threading
+
+import numpy as np
+
+from ml import models
+from ml.models import SymptomDiseasePredictor
+from ml.registry import LiveModel, warm_up
+
+
+class _Predictor:
+    feature_names = ["a", "b"]
+    
+    def __init__(self, version: str):
+        self.version = version
+    
+    def predict_member_proba(self, X):
+        return {"member": np.full((len(X), 2), 0.5)}
+    
+    def predict_proba(self, X):
+        return np.full((len(X), 2), 0.5)
+
+
+class _Registry:
+    """CURRENT names `version`; loading fails while `failures` remain"""
+    
+    def __init__(self, version: str, failures: int = 0):
+        self.version = version
+        self.mtime = 1.0
+        self.failures = failures
+    
+    def current_mtime(self):
+        return self.mtime
+    
+    def current_version(self):
+        return self.version
+    
+    def load(self, version: str):
+        if self.failures:
+            self.failures -= 1
+            raise OSError("artifact unreadable")
+        return _Predictor(version)
+
+
+def _wait_for_swaps():
+    for thread in threading.enumerate():
+        if thread.name == "model-swap":
+            thread.join(timeout=5)
+
+
+def _poll(model: LiveModel):
+    model._last_poll = 0.0
+    model.maybe_refresh()
+    _wait_for_swaps()
+
+
+def test_failed_swap_is_retried_at_next_poll():
+    registry = _Registry("v1")
+    model = LiveModel(registry, fallback_path="unused", poll_interval=0)
+    model.load_initial()
+    
+    registry.version, registry.mtime, registry.failures = "v2", 2.0, 1
+    _poll(model)
+    assert model.version == "v1"
+    
+    _poll(model)
+    assert model.version == "v2"
+
+
+def test_failed_initial_load_is_retried_at_next_poll():
+    registry = _Registry("v1", failures=1)
+    model = LiveModel(registry, fallback_path="unused", poll_interval=0)
+    try:
+        model.load_initial()
+    except OSError:
+        pass
+    assert model.predictor is None
+    
+    _poll(model)
+    assert model.version == "v1"
+
+
+def test_warm_up_does_not_count_as_diagnose_traffic(tmp_path):
+    predictor = SymptomDiseasePredictor(model_path=str(tmp_path))
+    rng = np.random.default_rng(0)
+    predictor.train(rng.random((200, len(predictor.feature_names))) * 100,
+                    rng.integers(0, len(predictor.diseases), 200))
+    recorded = lambda: (sum(count.value for count, _ in models._CASCADE.values()), models._SCALER.count)
+    before = recorded()
+    
+    warm_up(predictor)
+    assert recorded() == before
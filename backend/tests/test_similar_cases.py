@@ -0,0 +1,19 @@
+import numpy as np
+
+from ml.similar_cases import SimilarCaseIndex
+
+
+def _index() -> SimilarCaseIndex:
+    return SimilarCaseIndex(mean=np.zeros(8), scale=np.ones(8))
+
+
+def test_recorded_case_is_found_once_and_excluded_from_its_own_query():
+    index = _index()
+    features = np.array([40.0, 38.5, 5, 3, 2, 80, 50, 25])
+    assert index.add("rec-1", features, "Flu")
+    assert not index.add("rec-1", features, "Flu")
+    assert index.add("rec-2", features + 1, "Cold")
+    
+    assert [case["case_id"] for case in index.query(features, k=2)] == ["rec-1", "rec-2"]
+    assert [case["case_id"] for case in index.query(features, k=2, exclude=["rec-1"])] == ["rec-2"]
+    assert [case["case_id"] for case in index.query(features, k=1, diseases=["Flu"], exclude=["rec-1"])] == []
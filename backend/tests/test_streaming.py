@@ -0,0 +1,14 @@
+import numpy as np
+
+from ml.streaming import _Reservoir
+
+
+def test_reservoir_keeps_string_labels_whole():
+    reservoir = _Reservoir(capacity=4, n_features=1)
+    reservoir.add(np.zeros((2, 1)), np.array(["Flu", "Flu"]))
+    reservoir.add(np.ones((4, 1)), np.array(["Pneumonia"] * 4))
+    
+    _, y = reservoir.sample()
+    assert len(y) == 4
+    assert set(y) <= {"Flu", "Pneumonia"}
+    assert "Pneumonia" in set(y)
@@ -0,0 +1,53 @@
+import time
+
+import pytest
+
+from auth import tokens
+from auth.models import UserRole
+from auth.tokens import RevocationList, TokenRevokedError, TokenService
+
+
+def _worker(path) -> RevocationList:
+    return RevocationList(path=str(path), sync_interval=3600)
+
+
+def test_log_is_compacted_to_live_entries_and_other_workers_follow(tmp_path, monkeypatch):
+    monkeypatch.setattr(tokens, "COMPACT_MIN_LINES", 4)
+    path = tmp_path / "revoked"
+    a, b = _worker(path), _worker(path)
+    now = time.time()
+    for i in range(5):
+        a.revoke(f"{i:032x}", now - 1)
+    a.revoke("ff" * 16, now + 3600)
+    b.sync(force=True)
+    
+    a.sync(force=True)
+    assert path.read_text().splitlines() == [f"{'ff' * 16} {now + 3600:.0f}"]
+    
+    # b read the old file; it picks up appends to the new one, not stale offsets
+    a.revoke("ee" * 16, now + 3600)
+    b.sync(force=True)
+    assert "ee" * 16 in b and "ff" * 16 in b
+    assert "00" * 16 not in b
+    assert len(path.read_text().splitlines()) == 2
+
+
+def test_claim_succeeds_once_across_workers(tmp_path):
+    path = tmp_path / "revoked"
+    a, b = _worker(path), _worker(path)
+    exp = time.time() + 3600
+    assert a.claim("ab" * 16, exp)
+    # b hasn't synced, but the claim reads the shared log under its lock
+    assert not b.claim("ab" * 16, exp)
+    assert not a.claim("ab" * 16, exp)
+
+
+def test_refresh_token_rotates_once_across_workers(tmp_path):
+    path = tmp_path / "revoked"
+    a, b = (TokenService(secret_key="k" * 32, revocation_list=_worker(path)) for _ in range(2))
+    refresh_token = a.create_refresh_token("1", "p@example.com", UserRole.PATIENT)
+    b.verify(refresh_token, tokens.REFRESH)  # b's revocation list is now synced, then not again
+    
+    a.refresh(refresh_token)
+    with pytest.raises(TokenRevokedError):
+        b.refresh(refresh_token)
@@ -0,0 +1,72 @@
+import numpy as np
+import pytest
+
+from ml.vitals import VITALS, StreamLimitError, VitalsTracker
+
+
+class _Clock:
+    def __init__(self):
+        self.now = 0.0
+    
+    def __call__(self) -> float:
+        return self.now
+
+
+def _tracker(max_streams: int = 4):
+    clock = _Clock()
+    return VitalsTracker(half_life=30.0, max_streams=max_streams, idle_ttl=120.0, clock=clock), clock
+
+
+def _reading(**vitals) -> np.ndarray:
+    return np.array([vitals.get(name, np.nan) for name in VITALS])
+
+
+def test_reconnect_resumes_patient_state_within_idle_ttl():
+    tracker, clock = _tracker()
+    slot = tracker.open("p1")
+    tracker.update(slot, _reading(heart_rate=80.0), clock.now)
+    tracker.close(slot)
+    assert tracker.active == 0 and tracker.patients == 1
+    
+    clock.now = 60.0
+    assert tracker.open("p1") == slot
+    assert tracker.readings[slot] == 1
+
+
+def test_state_is_shared_and_kept_while_any_stream_holds_it():
+    tracker, clock = _tracker()
+    first = tracker.open("p1")
+    second = tracker.open("p1")
+    assert first == second and tracker.active == 2
+    
+    tracker.close(first)
+    clock.now = 1000.0
+    tracker.open("p2")
+    assert tracker.patients == 2  # p1 still has a stream: not expired
+
+
+def test_idle_state_expires_after_ttl():
+    tracker, clock = _tracker()
+    slot = tracker.open("p1")
+    tracker.update(slot, _reading(heart_rate=80.0), clock.now)
+    tracker.close(slot)
+    
+    clock.now = 121.0
+    slot = tracker.open("p1")
+    assert tracker.readings[slot] == 0
+    assert tracker.patients == 1
+
+
+def test_full_tracker_evicts_longest_idle_patient_before_refusing():
+    tracker, clock = _tracker(max_streams=2)
+    tracker.close(tracker.open("p1"))
+    clock.now = 1.0
+    tracker.close(tracker.open("p2"))
+    
+    tracker.open("p3")
+    assert tracker.patients == 2
+    assert "p1" not in tracker._slots
+    
+    tracker.open("p2")
+    with pytest.raises(StreamLimitError):
+        tracker.open("p4")
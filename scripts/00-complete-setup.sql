@@ -111,6 +111,7 @@ CREATE TABLE disease_knowledge (
 CREATE TABLE environmental_data (
   id UUID PRIMARY KEY DEFAULT uuid_generate_v4(),
   user_id UUID REFERENCES auth.users(id) ON DELETE CASCADE,
+  location TEXT,
   temperature_celsius DECIMAL,
   humidity_percent DECIMAL,
   aqi_index INTEGER,
@@ -157,6 +158,7 @@ CREATE INDEX idx_appointments_user_id ON appointments(user_id);
 CREATE INDEX idx_appointments_date ON appointments(appointment_date);
 CREATE INDEX idx_medical_records_user_id ON medical_records(user_id);
 CREATE INDEX idx_environmental_data_user_id ON environmental_data(user_id);
+CREATE INDEX idx_environmental_data_location ON environmental_data(location, recorded_at DESC);
 CREATE INDEX idx_medical_imaging_user_id ON medical_imaging(user_id);
 CREATE INDEX idx_health_predictions_user_id ON health_predictions(user_id);
 CREATE INDEX idx_disease_knowledge_name ON disease_knowledge(disease_name);
@@ -1,5 +1,6 @@
 -- Reordering tables to ensure parent tables are created first, adding ON DELETE CASCADE for data integrity
 
+DROP TABLE IF EXISTS environmental_data CASCADE;
 DROP TABLE IF EXISTS appointments CASCADE;
 DROP TABLE IF EXISTS reports CASCADE;
 DROP TABLE IF EXISTS predictions CASCADE;
@@ -111,6 +112,17 @@ CREATE TABLE appointments (
     created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
 );
 
+-- Create environmental readings per location (served to /diagnose by location key)
+CREATE TABLE environmental_data (
+    id UUID PRIMARY KEY DEFAULT gen_random_uuid(),
+    location VARCHAR(255) NOT NULL,
+    temperature_celsius FLOAT,
+    humidity_percent FLOAT,
+    aqi_index INT,
+    pm25 FLOAT,
+    recorded_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
 -- Create indexes for performance
 CREATE INDEX idx_user_email ON users(email);
 CREATE INDEX idx_patient_user ON patients(user_id);
@@ -120,3 +132,4 @@ CREATE INDEX idx_images_patient ON medical_images(patient_id);
 CREATE INDEX idx_predictions_patient ON predictions(patient_id);
 CREATE INDEX idx_reports_patient ON reports(patient_id);
 CREATE INDEX idx_appointments_patient ON appointments(patient_id);
+CREATE INDEX idx_environmental_location ON environmental_data(location, recorded_at DESC);
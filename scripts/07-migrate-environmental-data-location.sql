@@ -0,0 +1,8 @@
+-- For databases created from 00-complete-setup.sql before environmental_data had a location
+-- column (06-production-database.sql already creates it). Keys readings by location (station,
+-- clinic or kiosk site) so the API serves the latest reading per location.
+ALTER TABLE environmental_data
+ADD COLUMN IF NOT EXISTS location TEXT;
+
+-- Latest reading per location
+CREATE INDEX IF NOT EXISTS idx_environmental_data_location ON environmental_data(location, recorded_at DESC);
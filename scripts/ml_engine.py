@@ -4,9 +4,26 @@ Predicts health conditions based on symptoms, environmental factors, and medical
 """
 
 import json
+import sys
 import numpy as np
+from pathlib import Path
 from typing import Dict, List, Tuple
 
+# The threshold-rule engine is shared with the backend's models
+BACKEND_DIR = str(Path(__file__).resolve().parent.parent / "backend")
+if BACKEND_DIR not in sys.path:
+    sys.path.insert(0, BACKEND_DIR)
+from ml.rules import Rule, RuleSet
+
+ENVIRONMENTAL_FEATURES = ["aqi", "temperature"]
+# Keyed by the environmental factor names used in disease_db
+ENVIRONMENTAL_RULES = {
+    "high aqi": Rule("aqi", "present", weight=20, per=500),
+    "high temperature": Rule("temperature", ">", 28, weight=15),
+    "cold weather": Rule("temperature", "<", 10, weight=15),
+}
+ENVIRONMENTAL_CAP = 30
+
 class HealthPredictionNN:
     """Neural network for health prediction"""
     
@@ -51,6 +68,12 @@ class HealthPredictionNN:
                 "environmental_factors": ["stress", "noise"],
             },
         }
+        # Rules are evaluated once per patient; each disease sums the ones it is exposed to
+        self.environmental_rules = RuleSet(list(ENVIRONMENTAL_RULES.values()), ENVIRONMENTAL_FEATURES)
+        self.environmental_exposure = np.array([
+            [factor in data["environmental_factors"] for factor in ENVIRONMENTAL_RULES]
+            for data in self.disease_db.values()
+        ], dtype=np.float64)
     
     def sigmoid(self, x: float) -> float:
         """Sigmoid activation function"""
@@ -76,21 +99,15 @@ class HealthPredictionNN:
     
     def calculate_environmental_score(self, environmental_data: Dict, disease: str) -> float:
         """Calculate environmental factor contribution"""
-        env_factors = self.disease_db[disease]["environmental_factors"]
-        score = 0.0
-        
-        if "aqi" in environmental_data and "high aqi" in env_factors:
-            score += (environmental_data["aqi"] / 500) * 20
-        
-        if "temperature" in environmental_data and "high temperature" in env_factors:
-            if environmental_data["temperature"] > 28:
-                score += 15
-        
-        if "temperature" in environmental_data and "cold weather" in env_factors:
-            if environmental_data["temperature"] < 10:
-                score += 15
-        
-        return min(score, 30)
+        return self.environmental_scores(environmental_data)[disease]
+    
+    def environmental_scores(self, environmental_data: Dict) -> Dict[str, float]:
+        """calculate_environmental_score for every disease from one pass over the rules"""
+        # Missing readings are NaN, which no rule fires on
+        row = np.array([environmental_data.get(name, np.nan) for name in ENVIRONMENTAL_FEATURES], dtype=np.float64)
+        scores = np.minimum(self.environmental_exposure @ self.environmental_rules.contributions(row)[0],
+                            ENVIRONMENTAL_CAP)
+        return dict(zip(self.disease_db, scores.tolist()))
     
     def predict(self, patient_data: Dict) -> List[Dict]:
         """
@@ -105,12 +122,13 @@ class HealthPredictionNN:
         }
         """
         predictions = []
+        env_scores = self.environmental_scores(patient_data.get("environmental", {}))
         
         for disease, data in self.disease_db.items():
             # Calculate base scores
             symptom_score = self.calculate_symptom_match(patient_data.get("symptoms", []), disease)
             risk_score = self.calculate_risk_factor_weight(patient_data.get("risk_factors", []), disease)
-            env_score = self.calculate_environmental_score(patient_data.get("environmental", {}), disease)
+            env_score = env_scores[disease]
             
             # Neural network forward pass
             hidden_layer = self.sigmoid((symptom_score * 0.4 + risk_score * 0.3 + env_score * 0.3) / 100)
@@ -13,19 +13,112 @@ IMPORTANT: This is for research and educational purposes only.
 NOT FOR CLINICAL DIAGNOSIS.
 """
 
+import argparse
+import io
+import os
+import re
+import time
 import numpy as np
 import pandas as pd
 from pathlib import Path
 import json
-from typing import List, Dict, Tuple
+from typing import List, Dict, Optional, Sequence, Tuple
 import warnings
 
+import torch
+from PIL import Image
+from torch import nn
+from torch.utils.data import DataLoader, Dataset
+from torchvision import models, transforms
+
 warnings.filterwarnings("ignore")
 
-# Note: Actual PyTorch/TensorFlow imports would go here
-# from torchvision import models, transforms
-# import torch
-# from PIL import Image
+# Architecture constructor and embedding width for each supported backbone
+BACKBONES = {
+    "densenet121": (models.densenet121, 1024),
+    "resnet50": (models.resnet50, 2048),
+    "efficientnet_b0": (models.efficientnet_b0, 1280),
+}
+
+OUTPUT_DTYPES = {
+    "float32": torch.float32,
+    "float16": torch.float16,
+    "bfloat16": torch.bfloat16,
+}
+
+IMAGE_EXTENSIONS = ("*.jpg", "*.jpeg", "*.png")
+
+# Old DenseNet checkpoints name layers "norm.1" where the modules are now "norm1"
+_DENSENET_KEY = re.compile(
+    r"^(.*denselayer\d+\.(?:norm|relu|conv))\.((?:[12])\.(?:weight|bias|running_mean|running_var))$"
+)
+
+
+def default_weights_path(model_name: str) -> Path:
+    """Where torchvision caches the ImageNet checkpoint for `model_name`."""
+    url = models.get_model_weights(model_name).DEFAULT.url
+    return Path(torch.hub.get_dir()) / "checkpoints" / os.path.basename(url)
+
+
+def build_transform(image_size: int = 224) -> transforms.Compose:
+    """Same resize + ImageNet normalization as MedicalImagePreprocessor."""
+    return transforms.Compose([
+        transforms.Resize((image_size, image_size)),
+        transforms.ToTensor(),
+        transforms.Normalize(mean=[0.485, 0.456, 0.406], std=[0.229, 0.224, 0.225]),
+    ])
+
+
+class ImageFileDataset(Dataset):
+    """Decodes and preprocesses images inside DataLoader worker processes.
+
+    With a backend `TensorCache` (dl.tensor_cache), tensors are looked up by
+    content hash first, so scans the API already preprocessed are not
+    decoded again, and tensors computed here are shared with the API.
+    """
+
+    def __init__(self, paths: Sequence[str], transform, tensor_cache=None, image_size: int = 224):
+        self.paths = list(paths)
+        self.transform = transform
+        self.tensor_cache = tensor_cache
+        self.image_size = image_size
+
+    def __len__(self) -> int:
+        return len(self.paths)
+
+    def _load(self, path: str) -> torch.Tensor:
+        if self.tensor_cache is None:
+            return self.transform(Image.open(path).convert("RGB"))
+        import hashlib
+        with open(path, "rb") as f:
+            data = f.read()
+        key = self.tensor_cache.key(hashlib.sha256(data).hexdigest(), (self.image_size, self.image_size))
+        # Cached like MedicalImagePreprocessor.preprocess_from_bytes: (1, C, H, W)
+        return self.tensor_cache.get_or_compute(
+            key, lambda: self.transform(Image.open(io.BytesIO(data)).convert("RGB")).unsqueeze(0)
+        )[0]
+
+    def __getitem__(self, index: int):
+        try:
+            return self._load(self.paths[index]), index
+        except Exception as e:
+            print(f"Error processing {self.paths[index]}: {e}")
+            return None, index
+
+
+def _collate(items):
+    """Stack decoded images, dropping the ones that failed to load."""
+    items = [(tensor, index) for tensor, index in items if tensor is not None]
+    if not items:
+        return None, torch.empty(0, dtype=torch.long)
+    tensors, indices = zip(*items)
+    return torch.stack(tensors), torch.tensor(indices)
+
+
+def _init_loader_worker(_worker_id: int):
+    # Decoding is single-threaded; the parent's intra-op pool runs the backbone
+    torch.set_num_threads(1)
+
 
 class MedicalCNNFeatureExtractor:
     """
@@ -33,34 +126,134 @@ class MedicalCNNFeatureExtractor:
     Uses pretrained models as frozen feature extractors.
     """
 
-    def __init__(self, model_name: str = "densenet121", device: str = "cpu"):
+    def __init__(
+        self,
+        model_name: str = "densenet121",
+        device: str = "cpu",
+        weights_path: Optional[str] = None,
+        pretrained: bool = True,
+        batch_size: int = 32,
+        num_workers: int = 2,
+        output_dtype: str = "float32",
+        image_size: int = 224,
+        tensor_cache=None,
+    ):
         """
         Initialize the feature extractor.
 
         Args:
             model_name: Pretrained model (densenet121, resnet50, efficientnet_b0)
             device: 'cpu' or 'cuda'
+            weights_path: Local torchvision checkpoint; defaults to the torch hub cache.
+                Nothing is downloaded, so nodes can run offline.
+            pretrained: False keeps random weights (benchmarks, smoke tests)
+            batch_size: Images per forward pass
+            num_workers: DataLoader processes decoding and resizing images
+            output_dtype: float32, float16 or bfloat16 embeddings. bfloat16 also
+                runs the backbone under CPU autocast; float16 is computed in
+                float32 and cast, which is faster on CPUs without fp16 kernels.
+            image_size: Square input resolution
+            tensor_cache: Optional backend dl.tensor_cache.TensorCache shared with the API
         """
+        if model_name not in BACKBONES:
+            raise ValueError(f"Unknown model {model_name!r}; expected one of {sorted(BACKBONES)}")
+        if output_dtype not in OUTPUT_DTYPES:
+            raise ValueError(f"Unknown output dtype {output_dtype!r}; expected one of {sorted(OUTPUT_DTYPES)}")
         self.model_name = model_name
         self.device = device
+        self.weights_path = weights_path
+        self.pretrained = pretrained
+        self.batch_size = batch_size
+        self.num_workers = num_workers
+        self.output_dtype = output_dtype
+        self.embedding_dim = BACKBONES[model_name][1]
         self.model = None
         self.feature_extractor = None
-        self.transform = None
+        self.image_size = image_size
+        self.transform = build_transform(image_size)
+        self.tensor_cache = tensor_cache
+        self.last_run: Dict = {}
 
-        # In a real implementation:
-        # self._load_model()
+        # Loaded on first use so similarity-only callers don't pay for the backbone
 
     def _load_model(self):
         """Load pretrained model and remove classification head."""
-        # Example with DenseNet121:
-        # from torchvision.models import densenet121
-        # self.model = densenet121(pretrained=True)
-        # self.feature_extractor = torch.nn.Sequential(
-        #     *list(self.model.children())[:-1]
-        # )
-        # self.feature_extractor.eval()
-        # self.feature_extractor = self.feature_extractor.to(self.device)
-        pass
+        constructor, _ = BACKBONES[self.model_name]
+        model = constructor(weights=None)
+        if self.pretrained:
+            path = Path(self.weights_path) if self.weights_path else default_weights_path(self.model_name)
+            if not path.exists():
+                raise FileNotFoundError(
+                    f"No local weights for {self.model_name} at {path}; copy the torchvision "
+                    "checkpoint there or pass weights_path"
+                )
+            state_dict = torch.load(path, map_location="cpu", weights_only=True)
+            if self.model_name == "densenet121":
+                state_dict = {_DENSENET_KEY.sub(r"\1\2", key): value for key, value in state_dict.items()}
+            model.load_state_dict(state_dict)
+
+        # Every backbone pools and flattens before its head, so dropping the head leaves the embedding
+        if self.model_name == "resnet50":
+            model.fc = nn.Identity()
+        else:
+            model.classifier = nn.Identity()
+        for parameter in model.parameters():
+            parameter.requires_grad_(False)
+        self.model = model
+        self.feature_extractor = model.eval().to(self.device, memory_format=torch.channels_last)
+
+    def _embed(self, batch: torch.Tensor) -> torch.Tensor:
+        batch = batch.to(self.device, memory_format=torch.channels_last, non_blocking=True)
+        if self.output_dtype == "bfloat16":
+            with torch.autocast(device_type=batch.device.type, dtype=torch.bfloat16):
+                features = self.feature_extractor(batch)
+        else:
+            features = self.feature_extractor(batch)
+        return features.to("cpu", OUTPUT_DTYPES[self.output_dtype])
+
+    def extract_batch(self, image_paths: Sequence[str]) -> Tuple[torch.Tensor, List[int]]:
+        """
+        Embed many images, batching the forward pass and decoding in worker processes.
+
+        Args:
+            image_paths: Paths to medical images
+
+        Returns:
+            (N_ok, embedding_dim) tensor in `output_dtype`, and the indices into
+            `image_paths` of the rows (images that failed to load are skipped)
+        """
+        if self.feature_extractor is None:
+            self._load_model()
+        loader = DataLoader(
+            ImageFileDataset(image_paths, self.transform, self.tensor_cache, self.image_size),
+            batch_size=self.batch_size,
+            num_workers=self.num_workers,
+            collate_fn=_collate,
+            worker_init_fn=_init_loader_worker if self.num_workers else None,
+            pin_memory=self.device.startswith("cuda"),
+        )
+        embeddings, indices = [], []
+        start = time.perf_counter()
+        with torch.inference_mode():
+            for batch, batch_indices in loader:
+                if batch is None:
+                    continue
+                embeddings.append(self._embed(batch))
+                indices.extend(batch_indices.tolist())
+        seconds = time.perf_counter() - start
+        self.last_run = {
+            "images": len(indices),
+            "failed": len(image_paths) - len(indices),
+            "seconds": seconds,
+            "images_per_sec": len(indices) / seconds if seconds else None,
+            "batch_size": self.batch_size,
+            "num_workers": self.num_workers,
+            "torch_threads": torch.get_num_threads(),
+            "output_dtype": self.output_dtype,
+        }
+        if not embeddings:
+            return torch.empty(0, self.embedding_dim, dtype=OUTPUT_DTYPES[self.output_dtype]), indices
+        return torch.cat(embeddings), indices
 
     def extract_features(self, image_path: str) -> np.ndarray:
         """
@@ -70,20 +263,13 @@ class MedicalCNNFeatureExtractor:
             image_path: Path to medical image
 
         Returns:
-            Feature embedding vector (1, 1024)
+            Feature embedding vector (1, embedding_dim), float32
         """
-        # Simulated feature extraction
-        # In real implementation:
-        # 1. Load image using PIL
-        # 2. Apply preprocessing: normalization, resizing to (224, 224)
-        # 3. Convert to tensor
-        # 4. Run through frozen feature extractor
-        # 5. Return embedding
-
-        # For demonstration, return simulated feature vector
-        np.random.seed(hash(image_path) % 2**32)
-        features = np.random.randn(1, 1024).astype(np.float32)
-        return features
+        if self.feature_extractor is None:
+            self._load_model()
+        dataset = ImageFileDataset([image_path], self.transform, self.tensor_cache, self.image_size)
+        with torch.inference_mode():
+            return self._embed(dataset._load(image_path).unsqueeze(0)).float().numpy()
 
     def compute_similarity(self, features1: np.ndarray, features2: np.ndarray) -> float:
         """
@@ -107,6 +293,9 @@ class MedicalCNNFeatureExtractor:
         """
         Process all images in directory and save embeddings.
 
+        Embeddings are also saved compactly in `output_dtype` next to the
+        CSV (same stem, `.pt`), row-aligned with it.
+
         Args:
             image_dir: Directory containing images
             output_csv: Output CSV file path
@@ -114,27 +303,20 @@ class MedicalCNNFeatureExtractor:
         Returns:
             DataFrame with image_path and embedding vector
         """
-        results = []
-
-        image_files = list(image_dir.glob("*.jpg")) + list(image_dir.glob("*.png"))
-
-        for image_path in image_files:
-            try:
-                features = self.extract_features(str(image_path))
-
-                results.append({
-                    "image_path": str(image_path),
-                    "image_name": image_path.name,
-                    "embedding": features.tolist(),
-                    "embedding_dim": 1024,
-                    "model": self.model_name,
-                })
-            except Exception as e:
-                print(f"Error processing {image_path}: {e}")
-
-        df = pd.DataFrame(results)
+        image_files = sorted(path for pattern in IMAGE_EXTENSIONS for path in image_dir.glob(pattern))
+        embeddings, indices = self.extract_batch([str(path) for path in image_files])
+
+        df = pd.DataFrame({
+            "image_path": [str(image_files[i]) for i in indices],
+            "image_name": [image_files[i].name for i in indices],
+            "embedding": [json.dumps([row]) for row in embeddings.float().tolist()],
+            "embedding_dim": self.embedding_dim,
+            "model": self.model_name,
+        })
         df.to_csv(output_csv, index=False)
-        print(f"Processed {len(df)} images. Saved to {output_csv}")
+        torch.save(embeddings, Path(output_csv).with_suffix(".pt"))
+        print(f"Processed {len(df)} images in {self.last_run['seconds']:.1f}s "
+              f"({self.last_run['images_per_sec'] or 0:.1f} images/sec). Saved to {output_csv}")
 
         return df
 
@@ -172,26 +354,61 @@ class MedicalCNNFeatureExtractor:
 def main():
     """Main execution demonstrating feature extraction pipeline."""
 
-    # Configuration
-    IMAGE_DIR = Path("./reference_xrays")  # Directory with X-ray images
-    OUTPUT_CSV = Path("./xray_embeddings.csv")
-    OUTPUT_MATRIX = Path("./similarity_matrix.npz")
+    parser = argparse.ArgumentParser(description="Embed a directory of X-ray images with a frozen CNN")
+    parser.add_argument("--image-dir", type=Path, default=Path("./reference_xrays"))
+    parser.add_argument("--output-csv", type=Path, default=Path("./xray_embeddings.csv"))
+    parser.add_argument("--output-matrix", type=Path, default=Path("./similarity_matrix.npz"))
+    parser.add_argument("--model", default="densenet121", choices=sorted(BACKBONES))
+    parser.add_argument("--weights", help="local torchvision checkpoint (default: torch hub cache)")
+    parser.add_argument("--device", default="cpu")
+    parser.add_argument("--batch-size", type=int, default=32)
+    parser.add_argument("--workers", type=int, default=2, help="DataLoader decode processes")
+    parser.add_argument("--threads", type=int, help="torch intra-op threads (default: torch's choice)")
+    parser.add_argument("--output-dtype", default="float32", choices=sorted(OUTPUT_DTYPES))
+    parser.add_argument("--tensor-cache-dir",
+                        help="share preprocessed tensors with the API's TENSOR_CACHE_DIR (needs backend/ deps)")
+    parser.add_argument("--skip-similarity", action="store_true")
+    args = parser.parse_args()
+
+    if args.threads:
+        torch.set_num_threads(args.threads)
+
+    tensor_cache = None
+    if args.tensor_cache_dir:
+        import sys
+        os.environ.setdefault("TENSOR_CACHE_DIR", args.tensor_cache_dir)
+        sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "backend"))
+        from dl.tensor_cache import TensorCache
+        from config import settings
+        # Workers each get a copy, so keep only the shared disk tier
+        tensor_cache = TensorCache(0, args.tensor_cache_dir, settings.TENSOR_CACHE_DISK_BYTES)
 
     # Initialize extractor
-    extractor = MedicalCNNFeatureExtractor(model_name="densenet121")
+    extractor = MedicalCNNFeatureExtractor(
+        model_name=args.model,
+        device=args.device,
+        weights_path=args.weights,
+        batch_size=args.batch_size,
+        num_workers=args.workers,
+        output_dtype=args.output_dtype,
+        tensor_cache=tensor_cache,
+    )
 
     print("=== Medical Imaging CNN Feature Extraction ===")
     print(f"Model: {extractor.model_name}")
     print(f"Device: {extractor.device}")
 
     # Process images (example - would need real images)
-    if IMAGE_DIR.exists():
-        print(f"\nProcessing images from {IMAGE_DIR}...")
-        embeddings_df = extractor.process_dataset(IMAGE_DIR, OUTPUT_CSV)
+    if args.image_dir.exists():
+        print(f"\nProcessing images from {args.image_dir}...")
+        embeddings_df = extractor.process_dataset(args.image_dir, args.output_csv)
+        print(json.dumps(extractor.last_run, indent=2))
+        if args.skip_similarity:
+            return
 
         # Generate similarity matrix
         print("\nGenerating similarity matrix...")
-        sim_matrix = extractor.generate_similarity_matrix(OUTPUT_CSV, OUTPUT_MATRIX)
+        sim_matrix = extractor.generate_similarity_matrix(args.output_csv, args.output_matrix)
         print(f"Similarity matrix shape: {sim_matrix.shape}")
 
         # Example: Find most similar images
@@ -202,11 +419,11 @@ def main():
                     print(f"{embeddings_df.iloc[i]['image_name']} <-> "
                           f"{embeddings_df.iloc[j]['image_name']}: {sim_matrix[i, j]:.3f}")
     else:
-        print(f"Image directory {IMAGE_DIR} not found. Create it with sample X-ray images.")
+        print(f"Image directory {args.image_dir} not found. Create it with sample X-ray images.")
         print("\nThis script demonstrates the feature extraction pipeline.")
         print("In production, it would:")
         print("1. Load all X-ray images from reference_xrays/")
-        print("2. Extract 1024-dimensional feature vectors using DenseNet121")
+        print("2. Extract feature vectors (1024-dimensional for DenseNet121)")
         print("3. Compute pairwise cosine similarity")
         print("4. Save results to xray_embeddings.csv and similarity_matrix.npz")
 